@@ -0,0 +1,213 @@
+import math
+import time
+import heapq
+import itertools
+import threading
+import contextvars
+import config as cfg
+from contextlib import contextmanager
+from tracing import metrics
+
+# Admission control for the /search pipeline.
+#
+# Each expensive stage (the LLM call, the DB lookups, the sentence transformer) has a
+# StageLimiter: at most `limit` calls run at once and at most `queue_size` wait for a slot.
+# Waiters are served by priority class (interactive before batch) and then in arrival
+# order. A call is rejected with Overloaded instead of queueing when the queue is full
+# (batch calls may only use part of it) or when the request's deadline passes while it
+# waits, and the app answers 503 with a Retry-After estimate. Requests that are admitted
+# keep a bounded queueing delay, so the service sheds load instead of slowing everyone down.
+#
+# The priority class and deadline of the current request are kept in a context variable,
+# which run_in_threadpool and the single-flight tasks carry over to the pipeline threads.
+# A call holding one stage's slot gives it up with `released` while it waits on another
+# stage (e.g. the DB slot while the query is encoded), so slots are only held while working.
+
+PRIORITIES = {"interactive": 0, "batch": 1}
+
+
+class Overloaded(Exception):
+    """
+    Raised when a stage cannot admit a call.
+
+    Attributes:
+        stage (str): The stage that rejected the call.
+        retry_after (int): Suggested seconds before retrying.
+    """
+
+    def __init__(self, stage, reason, retry_after):
+        super().__init__(f"{stage} overloaded: {reason}")
+        self.stage = stage
+        self.retry_after = retry_after
+
+
+class RequestContext:
+    def __init__(self, priority, deadline):
+        self.priority = priority
+        self.deadline = deadline
+
+
+request_context = contextvars.ContextVar("admission_request", default=None)
+# Stage name -> Slot held by the current call.
+held_slots = contextvars.ContextVar("admission_held_slots", default={})
+
+
+def parse_priority(value):
+    value = (value or cfg.ADMISSION_DEFAULT_PRIORITY).strip().lower()
+    return value if value in PRIORITIES else cfg.ADMISSION_DEFAULT_PRIORITY
+
+
+def admit_request(priority):
+    """
+    Set the priority class and the queueing deadline of the current request.
+    """
+    context = RequestContext(priority, time.monotonic() + cfg.ADMISSION_QUEUE_TIMEOUT[priority])
+    request_context.set(context)
+    return context
+
+
+class StageLimiter:
+    """
+    Bounded concurrency with a bounded priority wait queue for one pipeline stage.
+
+    Attributes:
+        name (str): Stage name, used in the admission_* metrics.
+        limit (int): Maximum concurrent calls.
+        queue_size (int): Maximum waiting calls.
+        active (int): Calls holding a slot.
+        waiters (list): Heap of (priority, sequence) of the waiting calls.
+    """
+
+    def __init__(self, name, limit, queue_size, batch_queue_fraction=cfg.ADMISSION_BATCH_QUEUE_FRACTION):
+        self.name = name
+        self.limit = limit
+        self.queue_size = queue_size
+        self.batch_queue_size = int(queue_size * batch_queue_fraction)
+        self.active = 0
+        self.waiters = []
+        self.sequence = itertools.count()
+        self.condition = threading.Condition()
+        # Moving average of the time a slot is held, for the Retry-After estimate.
+        self.hold_time = 0.1
+
+    def retry_after(self):
+        waiting = len(self.waiters) + 1
+        return max(1, math.ceil(waiting / self.limit * self.hold_time))
+
+    def reject(self, reason):
+        metrics.inc("admission_rejected_total", help_text="Calls rejected by admission control",
+                    stage=self.name, reason=reason)
+        return Overloaded(self.name, reason, self.retry_after())
+
+    def acquire(self, priority, deadline):
+        rank = PRIORITIES[priority]
+        with self.condition:
+            if self.active < self.limit and not self.waiters:
+                self.active += 1
+                return
+            queue_size = self.queue_size if rank == PRIORITIES["interactive"] else self.batch_queue_size
+            if len(self.waiters) >= queue_size:
+                raise self.reject("queue_full")
+            entry = (rank, next(self.sequence))
+            heapq.heappush(self.waiters, entry)
+            metrics.inc("admission_queued_total", help_text="Calls that waited for a stage slot", stage=self.name)
+            while not (self.active < self.limit and self.waiters[0] == entry):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.waiters.remove(entry)
+                    heapq.heapify(self.waiters)
+                    # The next waiter may be able to run now.
+                    self.condition.notify_all()
+                    raise self.reject("deadline")
+                self.condition.wait(remaining)
+            heapq.heappop(self.waiters)
+            self.active += 1
+            # Several slots may have been freed at once.
+            self.condition.notify_all()
+
+    def release(self, held):
+        with self.condition:
+            self.active -= 1
+            self.hold_time = 0.9 * self.hold_time + 0.1 * held
+            self.condition.notify_all()
+
+    @contextmanager
+    def slot(self):
+        context = request_context.get()
+        if context is None:
+            # Work outside a request (e.g. the cache warm-up) is batch priority.
+            context = RequestContext("batch", time.monotonic() + cfg.ADMISSION_QUEUE_TIMEOUT["batch"])
+        slot = Slot(self, context.priority)
+        slot.acquire(context.deadline)
+        try:
+            yield slot
+        finally:
+            slot.release()
+
+
+class Slot:
+    """
+    A slot of a StageLimiter held by one call; it can be released and acquired again.
+    """
+
+    def __init__(self, limiter, priority):
+        self.limiter = limiter
+        self.priority = priority
+        self.held = False
+        self.acquired_at = 0.0
+
+    def acquire(self, deadline):
+        started = time.monotonic()
+        self.limiter.acquire(self.priority, deadline)
+        self.acquired_at = time.monotonic()
+        self.held = True
+        metrics.observe("admission_wait_seconds", self.acquired_at - started,
+                        help_text="Time spent waiting for a stage slot", stage=self.limiter.name)
+
+    def release(self):
+        if self.held:
+            self.held = False
+            self.limiter.release(time.monotonic() - self.acquired_at)
+
+
+limiters = {name: StageLimiter(name, limit, cfg.ADMISSION_QUEUE_SIZE[name])
+            for name, limit in cfg.ADMISSION_LIMITS.items()}
+
+
+@contextmanager
+def admit(stage_name):
+    """
+    Hold a slot of the `stage_name` limiter for the duration of the block.
+
+    Raises:
+        Overloaded: If the stage's queue is full or the request's deadline passed while waiting.
+    """
+    if not cfg.ADMISSION_ENABLED:
+        yield
+        return
+    with limiters[stage_name].slot() as slot:
+        token = held_slots.set({**held_slots.get(), stage_name: slot})
+        try:
+            yield
+        finally:
+            held_slots.reset(token)
+
+
+@contextmanager
+def released(stage_name):
+    """
+    Give up the `stage_name` slot held by the current call for the duration of the block.
+
+    The slot is taken again afterwards, with a fresh queueing deadline: the call was
+    already admitted, and shedding it now would throw away the work done so far.
+
+    Raises:
+        Overloaded: If the slot cannot be taken again.
+    """
+    slot = held_slots.get().get(stage_name)
+    if slot is None or not slot.held:
+        yield
+        return
+    slot.release()
+    yield
+    slot.acquire(time.monotonic() + cfg.ADMISSION_QUEUE_TIMEOUT[slot.priority])
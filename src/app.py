@@ -1,12 +1,207 @@
-import uvicorn
+import functools
 import config as cfg
+from admission import Overloaded, admit, admit_request, parse_priority
 from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, Response
+from starlette.concurrency import run_in_threadpool
+from cache_warmer import CacheWarmer
+from compression import CompressionMiddleware
 from dbquery_handler import DBQueryHandler
-from utils import store_queries, respond_query
+from entity_linking import EntityLinker
+from entity_prefetch import extract_with_prefetch
+from utils import history_writer, store_queries, respond_query
+from rule_based_ner import DEGRADED_KEY
 from faiss_search_recommender import SearchRecommender
+from profiling import (RecordingDatabase, SlowQueryLog, describe, explain_operations, is_admin,
+                       profile_call)
+from http_caching import CollectionVersions, ETagStore, content_etag, etag_matches
+from result_pages import ResultCache, page_of, parse_page
+from rollups import CompensationRollups
+from serializers import SearchResponse, negotiate
 from job_search_ner import NamedEntityExtractor
+from normalize_numeric import missing_numeric_setup
+from semantic_cache import SemanticEntityCache
+from single_flight import SingleFlight, SingleFlightTimeout
+from tracing import current_trace, record, render_metrics, stage, start_trace
 
 app = FastAPI()
+if cfg.COMPRESSION_ENABLED:
+    app.add_middleware(CompressionMiddleware, minimum_size=cfg.COMPRESSION_MIN_SIZE)
+
+# Pipeline components shared across requests: the NER object (so the LLM circuit breaker
+# and entity cache see all traffic), the search recommender (loaded once, with a shared
+# encode+search batching queue), the compensation rollups, the entity linker and the
+# factory for per-request DB handlers.
+# They are built on startup unless already set with configure_services (e.g. fakes in loadtest.py).
+services = {}
+
+query_flight = SingleFlight("query", timeout=cfg.SINGLE_FLIGHT_TIMEOUT)
+entity_flight = SingleFlight("entities", timeout=cfg.SINGLE_FLIGHT_TIMEOUT)
+etag_store = ETagStore()
+result_cache = ResultCache()
+slow_query_log = SlowQueryLog()
+
+
+def configure_services(ner_obj=None, search_recommender=None, query_handler_factory=None, rollups=None,
+                       entity_linker=None, collection_versions=None, cache_warmer=None):
+    if ner_obj is not None:
+        services["ner_obj"] = ner_obj
+    if search_recommender is not None:
+        services["search_recommender"] = search_recommender
+    if query_handler_factory is not None:
+        services["query_handler_factory"] = query_handler_factory
+    if rollups is not None:
+        services["rollups"] = rollups
+    if entity_linker is not None:
+        services["entity_linker"] = entity_linker
+    if collection_versions is not None:
+        services["collection_versions"] = collection_versions
+    if cache_warmer is not None:
+        services["cache_warmer"] = cache_warmer
+
+
+@app.on_event("startup")
+def load_services():
+    if "query_handler_factory" not in services and cfg.NUMERIC_FIELDS_CHECK:
+        missing = missing_numeric_setup(DBQueryHandler().db)
+        if missing:
+            raise RuntimeError("Numeric shadow fields or range indexes are missing, run normalize_numeric.py "
+                               f"first (or set NUMERIC_FIELDS_CHECK=0): {', '.join(missing)}")
+    if "search_recommender" not in services:
+        services["search_recommender"] = SearchRecommender(model_name=cfg.MODEL_NAME,
+                                                           faiss_index_path=cfg.FAISS_SEARCH_INDEX_PATH)
+    if "ner_obj" not in services:
+        # The semantic NER cache reuses the recommender's sentence transformer.
+        semantic_cache = None
+        if cfg.NER_SEMANTIC_CACHE_ENABLED:
+            semantic_cache = SemanticEntityCache(services["search_recommender"].model)
+        services["ner_obj"] = NamedEntityExtractor(semantic_cache=semantic_cache)
+    if "rollups" not in services and cfg.ROLLUPS_ENABLED:
+        services["rollups"] = CompensationRollups()
+        services["rollups"].start(lambda: DBQueryHandler().db)
+    if "entity_linker" not in services and cfg.ENTITY_LINKING_ENABLED:
+        # The catalogs are embedded with the recommender's sentence transformer.
+        services["entity_linker"] = EntityLinker(services["search_recommender"].model)
+        services["entity_linker"].start(lambda: DBQueryHandler().db)
+    if "collection_versions" not in services and cfg.ETAGS_ENABLED:
+        services["collection_versions"] = CollectionVersions()
+        services["collection_versions"].start(lambda: DBQueryHandler().db)
+    services.setdefault("query_handler_factory",
+                        functools.partial(DBQueryHandler, rollups=services.get("rollups"),
+                                          entity_linker=services.get("entity_linker")))
+    if "cache_warmer" not in services:
+        services["cache_warmer"] = CacheWarmer(services["ner_obj"], services["search_recommender"],
+                                               services["query_handler_factory"])
+        if cfg.WARMUP_ENABLED:
+            services["cache_warmer"].start()
+        else:
+            services["cache_warmer"].disable()
+
+
+@app.on_event("shutdown")
+def flush_history():
+    history_writer.close()
+
+
+def route_label(request):
+    """
+    The stage name of a request: its route template (e.g. "request.rollups.table_name"), so
+    the metric has one label per route rather than one per path, or "request.unmatched".
+    """
+    route = request.scope.get("route")
+    if route is None:
+        return "request.unmatched"
+    # Server-Timing names are tokens, without the braces of path parameters.
+    return "request" + route.path.replace("/", ".").replace("{", "").replace("}", "")
+
+
+@app.middleware("http")
+async def trace_request(request: Request, call_next):
+    trace = start_trace()
+    response = await call_next(request)
+    record(route_label(request), trace.elapsed())
+    if cfg.TIMING_HEADER or request.headers.get("x-timing") == "1":
+        response.headers["Server-Timing"] = trace.server_timing()
+    return response
+
+
+@app.exception_handler(Overloaded)
+async def shed_load(request: Request, error: Overloaded):
+    return JSONResponse({"error": str(error)}, status_code=503, headers={"Retry-After": str(error.retry_after)})
+
+
+@app.get("/ready")
+async def ready():
+    # Readiness for load balancers: 503 until the startup cache warm-up has finished.
+    cache_warmer = services.get("cache_warmer")
+    if cache_warmer is None:
+        return JSONResponse({"status": "starting"}, status_code=503)
+    return JSONResponse(cache_warmer.progress(), status_code=200 if cache_warmer.ready else 503)
+
+
+@app.get("/metrics")
+async def metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/rollups/{table_name}")
+async def rollup_summary(table_name: str, request: Request):
+    # Precomputed statistics, filtered by entity query parameters, e.g.
+    # /rollups/jobentries?LOCATION=London&CURRENCY=GBP
+    rollups = services.get("rollups")
+    if rollups is None or not rollups.ready:
+        return JSONResponse({"error": "Rollups are not available"}, status_code=503)
+    if table_name not in rollups.tables:
+        return JSONResponse({"error": f"No rollup for {table_name}"}, status_code=404)
+    filters = dict(request.query_params)
+    try:
+        summary = rollups.summary(table_name, filters)
+    except ValueError as error:
+        return JSONResponse({"error": str(error), "filters": filters}, status_code=422)
+    if summary is None:
+        return JSONResponse({"error": "No matching rows", "filters": filters}, status_code=404)
+    return JSONResponse({"table": table_name, "filters": filters, **summary})
+
+
+def entity_key(ner_response):
+    """
+    The canonical entity set of a NER response: entity keys with normalized values, without the query.
+    """
+    return tuple(sorted((key, NamedEntityExtractor.normalize_query(str(value)))
+                        for key, value in ner_response.items() if key != "query"))
+
+
+def respond_admitted(ner_response, query_handler):
+    # The DB stage slot is held for the lookups of the whole respond_query call.
+    try:
+        with admit("db"):
+            return respond_query(ner_response, services["search_recommender"], query_handler)
+    except Overloaded:
+        query_handler.close_connection()
+        raise
+
+
+async def respond(ner_response, query_handler):
+    with stage("respond_query"):
+        return await run_in_threadpool(respond_admitted, ner_response, query_handler)
+
+
+async def run_pipeline(query):
+    # The pipeline is blocking, so it runs in the threadpool to let requests overlap.
+    query_handler = services["query_handler_factory"]()
+    with stage("ner"):
+        if cfg.NER_STREAMING:
+            ner_response = await run_in_threadpool(extract_with_prefetch, services["ner_obj"], query, query_handler)
+        else:
+            ner_response = await run_in_threadpool(services["ner_obj"].extract_named_entities, query)
+    if cfg.SINGLE_FLIGHT_ENABLED and cfg.SINGLE_FLIGHT_BY_ENTITIES and len(ner_response) > 1:
+        result, shared = await entity_flight.do(entity_key(ner_response), respond, ner_response, query_handler)
+        if shared:
+            query_handler.close_connection()
+    else:
+        result = await respond(ner_response, query_handler)
+    return ner_response, result
+
 
 # Expose the prediction functionality, make a prediction from the
 # passed JSON data and return the similar job postings with confidence.
@@ -14,16 +209,112 @@ app = FastAPI()
 async def search(request: Request):
     form_data = await request.form()
     query = form_data.get("query")
-    ner_obj = NamedEntityExtractor()
-    search_recommender = SearchRecommender(model_name=cfg.MODEL_NAME, faiss_index_path=cfg.FAISS_INDEX_PATH)
-    ner_response = ner_obj.extract_named_entities(query)
-    store_queries(query, ner_response)
-    query_handler = DBQueryHandler()
-    result = respond_query(ner_response, search_recommender, query_handler)
-    return result
+    try:
+        offset, limit = parse_page(form_data)
+    except ValueError as error:
+        return JSONResponse({"error": f"Invalid page: {error}"}, status_code=422)
+    media_type = negotiate(request.headers.get("accept"))
+    normalized_query = NamedEntityExtractor.normalize_query(query or "")
+    etag_key = (normalized_query, media_type, offset, limit)
+    if_none_match = request.headers.get("if-none-match")
+    versions = services.get("collection_versions")
+    version = versions.version if versions is not None else None
+    if version is not None:
+        etag = etag_store.precheck(etag_key, version, if_none_match)
+        if etag is not None:
+            return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+    # Pages after the first are sliced from the result of the first request.
+    result = result_cache.get(normalized_query, version) if limit is not None or offset else None
+    degraded = False
+    if result is None:
+        # "X-Priority: batch" for scripted or bulk clients; they yield to interactive requests.
+        admit_request(parse_priority(request.headers.get("x-priority")))
+        if cfg.SINGLE_FLIGHT_ENABLED:
+            # Concurrent requests for the same normalized query share one pipeline run.
+            try:
+                (ner_response, result), _ = await query_flight.do(normalized_query, run_pipeline, query)
+            except SingleFlightTimeout as error:
+                return JSONResponse({"error": str(error)}, status_code=504)
+        else:
+            ner_response, result = await run_pipeline(query)
+        # Rule based fallback entities (LLM unavailable) are never stored or cached, so the
+        # query is answered properly again once the LLM is back.
+        degraded = DEGRADED_KEY in ner_response
+        if not degraded:
+            store_queries(query, ner_response, services["ner_obj"].source_of(query))
+            result_cache.put(normalized_query, version, result)
+        slow_query_log.maybe_log(query, ner_response, current_trace())
+    page, total = page_of(result, offset, limit)
+    response = SearchResponse(page, media_type=media_type)
+    if total is not None:
+        response.headers["X-Total-Count"] = str(total)
+    if degraded:
+        response.headers["X-Degraded"] = "ner-fallback"
+        response.headers["Cache-Control"] = "no-store"
+    elif version is not None:
+        etag = content_etag(response.body, version)
+        etag_store.put(etag_key, version, etag)
+        if etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+        response.headers["ETag"] = etag
+        response.headers["Cache-Control"] = "no-cache"
+    return response
+
+
+def admin_only(request):
+    if not is_admin(request.headers):
+        return JSONResponse({"error": "Admin token required"}, status_code=403)
+    return None
+
+
+def profile_query(ner_response, query_handler):
+    # Records the operations respond_query issues, then explains them on a fresh connection
+    # (respond_query may close the handler's own).
+    recording = RecordingDatabase(query_handler.db)
+    query_handler.db = recording
+    result, top, report = profile_call(cfg.PROFILE_TOP_N, respond_query, ner_response,
+                                       services["search_recommender"], query_handler)
+    explain_handler = services["query_handler_factory"]()
+    try:
+        operations = explain_operations(explain_handler.db, recording.operations)
+    finally:
+        explain_handler.close_connection()
+    return result, top, report, operations
+
+
+@app.post("/admin/profile")
+async def profile(request: Request):
+    # Runs a query uncached and unshared, with respond_query under cProfile, e.g.
+    # curl -H "X-Admin-Token: $ADMIN_TOKEN" -d query="..." localhost:8000/admin/profile
+    denied = admin_only(request)
+    if denied is not None:
+        return denied
+    query = (await request.form()).get("query")
+    if not query:
+        return JSONResponse({"error": "No query"}, status_code=422)
+    trace = current_trace()
+    query_handler = services["query_handler_factory"]()
+    with stage("ner"):
+        ner_response = await run_in_threadpool(services["ner_obj"].extract_named_entities, query)
+    with stage("respond_query"):
+        result, top, report, operations = await run_in_threadpool(profile_query, ner_response, query_handler)
+    rows = len(result) if hasattr(result, "columns") else None
+    return JSONResponse({"query": query, "entities": describe(ner_response), "rows": rows,
+                         "seconds": trace.elapsed(), "stages": trace.totals(),
+                         "plans": describe(trace.notes.get("query_plan", [])),
+                         "operations": operations, "profile": top, "report": report})
+
+
+@app.get("/admin/slow-queries")
+async def slow_queries(request: Request):
+    denied = admin_only(request)
+    if denied is not None:
+        return denied
+    return JSONResponse({"threshold": slow_query_log.threshold, "queries": list(slow_query_log.recent)})
 
 
 if __name__ == "__main__":
+    import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
 
 
@@ -0,0 +1,164 @@
+import json
+import time
+import argparse
+import tracemalloc
+import config as cfg
+from utils import respond_query
+from dbquery_handler import DBQueryHandler
+from faiss_search_recommender import SearchRecommender
+from query_history import QueryHistoryStore
+from rule_based_ner import RuleBasedEntityExtractor
+from serializers import serialize
+from synthetic_data import (SAMPLE_QUERIES, HashingEncoder, SyntheticDataGenerator, TimedDatabase,
+                            build_synthetic_index)
+from tracing import stage, start_trace
+
+# Offline benchmark of the full search pipeline.
+#
+# Replays the query history through the NER stub and respond_query against synthetic data
+# (mongomock by default, or a local mongod with --mongo-url) and a synthetic FAISS index,
+# and reports p50/p95/p99 latency, throughput and peak memory per stage for each data size.
+#
+# python benchmark.py --sizes 10000,100000 --repeat 3 --output bench.json
+# python benchmark.py --mongo-url mongodb://127.0.0.1:27017 --sizes 10000,1000000,10000000
+
+def load_query_corpus(history_dir=cfg.HISTORY_DIR):
+    """
+    Load the queries recorded by `store_queries` (JSONL segments and the legacy
+    query.txt), falling back to the built-in sample queries when no history exists.
+    """
+    return QueryHistoryStore(history_dir).queries() or list(SAMPLE_QUERIES)
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(q / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+class DelayedEntityExtractor(RuleBasedEntityExtractor):
+    """
+    The rule based extractor with an artificial delay standing in for the LLM round trip.
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+
+    def extract_named_entities(self, query):
+        if self.latency:
+            time.sleep(self.latency)
+        return super().extract_named_entities(query)
+
+    def source_of(self, query):
+        return None
+
+
+def open_database(size, seed, mongo_url=None, db_name="benchmark"):
+    """
+    Seed a fresh database with `size` synthetic documents.
+
+    Returns:
+        tuple: (client, db, vectordb_size). With mongomock, `db` is wrapped so that
+        count_documents/find are timed like the pymongo command listener does.
+    """
+    if mongo_url:
+        import pymongo
+        from mongo_monitoring import mongo_command_timer
+        client = pymongo.MongoClient(mongo_url, event_listeners=[mongo_command_timer])
+        db = client[db_name]
+    else:
+        import mongomock
+        client = mongomock.MongoClient()
+        db = client[db_name]
+    vectordb_size = SyntheticDataGenerator(seed).seed_database(db, size)
+    if not mongo_url:
+        db = TimedDatabase(db)
+    return client, db, vectordb_size
+
+
+def summarize(traces, wall_time):
+    stages = {}
+    memory = {}
+    for trace in traces:
+        for name, seconds in trace.totals().items():
+            stages.setdefault(name, []).append(seconds)
+        for name, peak in trace.memory_peaks.items():
+            memory[name] = max(memory.get(name, 0), peak)
+    report = {"queries": len(traces), "wall_time_s": wall_time,
+              "throughput_qps": len(traces) / wall_time if wall_time else 0.0, "stages": {}}
+    for name, values in sorted(stages.items()):
+        report["stages"][name] = {
+            "calls": len(values),
+            "p50_ms": percentile(values, 50) * 1000,
+            "p95_ms": percentile(values, 95) * 1000,
+            "p99_ms": percentile(values, 99) * 1000,
+            "peak_memory_mb": memory.get(name, 0) / 2 ** 20,
+        }
+    return report
+
+
+def run_benchmark(queries, size, repeat=1, seed=0, mongo_url=None, ner_latency=0.0, track_memory=True):
+    client, db, vectordb_size = open_database(size, seed, mongo_url)
+    recommender = SearchRecommender(model_name=cfg.MODEL_NAME, faiss_index_path=None, batch_window=0,
+                                    model=HashingEncoder(), index=build_synthetic_index(vectordb_size, seed=seed))
+    ner = DelayedEntityExtractor(ner_latency)
+    if track_memory:
+        tracemalloc.start()
+    traces = []
+    errors = 0
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for query in queries:
+            trace = start_trace(track_memory)
+            try:
+                with stage("total"):
+                    with stage("ner"):
+                        ner_response = ner.extract_named_entities(query)
+                    with stage("respond_query"):
+                        result = respond_query(ner_response, recommender, DBQueryHandler(client=client, db=db))
+                    serialize(result)
+            except Exception as e:
+                errors += 1
+                print(f"Query failed: {query!r}: {e!r}")
+            traces.append(trace)
+    wall_time = time.perf_counter() - started
+    if track_memory:
+        tracemalloc.stop()
+    report = summarize(traces, wall_time)
+    report.update({"documents": size, "vectordb_size": vectordb_size, "errors": errors})
+    return report
+
+
+def print_report(report):
+    print(f"\n== {report['documents']:,} documents | {report['queries']} queries | "
+          f"{report['throughput_qps']:.1f} q/s | {report['errors']} errors")
+    print(f"{'stage':<24}{'calls':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'peak MB':>10}")
+    for name, row in report["stages"].items():
+        print(f"{name:<24}{row['calls']:>7}{row['p50_ms']:>10.2f}{row['p95_ms']:>10.2f}"
+              f"{row['p99_ms']:>10.2f}{row['peak_memory_mb']:>10.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline benchmark of the search pipeline")
+    parser.add_argument("--history-dir", default=cfg.HISTORY_DIR, help="Query history directory to replay")
+    parser.add_argument("--sizes", default="10000,100000", help="Comma separated total document counts")
+    parser.add_argument("--repeat", type=int, default=1, help="Replays of the corpus per size")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--mongo-url", default=None, help="Use a local mongod instead of mongomock")
+    parser.add_argument("--ner-latency", type=float, default=0.0, help="Simulated NER latency in seconds")
+    parser.add_argument("--no-memory", action="store_true", help="Disable tracemalloc (lower overhead)")
+    parser.add_argument("--output", default=None, help="Write the reports as JSON")
+    args = parser.parse_args()
+
+    queries = load_query_corpus(args.history_dir)
+    reports = []
+    for size in [int(size) for size in args.sizes.split(",")]:
+        report = run_benchmark(queries, size, args.repeat, args.seed, args.mongo_url,
+                               args.ner_latency, not args.no_memory)
+        print_report(report)
+        reports.append(report)
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(reports, file, indent=2)
@@ -0,0 +1,133 @@
+import math
+import time
+import threading
+import config as cfg
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from job_search_ner import NamedEntityExtractor
+from query_history import QueryHistoryStore
+from utils import respond_query
+
+
+def rank_queries(entries, top_n, half_life, now=None):
+    """
+    Rank history queries by frequency weighted with exponential recency decay.
+
+    Every occurrence contributes 0.5 ** (age / half_life), so a query asked ten times
+    last month can still lose to one asked five times today. Queries are grouped by
+    normalised text; the most recent spelling is the one replayed, with the entities stored
+    for it if the LLM extracted them (entries without a "source" of "llm" are re-extracted).
+
+    Args:
+        entries: History entries ({"ts", "query", ...}) as yielded by QueryHistoryStore.read.
+        top_n (int): Number of queries to return.
+        half_life (float): Recency half-life in seconds.
+
+    Returns:
+        list: The top `top_n` (query string, LLM entities or None) pairs, best first.
+    """
+    now = now or time.time()
+    scores = {}
+    latest = {}
+    for entry in entries:
+        query = entry.get("query")
+        if not query:
+            continue
+        key = NamedEntityExtractor.normalize_query(query)
+        age = max(0.0, now - entry["ts"])
+        scores[key] = scores.get(key, 0.0) + math.pow(0.5, age / half_life)
+        if key not in latest or entry["ts"] >= latest[key][0]:
+            entities = entry.get("entities")
+            if entry.get("source") != "llm" or not isinstance(entities, dict) or not entities:
+                entities = None
+            latest[key] = (entry["ts"], query, entities)
+    ranked = sorted(scores, key=scores.get, reverse=True)[:top_n]
+    return [latest[key][1:] for key in ranked]
+
+
+class CacheWarmer:
+    """
+    Replays the most common recent queries through the FAISS recommender and the
+    database in the background, filling the entity cache, the recommendation cache and
+    MongoDB's working set before traffic is shifted to this instance.
+
+    The entity cache is seeded with the LLM entities stored in the query history; queries
+    stored with entities of another source (semantic cache copies, legacy history lines
+    without a source) go through the NER again.
+
+    Attributes:
+        status: "idle", "warming", "ready", "failed" (the warm-up itself broke; the
+            instance serves cold) or "disabled".
+        total, completed, failed: Progress counters reported by the readiness endpoint.
+    """
+
+    def __init__(self, ner_obj, search_recommender, query_handler_factory, history_store=None,
+                 top_n=cfg.WARMUP_TOP_N, concurrency=cfg.WARMUP_CONCURRENCY,
+                 lookback_days=cfg.WARMUP_LOOKBACK_DAYS, half_life_days=cfg.WARMUP_HALF_LIFE_DAYS):
+        self.ner_obj = ner_obj
+        self.search_recommender = search_recommender
+        self.query_handler_factory = query_handler_factory
+        self.history_store = history_store or QueryHistoryStore()
+        self.top_n = top_n
+        self.concurrency = concurrency
+        self.lookback = lookback_days * 24 * 60 * 60
+        self.half_life = half_life_days * 24 * 60 * 60
+        self.status = "idle"
+        self.total = 0
+        self.completed = 0
+        self.failed = 0
+        self.started_at = None
+        self.finished_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self):
+        return self.status in ("ready", "failed", "disabled")
+
+    def progress(self):
+        with self._lock:
+            return {"status": self.status, "total": self.total, "completed": self.completed,
+                    "failed": self.failed,
+                    "elapsed_s": round((self.finished_at or time.time()) - self.started_at, 1)
+                    if self.started_at else 0.0}
+
+    def warm_query(self, query, entities=None):
+        if entities is not None:
+            ner_response = {**entities, "query": query}
+            self.ner_obj.remember(query, ner_response)
+        else:
+            ner_response = self.ner_obj.extract_named_entities(query)
+        respond_query(ner_response, self.search_recommender, self.query_handler_factory())
+
+    def warm(self):
+        queries = rank_queries(self.history_store.read(since=self.started_at - self.lookback),
+                               self.top_n, self.half_life, now=self.started_at)
+        self.total = len(queries)
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="warmup") as executor:
+            futures = {executor.submit(self.warm_query, query, entities): query for query, entities in queries}
+            for future in as_completed(futures):
+                with self._lock:
+                    if future.exception() is not None:
+                        self.failed += 1
+                        print(f"Warm-up failed for {futures[future]!r}: {future.exception()!r}")
+                    else:
+                        self.completed += 1
+
+    def run(self):
+        self.started_at = time.time()
+        self.status = "warming"
+        try:
+            self.warm()
+        except Exception as e:
+            self.status = "failed"
+            print(f"Cache warm-up aborted: {e!r}")
+        else:
+            self.status = "ready"
+            print(f"Cache warm-up finished: {self.completed}/{self.total} queries, {self.failed} failed")
+        finally:
+            self.finished_at = time.time()
+
+    def start(self):
+        threading.Thread(target=self.run, name="cache-warmer", daemon=True).start()
+
+    def disable(self):
+        self.status = "disabled"
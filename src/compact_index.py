@@ -0,0 +1,117 @@
+import json
+import time
+import argparse
+import config as cfg
+from lazy_imports import lazy_import
+
+np = lazy_import("numpy")
+faiss = lazy_import("faiss")
+
+# Compact FAISS index: a PCA or OPQ projection (e.g. 768 -> 256 dimensions) trained on the
+# corpus, followed by float32, float16 or int8 storage of the projected vectors.
+#
+# The projection is part of the index (an IndexPreTransform), so the 768-d query vectors of
+# recommend_faiss_index are projected exactly like the corpus was at build time. The
+# evaluation report compares recall@k, size and search time against the full index.
+#
+# python compact_index.py --dimension 256 --method pca --storage float16 --report report.json
+# FAISS_USE_COMPACT_INDEX=1 uvicorn app:app
+
+STORAGE_CODES = {"float32": "Flat", "float16": "SQfp16", "int8": "SQ8"}
+
+
+def factory_string(dimension, method, storage, opq_subspaces=cfg.FAISS_OPQ_SUBSPACES):
+    if method == "opq":
+        transform = f"OPQ{opq_subspaces}_{dimension}"
+    else:
+        transform = f"PCA{dimension}"
+    return f"{transform},{STORAGE_CODES[storage]}"
+
+
+def corpus_vectors(index, chunk_size=100000):
+    """
+    Yield (start id, vectors) chunks reconstructed from a flat index.
+    """
+    for start in range(0, index.ntotal, chunk_size):
+        yield start, index.reconstruct_n(start, min(chunk_size, index.ntotal - start))
+
+
+def build_compact_index(index, dimension=cfg.FAISS_COMPACT_DIMENSION, method="pca", storage="float16",
+                        train_size=100000, seed=0):
+    """
+    Train the projection and storage on a sample of `index` and add all of its vectors.
+
+    Vectors are added in id order, so result ids still match faiss_index_id.
+    """
+    rng = np.random.default_rng(seed)
+    sample_ids = np.sort(rng.choice(index.ntotal, size=min(train_size, index.ntotal), replace=False))
+    training_vectors = np.vstack([index.reconstruct(int(vector_id)) for vector_id in sample_ids])
+    compact_index = faiss.index_factory(index.d, factory_string(dimension, method, storage), index.metric_type)
+    compact_index.train(training_vectors)
+    for _, vectors in corpus_vectors(index):
+        compact_index.add(vectors)
+    return compact_index
+
+
+def recall_at_k(expected, actual, k):
+    return float(np.mean([len(set(row_a[:k]) & set(row_b[:k])) / k for row_a, row_b in zip(expected, actual)]))
+
+
+def timed_search(index, vectors, k):
+    started = time.perf_counter()
+    _, ids = index.search(vectors, k)
+    return ids, (time.perf_counter() - started) / len(vectors) * 1000
+
+
+def evaluate(full_index, compact_index, queries=1000, ks=(1, 10, 100), seed=1):
+    """
+    Recall@k of `compact_index` against the exact results of `full_index`.
+
+    Queries are corpus vectors with a little noise added, so they resemble real queries
+    that are close to, but not identical with, indexed postings.
+    """
+    rng = np.random.default_rng(seed)
+    query_ids = rng.choice(full_index.ntotal, size=min(queries, full_index.ntotal), replace=False)
+    vectors = np.vstack([full_index.reconstruct(int(query_id)) for query_id in query_ids])
+    vectors += rng.normal(scale=0.01, size=vectors.shape).astype("float32")
+    k = max(ks)
+    expected, full_ms = timed_search(full_index, vectors, k)
+    actual, compact_ms = timed_search(compact_index, vectors, k)
+    return {
+        "queries": len(vectors),
+        "recall": {f"recall@{value}": recall_at_k(expected, actual, value) for value in ks},
+        "full_bytes": len(faiss.serialize_index(full_index)),
+        "compact_bytes": len(faiss.serialize_index(compact_index)),
+        "full_search_ms_per_query": full_ms,
+        "compact_search_ms_per_query": compact_ms,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build a PCA/OPQ-projected, compact FAISS index")
+    parser.add_argument("--index", default=cfg.FAISS_INDEX_PATH)
+    parser.add_argument("--output", default=cfg.FAISS_COMPACT_INDEX_PATH)
+    parser.add_argument("--dimension", type=int, default=cfg.FAISS_COMPACT_DIMENSION)
+    parser.add_argument("--method", choices=["pca", "opq"], default="pca")
+    parser.add_argument("--storage", choices=list(STORAGE_CODES), default="float16")
+    parser.add_argument("--train-size", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--report", default=None, help="Write the evaluation report to this JSON file")
+    args = parser.parse_args()
+
+    full_index = faiss.read_index(args.index)
+    started = time.perf_counter()
+    compact_index = build_compact_index(full_index, args.dimension, args.method, args.storage, args.train_size)
+    print(f"Built {factory_string(args.dimension, args.method, args.storage)} index of "
+          f"{compact_index.ntotal} vectors in {time.perf_counter() - started:.1f}s")
+    faiss.write_index(compact_index, args.output)
+
+    report = {"method": args.method, "dimension": args.dimension, "storage": args.storage,
+              **evaluate(full_index, compact_index, args.queries)}
+    for name, value in report["recall"].items():
+        print(f"{name}: {value:.4f}")
+    print(f"size: {report['full_bytes'] / 2**20:.1f} MiB -> {report['compact_bytes'] / 2**20:.1f} MiB, "
+          f"search: {report['full_search_ms_per_query']:.3f} -> {report['compact_search_ms_per_query']:.3f} ms/query")
+    if args.report:
+        with open(args.report, "w") as file:
+            json.dump(report, file, indent=2)
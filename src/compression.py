@@ -0,0 +1,106 @@
+import gzip
+import importlib.util
+import config as cfg
+from lazy_imports import lazy_import
+from tracing import metrics, stage
+
+# brotli is optional; "br" is only offered when it is installed.
+brotli = lazy_import("brotli") if importlib.util.find_spec("brotli") else None
+
+# Response compression for the API, as ASGI middleware.
+#
+# Complete (non-streaming) response bodies of at least `minimum_size` bytes are compressed
+# with brotli or gzip, whichever the client accepts (brotli preferred). Bodies sent in
+# several chunks, already encoded responses and 304s pass through unchanged.
+
+
+def parse_accept_encoding(header):
+    """
+    The content codings accepted by an Accept-Encoding header, without those with q=0.
+    """
+    encodings = set()
+    for part in (header or "").lower().split(","):
+        coding, _, params = part.strip().partition(";")
+        if not coding:
+            continue
+        quality = params.strip()
+        if quality.startswith("q="):
+            try:
+                if float(quality[2:]) == 0:
+                    continue
+            except ValueError:
+                continue
+        encodings.add(coding.strip())
+    return encodings
+
+
+def choose_encoding(header):
+    accepted = parse_accept_encoding(header)
+    if brotli is not None and ("br" in accepted or "*" in accepted):
+        return "br"
+    if "gzip" in accepted or "*" in accepted:
+        return "gzip"
+    return None
+
+
+def compress(body, encoding, level=None):
+    if encoding == "br":
+        return brotli.compress(body, quality=cfg.BROTLI_QUALITY if level is None else level)
+    return gzip.compress(body, compresslevel=cfg.GZIP_LEVEL if level is None else level)
+
+
+class CompressionMiddleware:
+    """
+    Compresses response bodies of at least `minimum_size` bytes with brotli or gzip.
+    """
+
+    def __init__(self, app, minimum_size=cfg.COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope["headers"])
+        encoding = choose_encoding(headers.get(b"accept-encoding", b"").decode("latin-1"))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+
+        async def send_compressed(message):
+            nonlocal start_message
+            if message["type"] == "http.response.start":
+                # Held back until the body shows whether it is compressed.
+                start_message = message
+                return
+            if start_message is None:
+                await send(message)
+                return
+            start, start_message = start_message, None
+            body = message.get("body", b"")
+            response_headers = [(name, value) for name, value in start["headers"]]
+            names = {name.lower() for name, _ in response_headers}
+            if (message.get("more_body") or len(body) < self.minimum_size or b"content-encoding" in names
+                    or start["status"] in (204, 304)):
+                await send(start)
+                await send(message)
+                return
+            with stage("compression"):
+                compressed = compress(body, encoding)
+            metrics.inc("response_bytes_total", len(body), help_text="Response bytes before compression",
+                        encoding=encoding)
+            metrics.inc("response_compressed_bytes_total", len(compressed),
+                        help_text="Response bytes after compression", encoding=encoding)
+            response_headers = [(name, value) for name, value in response_headers
+                                if name.lower() not in (b"content-length", b"vary")]
+            vary = [value for name, value in start["headers"] if name.lower() == b"vary"]
+            response_headers += [(b"content-encoding", encoding.encode()),
+                                 (b"content-length", str(len(compressed)).encode()),
+                                 (b"vary", b", ".join(vary + [b"Accept-Encoding"]))]
+            await send({**start, "headers": response_headers})
+            await send({**message, "body": compressed})
+
+        await self.app(scope, receive, send_compressed)
@@ -1,8 +1,14 @@
 import os
-from dotenv import load_dotenv
+import json
+
+try:
+    from dotenv import load_dotenv
+except ImportError:
+    load_dotenv = None
 
 current_dir = os.getcwd()
-load_dotenv()
+if load_dotenv is not None:
+    load_dotenv()
 MONGODB_USERNAME = os.getenv("MONGODB_USERNAME")
 MONGODB_PASSWORD = os.getenv("MONGODB_PASSWORD")
 DB_NAME = os.getenv("DB_NAME")
@@ -10,7 +16,231 @@ MONGODB_URL = "mongodb+srv://{}:{}@cluster0.npmuj.mongodb.net/talentmatrics?retr
 OPENAI_API_PATH = os.path.join(os.path.dirname(current_dir), "fm_api_key.txt")
 VECTOR_DB_PATH = os.path.join(os.path.dirname(current_dir), "data", "vector_db_jobsearch.csv")
 MODEL_NAME = "all-mpnet-base-v2"
+# Columns of the jobsearch_vectordb rows and VECTOR_DB_PATH, one row per FAISS index vector
+# (see ingest_vectordb.py, which builds both and the index in chunks under INGEST_DIR).
+VECTOR_DB_COLUMNS = ["Client_Name", "Client_Location", "Candidate_Location", "Client_Type", "Currency",
+                     "Client_Job_Title", "Our_Job_Title", "Skill", "Annual_Salary", "Salary_From", "Salary_To",
+                     "Benefit_Name", "Value", "Paid_Bonus", "Date"]
+INGEST_DIR = os.getenv("INGEST_DIR", os.path.join(os.path.dirname(current_dir), "data", "ingest"))
+INGEST_CHUNK_SIZE = int(os.getenv("INGEST_CHUNK_SIZE", 8192))
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", max(1, (os.cpu_count() or 2) // 2)))
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", 256))
+# Storage backend of DBQueryHandler: "mongo" (cfg.MONGODB_URL) or "duckdb" (Parquet snapshots
+# in SNAPSHOT_DIR written by snapshot.py, see local_storage.py).
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "mongo")
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", os.path.join(os.path.dirname(current_dir), "data", "snapshots"))
+DUCKDB_THREADS = int(os.getenv("DUCKDB_THREADS", 4))
 FAISS_INDEX_PATH = os.path.join(os.path.dirname(current_dir), "models", "faiss_index.bin")
+# Compact index (see compact_index.py): PCA/OPQ-projected vectors with float16/int8 storage.
+FAISS_COMPACT_INDEX_PATH = os.path.join(os.path.dirname(current_dir), "models", "faiss_index.compact.bin")
+FAISS_COMPACT_DIMENSION = 256
+FAISS_OPQ_SUBSPACES = 32
+FAISS_USE_COMPACT_INDEX = os.getenv("FAISS_USE_COMPACT_INDEX", "0") == "1"
+FAISS_SEARCH_INDEX_PATH = FAISS_COMPACT_INDEX_PATH if FAISS_USE_COMPACT_INDEX else FAISS_INDEX_PATH
+
+# LLM transport settings. OPENAI_API_BASE can point to any OpenAI-compatible
+# server, e.g. the local fake in fake_llm_server.py.
+LLM_MODEL_NAME = "gpt-4"
+OPENAI_API_BASE = os.getenv("OPENAI_API_BASE", "https://api.openai.com/v1")
+LLM_REQUEST_TIMEOUT = float(os.getenv("LLM_REQUEST_TIMEOUT", 20))    # seconds per attempt
+LLM_DEADLINE = float(os.getenv("LLM_DEADLINE", 45))                  # seconds for the whole call
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", 3))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", 0.5))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", 8))
+LLM_HEDGE_DELAY = float(os.getenv("LLM_HEDGE_DELAY", 0))             # 0 disables hedged requests
+LLM_BREAKER_FAILURE_THRESHOLD = int(os.getenv("LLM_BREAKER_FAILURE_THRESHOLD", 5))
+LLM_BREAKER_RESET_TIMEOUT = float(os.getenv("LLM_BREAKER_RESET_TIMEOUT", 30))
+NER_CACHE_SIZE = int(os.getenv("NER_CACHE_SIZE", 1024))
+# Semantic NER cache (see semantic_cache.py): paraphrases of earlier queries reuse their
+# entities when the cosine similarity of the query embeddings reaches the threshold.
+NER_SEMANTIC_CACHE_ENABLED = os.getenv("NER_SEMANTIC_CACHE_ENABLED", "1") == "1"
+NER_SEMANTIC_THRESHOLD = float(os.getenv("NER_SEMANTIC_THRESHOLD", 0.92))
+NER_SEMANTIC_CACHE_SIZE = int(os.getenv("NER_SEMANTIC_CACHE_SIZE", 10000))
+
+# Entity linking (see entity_linking.py): unmatched values of these entities are linked to
+# the ENTITY_LINK_CANDIDATES most similar canonical values with a cosine similarity of at
+# least ENTITY_LINK_THRESHOLD, instead of searching the posting index for suggestions.
+ENTITY_LINKING_ENABLED = os.getenv("ENTITY_LINKING_ENABLED", "1") == "1"
+LINKED_ENTITIES = ("JOB_TITLE", "BENEFITS_NAME", "SKILLS")
+ENTITY_LINK_CANDIDATES = int(os.getenv("ENTITY_LINK_CANDIDATES", 5))
+ENTITY_LINK_THRESHOLD = float(os.getenv("ENTITY_LINK_THRESHOLD", 0.5))
+ENTITY_LINK_CACHE_SIZE = 4096
+ENTITY_LINK_REFRESH_INTERVAL = 60 * 60    # seconds between catalog rebuilds
+# Streaming NER (see entity_prefetch.py): entities are parsed from the streamed completion
+# and their existence checks run while the LLM is still generating.
+NER_STREAMING = os.getenv("NER_STREAMING", "0") == "1"
+NER_PREFETCH_WORKERS = int(os.getenv("NER_PREFETCH_WORKERS", 16))
+
+# FAISS recommendation settings. Concurrent encode+search requests arriving within
+# ENCODER_BATCH_WINDOW seconds are coalesced into one batch (0 disables batching).
+FAISS_TOP_K = 100
+# Sharded search (see sharded_index.py): number of local shard processes (0 for a single
+# in-process index), or the comma separated host:port addresses of running shard servers.
+FAISS_SHARDS = int(os.getenv("FAISS_SHARDS", 0))
+FAISS_SHARD_THREADS = int(os.getenv("FAISS_SHARD_THREADS", 1))
+FAISS_SHARD_ADDRESSES = [address for address in os.getenv("FAISS_SHARD_ADDRESSES", "").split(",") if address]
+# Shared secret of remote shard servers. The connections unpickle what they receive, so a
+# server must only be reachable on a private network; local shard processes get a random key.
+FAISS_SHARD_AUTHKEY = os.getenv("FAISS_SHARD_AUTHKEY", "").encode()
+ENCODER_BATCH_WINDOW = float(os.getenv("ENCODER_BATCH_WINDOW", 0.003))
+ENCODER_MAX_BATCH_SIZE = int(os.getenv("ENCODER_MAX_BATCH_SIZE", 32))
+RECOMMENDATION_CACHE_SIZE = int(os.getenv("RECOMMENDATION_CACHE_SIZE", 4096))
+
+# Concurrent identical /search requests share one computation (see single_flight.py):
+# requests with the same normalized query share the whole pipeline, and with
+# SINGLE_FLIGHT_BY_ENTITIES also requests whose extracted entities are the same share the
+# DB lookups and recommendations (paraphrases then receive the first query's recommendations).
+# A request waits at most SINGLE_FLIGHT_TIMEOUT seconds for the result.
+SINGLE_FLIGHT_ENABLED = os.getenv("SINGLE_FLIGHT_ENABLED", "1") == "1"
+SINGLE_FLIGHT_BY_ENTITIES = os.getenv("SINGLE_FLIGHT_BY_ENTITIES", "0") == "1"
+SINGLE_FLIGHT_TIMEOUT = float(os.getenv("SINGLE_FLIGHT_TIMEOUT", 60))
+
+# Admission control (see admission.py): concurrent calls and waiting calls per pipeline
+# stage, and how long a request of each priority class (X-Priority header) may spend
+# waiting for slots before it is answered with 503. Batch requests may only fill
+# ADMISSION_BATCH_QUEUE_FRACTION of a stage's queue. The encoder limit counts concurrent
+# encode calls (one per batch of queries), not the requests waiting in a batch.
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "1") == "1"
+ADMISSION_LIMITS = {"llm": int(os.getenv("ADMISSION_LLM_LIMIT", 16)),
+                    "db": int(os.getenv("ADMISSION_DB_LIMIT", 32)),
+                    "encoder": int(os.getenv("ADMISSION_ENCODER_LIMIT", 2))}
+ADMISSION_QUEUE_SIZE = {"llm": int(os.getenv("ADMISSION_LLM_QUEUE", 64)),
+                        "db": int(os.getenv("ADMISSION_DB_QUEUE", 64)),
+                        "encoder": int(os.getenv("ADMISSION_ENCODER_QUEUE", 32))}
+ADMISSION_QUEUE_TIMEOUT = {"interactive": float(os.getenv("ADMISSION_INTERACTIVE_TIMEOUT", 5)),
+                           "batch": float(os.getenv("ADMISSION_BATCH_TIMEOUT", 30))}
+ADMISSION_BATCH_QUEUE_FRACTION = 0.5
+ADMISSION_DEFAULT_PRIORITY = "interactive"
+
+# Responses of at least COMPRESSION_MIN_SIZE bytes are compressed with brotli (if
+# installed) or gzip, as accepted by the client (see compression.py).
+COMPRESSION_ENABLED = os.getenv("COMPRESSION_ENABLED", "1") == "1"
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", 1024))
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+# Search results carry ETags from the result and the data version (see http_caching.py).
+# The data version is polled every DATA_VERSION_INTERVAL seconds; a repeated request with
+# a matching If-None-Match within ETAG_PRECHECK_TTL seconds gets a 304 without running the pipeline.
+ETAGS_ENABLED = os.getenv("ETAGS_ENABLED", "1") == "1"
+DATA_VERSION_INTERVAL = float(os.getenv("DATA_VERSION_INTERVAL", 30))
+ETAG_PRECHECK_TTL = float(os.getenv("ETAG_PRECHECK_TTL", 300))
+ETAG_STORE_SIZE = 10000
+
+# Paged /search results (see result_pages.py): full results are kept RESULT_CACHE_TTL
+# seconds so the next pages are sliced from memory; a page has at most MAX_PAGE_SIZE rows.
+RESULT_CACHE_SIZE = 256
+RESULT_CACHE_TTL = float(os.getenv("RESULT_CACHE_TTL", 120))
+MAX_PAGE_SIZE = 10000
+
+# Streamlit client (streamlit_app.py): backend URL, rows fetched per page and how long
+# identical queries are answered from the client-side cache.
+SEARCH_API_URL = os.getenv("SEARCH_API_URL", "http://127.0.0.1:8000")
+STREAMLIT_PAGE_SIZE = int(os.getenv("STREAMLIT_PAGE_SIZE", 500))
+STREAMLIT_CACHE_TTL = int(os.getenv("STREAMLIT_CACHE_TTL", 300))
+
+# Always add a Server-Timing header with per-stage latencies to /search responses.
+# Clients can also ask for it per request with the "X-Timing: 1" header.
+TIMING_HEADER = os.getenv("TIMING_HEADER", "0") == "1"
+
+# Admin profiling (see profiling.py): the /admin endpoints need the "X-Admin-Token: <ADMIN_TOKEN>"
+# header and are disabled while ADMIN_TOKEN is unset. Searches slower than
+# SLOW_QUERY_THRESHOLD seconds (0 disables) are appended to SLOW_QUERY_LOG.
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+PROFILE_TOP_N = 40
+SLOW_QUERY_THRESHOLD = float(os.getenv("SLOW_QUERY_THRESHOLD", 2.0))
+SLOW_QUERY_LOG = os.getenv("SLOW_QUERY_LOG", os.path.join(os.path.dirname(current_dir), "logs", "slow_queries.jsonl"))
+SLOW_QUERY_RECENT = 100
+
+# Query history, written in the background as JSONL segments (see query_history.py).
+HISTORY_DIR = os.path.join(os.path.dirname(current_dir), "history")
+HISTORY_QUEUE_SIZE = 10000
+HISTORY_BATCH_SIZE = 256
+HISTORY_FLUSH_INTERVAL = 1.0              # seconds
+HISTORY_SEGMENT_MAX_BYTES = 64 * 2 ** 20
+HISTORY_SEGMENT_MAX_AGE = 24 * 60 * 60    # seconds
+
+# Cache warm-up on startup: the top WARMUP_TOP_N history queries of the last
+# WARMUP_LOOKBACK_DAYS, scored by frequency with a recency half-life, are replayed
+# through the pipeline before /ready reports the service as ready.
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "1") == "1"
+WARMUP_TOP_N = int(os.getenv("WARMUP_TOP_N", 200))
+WARMUP_CONCURRENCY = int(os.getenv("WARMUP_CONCURRENCY", 4))
+WARMUP_LOOKBACK_DAYS = float(os.getenv("WARMUP_LOOKBACK_DAYS", 30))
+WARMUP_HALF_LIFE_DAYS = float(os.getenv("WARMUP_HALF_LIFE_DAYS", 7))
+
+# Numeric shadow fields (see numeric.py and normalize_numeric.py): money fields get
+# <field>_num and <field>_usd, percentage fields get <field>_num.
+money_fields = {"jobentries": ["salary"],
+                "benefits": ["value"],
+                "candidates": ["salary_from", "salary_to"]}
+percentage_fields = {"salarybonus": ["paidbonus_percentage"]}
+# Refuse to start while normalize_numeric.py has not created the shadow fields and indexes
+# (amount filters and MAX/MIN queries would find nothing).
+NUMERIC_FIELDS_CHECK = os.getenv("NUMERIC_FIELDS_CHECK", "1") == "1"
+
+# Units of USD per unit of currency, used for <field>_usd. Override with a JSON object in
+# the USD_EXCHANGE_RATES environment variable.
+USD_EXCHANGE_RATES = json.loads(os.getenv("USD_EXCHANGE_RATES", "null")) or {
+    "USD": 1.0, "EUR": 1.08, "GBP": 1.27, "CHF": 1.12, "INR": 0.012, "AED": 0.272,
+    "SGD": 0.74, "AUD": 0.66, "CAD": 0.74, "NZD": 0.61, "JPY": 0.0067, "NPR": 0.0075
+}
+
+# Pre-fork deployment (see prefork_server.py)
+PREFORK_WORKERS = int(os.getenv("PREFORK_WORKERS", os.cpu_count() or 1))
+PREFORK_TORCH_THREADS = int(os.getenv("PREFORK_TORCH_THREADS", 1))
+PREFORK_REFRESH_INTERVAL = float(os.getenv("PREFORK_REFRESH_INTERVAL", 15 * 60))
+
+# Compensation rollups (see rollups.py): per table, the numeric field summarised and the
+# entity -> document field dimensions it is grouped by. "partition" dimensions are always
+# part of the key (a benefit amount is only comparable within one benefit). Values of
+# tables with a "currency" field are converted to USD so groups spanning currencies compare.
+ROLLUPS_ENABLED = os.getenv("ROLLUPS_ENABLED", "1") == "1"
+ROLLUP_REFRESH_INTERVAL = 60              # seconds between incremental refreshes
+ROLLUP_FULL_REBUILD_INTERVAL = 6 * 60 * 60
+ROLLUP_PERCENTILES = (25, 50, 75, 90)
+ROLLUP_SKETCH_ACCURACY = 0.01             # relative error of the rollup percentiles
+# Rollup cells are kept for combinations of at most this many dimension filters (besides
+# the partition); queries with more filters are rare and go to MongoDB.
+ROLLUP_MAX_FILTERS = int(os.getenv("ROLLUP_MAX_FILTERS", 3))
+
+rollup_specs = {
+    "jobentries": {
+        "value": "salary",
+        "currency": "currency.code",
+        "partition": {},
+        "dimensions": {
+            "JOB_TITLE": "jobTitle",
+            "LOCATION": "location.name",
+            "LOCATION_GROUP": "location.locationgroup.name",
+            "CLIENT_NAME": "client",
+            "CURRENCY": "currency.code"
+        }
+    },
+    "salarybonus": {
+        "value": "paidbonus_percentage",
+        "partition": {},
+        "dimensions": {
+            "JOB_TITLE": "jobgrade.name",
+            "LOCATION": "location.name",
+            "LOCATION_GROUP": "location.locationgroup.name",
+            "CLIENT_NAME": "client.name",
+            "CURRENCY": "currency.code"
+        }
+    },
+    "benefits": {
+        "value": "value",
+        "currency": "currency.code",
+        "partition": {"BENEFITS_NAME": "name"},
+        "dimensions": {
+            "JOB_TITLE": "jobgrade.name",
+            "LOCATION": "location.name",
+            "LOCATION_GROUP": "location.locationgroup.name",
+            "CLIENT_NAME": "client.name",
+            "CURRENCY": "currency.code"
+        }
+    }
+}
 
 
 table_views = {"clients": ["Client_Name", "Client_Location", "Client_Type", "Currency"],
@@ -78,6 +308,117 @@ column_map_dict = {
     }
 }
 
+# Document field matched (case-insensitive exact match) by each text entity, per collection,
+# in the order the entities are checked by DBQueryHandler (see query_plans.py).
+entity_fields = {
+    "clients": {
+        "LOCATION": "location.name",
+        "LOCATION_GROUP": "location.locationgroup.name",
+        "CLIENT_TYPE": "clienttype.name",
+        "CURRENCY": "currency.code",
+        "CLIENT_NAME": "name"
+    },
+    "jobtitles": {
+        "LOCATION": "location.name",
+        "LOCATION_GROUP": "location.locationgroup.name",
+        "CLIENT_NAME": "client.name",
+        "JOB_TITLE": "job_title"
+    },
+    "jobentries": {
+        "LOCATION": "location.name",
+        "LOCATION_GROUP": "location.locationgroup.name",
+        "JOB_TITLE": "jobTitle",
+        "CURRENCY": "currency.code",
+        "CLIENT_NAME": "client"
+    },
+    "candidates": {
+        "CLIENT_NAME": "client.name",
+        "JOB_TITLE": "jobTitle",
+        "SKILLS": "skill_code",
+        "LOCATION": "location.name",
+        "LOCATION_GROUP": "location.locationgroup.name",
+        "CURRENCY": "currency.code"
+    },
+    "benefits": {
+        "CLIENT_NAME": "client.name",
+        "LOCATION": "location.name",
+        "LOCATION_GROUP": "location.locationgroup.name",
+        "JOB_TITLE": "jobgrade.name",
+        "CURRENCY": "currency.code",
+        "BENEFITS_NAME": "name"
+    },
+    "salarybonus": {
+        "CLIENT_NAME": "client.name",
+        "LOCATION": "location.name",
+        "LOCATION_GROUP": "location.locationgroup.name",
+        "JOB_TITLE": "jobgrade.name",
+        "CURRENCY": "currency.code"
+    }
+}
+
+# The rest of each table's query, compiled with entity_fields into cached query plans:
+#   amounts:  numeric entities, checked after the text entities, as
+#             (entity, document field, operator, exact_match key); operator None is equality.
+#             Money fields compare <field>_num within a matched currency and <field>_usd
+#             otherwise; exact amounts and percentages always compare <field>_num.
+#   sort:     field ordered by MAX_MONEY_ATTRIBUTES / MIN_MONEY_ATTRIBUTES.
+#   columns:  result column -> document field (datetimes are returned as dates).
+#   rollups:  MAX/MIN queries may be answered by the compensation rollups.
+table_specs = {
+    "clients": {
+        "columns": {"Client_Name": "name", "Client_Location": "location.name",
+                    "Client_Type": "clienttype.name", "Currency": "currency.code"}
+    },
+    "jobtitles": {
+        "columns": {"Client_Name": "client.name", "Client_Job_Title": "job_title",
+                    "Our_Job_Title": "jobgrade.name", "Client_Location": "location.name", "Date": "date"}
+    },
+    "jobentries": {
+        "amounts": [("AMOUNT_FROM", "salary", "$gte", "SALARY_AMOUNT"),
+                    ("AMOUNT_TO", "salary", "$lte", "SALARY_AMOUNT"),
+                    ("SALARY_AMOUNT", "salary", None, "SALARY_AMOUNT")],
+        "sort": "salary",
+        "rollups": True,
+        "columns": {"Client_Name": "client", "Our_Job_Title": "jobTitle", "Client_Job_Title": "jobgrade.name",
+                    "Candidate_Location": "location.name", "Annual_Salary": "salary",
+                    "Currency": "currency.code", "Date": "date"}
+    },
+    "candidates": {
+        "amounts": [("AMOUNT_FROM", "salary_from", "$gte", "SALARY_FROM"),
+                    ("AMOUNT_TO", "salary_to", "$lte", "SALARY_TO")],
+        "sort": "salary_to",
+        "columns": {"Client_Name": "client.name", "Our_Job_Title": "jobTitle", "Client_Job_Title": "jobTitle",
+                    "Skill": "skill_code", "Client_Location": "location.name",
+                    "Candidate_Location": "location.name", "Salary_From": "salary_from",
+                    "Salary_To": "salary_to", "Currency": "currency.code", "Date": "date"}
+    },
+    "benefits": {
+        "amounts": [("BENEFITS_AMOUNT", "value", None, "BENEFITS_AMOUNT"),
+                    ("AMOUNT_FROM", "value", "$gte", "BENEFITS_AMOUNT"),
+                    ("AMOUNT_TO", "value", "$lte", "BENEFITS_AMOUNT")],
+        "sort": "value",
+        "rollups": True,
+        "columns": {"Benefit_Name": "name", "Client_Location": "location.name", "Client_Name": "client.name",
+                    "Our_Job_Title": "jobgrade.name", "Value": "value", "Currency": "currency.code",
+                    "Date": "date"}
+    },
+    "salarybonus": {
+        "amounts": [("BONUS_PERCENT", "paidbonus_percentage", None, "BONUS_PERCENT"),
+                    ("AMOUNT_FROM", "paidbonus_percentage", "$gte", "BONUS_PERCENT"),
+                    ("AMOUNT_TO", "paidbonus_percentage", "$lte", "BONUS_PERCENT")],
+        "sort": "paidbonus_percentage",
+        "rollups": True,
+        "columns": {"Client_Name": "client.name", "Our_Job_Title": "jobgrade.name",
+                    "Client_Location": "location.name", "Currency": "currency.code",
+                    "Paid_Bonus": "paidbonus_percentage", "Date": "date"}
+    }
+}
+
+# Hint the numeric range indexes of normalize_numeric.py on range and MAX/MIN queries.
+# Only enable once the indexes exist: MongoDB rejects hints for missing indexes.
+QUERY_PLAN_HINTS = os.getenv("QUERY_PLAN_HINTS", "0") == "1"
+QUERY_PLAN_CACHE_SIZE = 256
+
 
 
 
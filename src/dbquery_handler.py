@@ -1,8 +1,11 @@
-import re
-import pymongo
-import pandas as pd
 import config as cfg
-from pymongo.errors import ConfigurationError, PyMongoError
+from lazy_imports import lazy_import
+from numeric import parse_amount
+from query_plans import entity_pattern, plan_for
+from tracing import current_trace, stage
+
+pd = lazy_import("pandas")
+pymongo = lazy_import("pymongo")
 
 class DBQueryHandler:
     """
@@ -14,251 +17,143 @@ class DBQueryHandler:
 
     Methods:
         __init__(): Initializes the DBQueryHandler object and connects to the MongoDB client.
+        query_table(prediction_result, table_name): Runs the compiled query plan of a table (see query_plans.py).
         get_bonus_table(prediction_result, table_name): Retrieves a bonus table based on prediction results.
         get_benefits_table(prediction_result, table_name): Retrieves a benefits table based on prediction results.
-        get_jobentries_dict(results): Static method that converts query results to a job entries dictionary.
         get_jobentries_table(prediction_result, table_name): Retrieves a job entries table based on prediction results.
         close_connection(): Closes the MongoDB client connection.
     """
 
-    def __init__(self):
+    def __init__(self, client=None, db=None, rollups=None, entity_linker=None):
         """
         Initializes the DBQueryHandler object and connects to the MongoDB client.
-        """
-        try:
 
-            self.client = pymongo.MongoClient(cfg.MONGODB_URL)
-            self.db = self.client[cfg.DB_NAME]
+        Args:
+            client: An existing MongoClient (or compatible, e.g. mongomock) to use instead of connecting to cfg.MONGODB_URL.
+            db: An existing database object to use instead of client[cfg.DB_NAME].
+                With cfg.STORAGE_BACKEND == "duckdb" the local Parquet snapshots are used instead of MongoDB.
+            rollups: Optional CompensationRollups answering MAX/MIN salary, bonus and benefit queries without MongoDB.
+            entity_linker: Optional EntityLinker suggesting canonical values for unmatched entities.
+        """
+        self.rollups = rollups
+        self.entity_linker = entity_linker
+        try:
+            if client is None and db is None and cfg.STORAGE_BACKEND == "duckdb":
+                from local_storage import open_local_database
+                db = client = open_local_database()
+            if client is None:
+                from mongo_monitoring import mongo_command_timer
+                client = pymongo.MongoClient(cfg.MONGODB_URL, event_listeners=[mongo_command_timer])
+            self.client = client
+            self.db = db if db is not None else self.client[cfg.DB_NAME]
 
         except AttributeError:
             print("The 'db' attribute is missing or not properly initialized.")
-        except ConfigurationError as e:
+        except pymongo.errors.ConfigurationError as e:
             # Handle the exception gracefully
             print(f"ConfigurationError: Database connection failed due to configuration error. Please retry it again")
-        except PyMongoError as e:
+        except pymongo.errors.PyMongoError as e:
             # Handle the connection-related error
             print(f"PyMongoError: {e}")
 
 
     @staticmethod
     def extract_value(value):
-        # Check if the salary amount has a "K" suffix and extract the numeric part
-        value_extracted = re.search(r'(\d+(\.\d+)?)K', value, re.IGNORECASE)
-        if value_extracted:
-            value = float(value_extracted.group(1)) * 1000
-        else:
-            # If no "K" suffix, use the regular expression to extract the numeric part
-            value_extracted = re.search(r'\d+(\.\d+)?', value)
-            value = int(value_extracted.group()) if '.' in value_extracted.group() else int(value_extracted.group())
-        return value
-
+        # Amounts and percentages such as "50K", "$1.5M" or "12%" (see numeric.parse_amount)
+        return parse_amount(value)
 
+    # Case-insensitive exact match pattern of a text entity, compiled once per value.
+    entity_pattern = staticmethod(entity_pattern)
 
-    @staticmethod
-    def get_clients_dict(results):
+    def serve_from_rollups(self, prediction_result, table_name, dict_builder):
         """
-        Converts query results to a job entries dictionary.
-
-        Args:
-            results: The query results from the database.
+        Answers a MAX/MIN query from the compensation rollups, if possible.
 
         Returns:
-            A dictionary representing the job entries.
+            The usual (df, exact_match, flag_not_found) tuple, or None to query MongoDB.
+        """
+        if self.rollups is None:
+            return None
+        served = self.rollups.serve_extreme(table_name, prediction_result)
+        if served is None:
+            return None
+        document_ids, exact_match, flag_not_found = served
+        documents = list(self.db[table_name].find({"_id": {"$in": document_ids}})) if document_ids else []
+        if len(documents) < len(document_ids):
+            # Deleted since the last full rebuild.
+            return None
+        with stage("dataframe"):
+            df = pd.DataFrame(dict_builder(documents))
+        return df, exact_match, flag_not_found
+
+    def link_entities(self, table_name, flag_not_found):
         """
-        clients_dict = {
-            "Client_Name": [],
-            "Client_Location": [],
-            "Client_Type": [],
-            "Currency": [],
-        }
-        for result in results:
-            clients_dict["Client_Name"].append(result["name"])
-            clients_dict["Client_Location"].append(result["location"]["name"])
-            clients_dict["Client_Type"].append(result["clienttype"]["name"])
-            clients_dict["Currency"].append(result["currency"]["code"])
-        return clients_dict
+        Canonical values suggested for the unmatched entities, by the entity linker.
 
+        Returns:
+            dict: entity -> suggested values, for the entities that could be linked.
+        """
+        if self.entity_linker is None or not self.entity_linker.ready:
+            return {}
+        return self.entity_linker.link_entities(table_name, flag_not_found)
 
-    def get_clients_table(self, prediction_result, table_name):
+    def query_table(self, prediction_result, table_name):
         """
-        Retrieves a bonus table based on prediction results.
+        Retrieves the rows of a table matching the entities of a prediction result.
+
+        Every entity is checked on its own first: entities with matching documents go into
+        exact_match and the query, the others into flag_not_found. The query, sort and
+        columns come from the table's cached QueryPlan (see query_plans.py).
+
         Args:
             prediction_result: A dictionary containing prediction results.
             table_name: A string representing the name of the collection/table to query.
 
         Returns:
-            A pandas DataFrame representing the bonus table.
-        """
-        query = {}
-        exact_match = {}
-        flag_not_found = {}
+            A tuple (pandas DataFrame, exact_match, flag_not_found).
+        """
+        plan = plan_for(table_name, prediction_result)
+        if plan.rollups:
+            served = self.serve_from_rollups(prediction_result, table_name, plan.flatten)
+            if served is not None:
+                trace = current_trace()
+                if trace is not None:
+                    trace.note("query_plan", {"table": table_name, "entities": sorted(plan.signature),
+                                              "served_by": "rollups"})
+                return served
         table = self.db[table_name]
-        for key in ["LOCATION", "LOCATION_GROUP", "CLIENT_TYPE", "CURRENCY", "CLIENT_NAME"]:
-            if key in prediction_result:
-                value = prediction_result[key]
-                escaped_value = re.escape(value)
-                pattern = "^" + escaped_value.replace("/", "/\\s*") + "$"
-                pattern = re.compile(pattern, re.IGNORECASE)
-                if key == "CLIENT_NAME":
-                    query_key = "name"
-                    count = table.count_documents({query_key: pattern})
-                    if count > 0:
-                        query[query_key] = pattern
-                        exact_match[key] = value
-                    else:
-                        flag_not_found[key] = value
-
-                elif key == "CURRENCY":
-                    query_key = "currency.code"
-                    count = table.count_documents({query_key: pattern})
-                    if count > 0:
-                        query[query_key] = pattern
-                        exact_match[key] = value
-                    else:
-                        flag_not_found[key] = value
-
-                elif key == "CLIENT_TYPE":
-                    query_key = "clienttype.name"
-                    count = table.count_documents({query_key: pattern})
-                    if count > 0:
-                        query[query_key] = pattern
-                        exact_match[key] = value
-                    else:
-                        flag_not_found[key] = value
-
-                elif key == "LOCATION":
-                    query_key = "location.name"
-                    count = table.count_documents({query_key: pattern})
-                    if count > 0:
-                        query[query_key] = pattern
-                        exact_match[key] = value
-                    else:
-                        flag_not_found[key] = value
-                
-                elif key == "LOCATION_GROUP":
-                    query_key = "location.locationgroup.name"
-                    count = table.count_documents({query_key: pattern})
-                    if count > 0:
-                        query[query_key] = pattern
-                        exact_match[key] = value
-                    else:
-                        flag_not_found[key] = value
-
-        client_results = table.find(query)
-        clients_dict = DBQueryHandler.get_clients_dict(client_results)
-        df = pd.DataFrame(clients_dict)
+        query, exact_match, flag_not_found = plan.bind(table, prediction_result)
+        trace = current_trace()
+        if trace is not None:
+            trace.note("query_plan", plan.describe(query, exact_match))
+        results = plan.find(table, query, exact_match)
+        with stage("dataframe"):
+            df = pd.DataFrame(plan.flatten(results))
         return df, exact_match, flag_not_found
-    
-    @staticmethod
-    def get_jobtitles_dict(results):
-        """
-        Converts query results to a job titles dictionary.
 
+    def get_clients_table(self, prediction_result, table_name):
+        """
+        Retrieves a clients table based on prediction results.
         Args:
-            results: The query results from the database.
+            prediction_result: A dictionary containing prediction results.
+            table_name: A string representing the name of the collection/table to query.
 
         Returns:
-            A dictionary representing the job titles.
+            A pandas DataFrame representing the clients table.
         """
-        jobtitles_dict = {
-        "Client_Name": [],
-        "Client_Job_Title": [],
-        "Our_Job_Title": [],
-        "Client_Location": [],
-        "Date": []
-        }
-        for result in results:
-            jobtitles_dict["Client_Name"].append(result["client"]["name"])
-            jobtitles_dict["Client_Job_Title"].append(result["job_title"])
-            jobtitles_dict["Our_Job_Title"].append(result["jobgrade"]["name"])
-            jobtitles_dict["Client_Location"].append(result["location"]["name"])
-            jobtitles_dict["Date"].append(result["date"].date())
-        return jobtitles_dict
-    
+        return self.query_table(prediction_result, table_name)
 
     def get_jobtitles_table(self, prediction_result, table_name):
-
-        query = {}
-        exact_match = {}
-        flag_not_found = {}
-        table = self.db[table_name]
-        for key in ["LOCATION", "LOCATION_GROUP", "CLIENT_NAME", "JOB_TITLE"]:
-            if key in prediction_result:
-                value = prediction_result[key]
-                escaped_value = re.escape(value)
-                pattern = "^" + escaped_value.replace("/", "/\\s*") + "$"
-                pattern = re.compile(pattern, re.IGNORECASE)
-                if key == "CLIENT_NAME":
-                    query_key = "client.name"
-                    count = table.count_documents({query_key : pattern})
-                    if count > 0:
-                        query[query_key] = pattern
-                        exact_match[key] = value
-                    else:
-                        flag_not_found[key] = value
-
-                elif key == "JOB_TITLE":
-                    query_key = "job_title"
-                    count = table.count_documents({query_key: pattern})
-                    if count > 0:
-                        query[query_key] = pattern
-                        exact_match[key] = value
-                    else:
-                        flag_not_found[key] = value
-
-                elif key == "LOCATION":
-                    query_key = "location.name"
-                    count = table.count_documents({query_key: pattern})
-                    if count > 0:
-                        query[query_key] = pattern
-                        exact_match[key] = value
-                    else:
-                        flag_not_found[key] = value
-                
-                elif key == "LOCATION_GROUP":
-                    query_key = "location.locationgroup.name"
-                    count = table.count_documents({query_key: pattern})
-                    if count > 0:
-                        query[query_key] = pattern
-                        exact_match[key] = value
-                    else:
-                        flag_not_found[key] = value
-
-
-        job_results = table.find(query)
-        jobtitles_dict = DBQueryHandler.get_jobtitles_dict(job_results)
-        df = pd.DataFrame(jobtitles_dict)
-        return df, exact_match, flag_not_found
-
-
-    @staticmethod
-    def get_bonus_dict(results):
         """
-        Converts query results to a job entries dictionary.
-
+        Retrieves a job titles table based on prediction results.
         Args:
-            results: The query results from the database.
+            prediction_result: A dictionary containing prediction results.
+            table_name: A string representing the name of the collection/table to query.
 
         Returns:
-            A dictionary representing the job entries.
+            A pandas DataFrame representing the job titles table.
         """
-        salarybonus_dict = {
-            "Client_Name": [],
-            "Our_Job_Title": [],
-            "Client_Location": [],
-            "Currency": [],
-            "Paid_Bonus": [],
-            "Date": [],
-        }
-        for result in results:
-            salarybonus_dict["Client_Name"].append(result["client"]["name"])
-            salarybonus_dict["Our_Job_Title"].append(result["jobgrade"]["name"])
-            salarybonus_dict["Client_Location"].append(result["location"]["name"])
-            salarybonus_dict["Currency"].append(result["currency"]["code"])
-            salarybonus_dict["Paid_Bonus"].append(result["paidbonus_percentage"])
-            salarybonus_dict["Date"].append(result["date"].date())
-        return salarybonus_dict
-
+        return self.query_table(prediction_result, table_name)
 
     def get_bonus_table(self, prediction_result, table_name):
         """
@@ -270,141 +165,7 @@ class DBQueryHandler:
         Returns:
             A pandas DataFrame representing the bonus table.
         """
-        query = {}
-        exact_match = {}
-        flag_not_found = {}
-        table = self.db[table_name]
-        for key in ["CLIENT_NAME", "LOCATION", "LOCATION_GROUP", "JOB_TITLE", 
-                    "CURRENCY", "BONUS_PERCENT", "AMOUNT_FROM", "AMOUNT_TO"]:
-            if key in prediction_result:
-                value = prediction_result[key]
-                escaped_value = re.escape(value)
-                pattern = "^" + escaped_value.replace("/", "/\\s*") + "$"
-                pattern = re.compile(pattern, re.IGNORECASE)
-                if key == "BONUS_PERCENT":
-                    bonus_value = prediction_result["BONUS_PERCENT"]
-                    bonus_value = DBQueryHandler.extract_value(bonus_value)
-                    query_key = "paidbonus_percentage"
-                    bonus_value = str(bonus_value)
-                    count = table.count_documents({query_key: bonus_value})
-                    print(count)
-                    if count > 0:
-                        query[query_key] = bonus_value
-                        exact_match[key] = bonus_value
-                    else:
-                        print(bonus_value)
-                        flag_not_found[key] = bonus_value
-
-                elif key == "CLIENT_NAME":
-                    query_key = "client.name"
-                    count = table.count_documents({query_key: pattern})
-                    if count > 0:
-                        query[query_key] = pattern
-                        exact_match[key] = value
-                    else:
-                        flag_not_found[key] = value
-
-                elif key == "JOB_TITLE":
-                    query_key = "jobgrade.name"
-                    count = table.count_documents({query_key: pattern})
-                    if count > 0:
-                        query[query_key] = pattern
-                        exact_match[key] = value
-                    else:
-                        flag_not_found[key] = value
-
-                elif key == "LOCATION":
-                    query_key = "location.name"
-                    count = table.count_documents({query_key: pattern})
-                    if count > 0:
-                        query[query_key] = pattern
-                        exact_match[key] = value
-                    else:
-                        flag_not_found[key] = value
-
-                elif key == "LOCATION_GROUP":
-                    query_key = "location.locationgroup.name"
-                    count = table.count_documents({query_key: pattern})
-                    if count > 0:
-                        query[query_key] = pattern
-                        exact_match[key] = value
-                    else:
-                        flag_not_found[key] = value
-
-                elif key == "CURRENCY":
-                    query_key = "currency.code"
-                    count = table.count_documents({query_key: pattern})
-                    if count > 0:
-                        query[query_key] = pattern
-                        exact_match[key] = value
-                    else:
-                        flag_not_found[key] = value
-
-                elif key == 'AMOUNT_FROM':
-                    bonus_from = prediction_result['AMOUNT_FROM']
-                    bonus_from = DBQueryHandler.extract_value(bonus_from)
-                    query_key = "paidbonus_percentage"
-                    count = table.count_documents({query_key: {'$gte': bonus_from}})
-                    if count > 0:
-                        query[query_key] = {'$gte': bonus_from}
-                        exact_match["BONUS_PERCENT"] = bonus_from
-                    else:
-                        flag_not_found["BONUS_PERCENT"] = bonus_from
-
-                elif 'AMOUNT_TO' in prediction_result:
-                    bonus_to = prediction_result['AMOUNT_TO']
-                    bonus_to = DBQueryHandler.extract_value(bonus_to)
-                    query_key = "paidbonus_percentage"
-                    count = table.count_documents({query_key: {'$lte': bonus_to}})
-                    if count > 0:
-                        query[query_key] = {'$lte': bonus_to}
-                        exact_match["BONUS_PERCENT"] = bonus_to
-                    else:
-                        flag_not_found["BONUS_PERCENT"] = bonus_to
-
-
-        if "MAX_MONEY_ATTRIBUTES" in prediction_result:
-            results = table.find(query).sort("paidbonus_percentage", -1).limit(1)
-        elif "MIN_MONEY_ATTRIBUTES" in prediction_result:
-            results = table.find(query).sort("paidbonus_percentage", 1).limit(1)
-        else:
-            results = table.find(query)
-        salarybonus_dict = DBQueryHandler.get_bonus_dict(results)
-        df = pd.DataFrame(salarybonus_dict)
-        return df, exact_match, flag_not_found
-
-    
-    @staticmethod
-    def get_benefits_dict(results):
-        """
-        Converts query results to a job entries dictionary.
-
-        Args:
-            results: The query results from the database.
-
-        Returns:
-            A dictionary representing the job entries.
-        """
-        benefits_dict = {
-            "Benefit_Name": [],
-            "Client_Location": [],
-            "Client_Name": [],
-            "Our_Job_Title": [],
-            "Value": [],
-            "Currency": [],
-            "Date": [],
-        }
-
-        for result in results:
-            benefits_dict["Benefit_Name"].append(result["name"])
-            benefits_dict["Client_Location"].append(result["location"]["name"])
-            benefits_dict["Client_Name"].append(result["client"]["name"])
-            benefits_dict["Our_Job_Title"].append(result["jobgrade"]["name"])
-            benefits_dict["Value"].append(result["value"])
-            benefits_dict["Currency"].append(result["currency"]["code"])
-            benefits_dict["Date"].append(result["date"].date())
-        return benefits_dict
-
+        return self.query_table(prediction_result, table_name)
 
     def get_benefits_table(self, prediction_result, table_name):
         """
@@ -417,145 +178,7 @@ class DBQueryHandler:
         Returns:
             A pandas DataFrame representing the benefits table.
         """
-        query = {}
-        exact_match = {}
-        flag_not_found = {}
-        table = self.db[table_name]
-        for key in ["CLIENT_NAME", "LOCATION", "LOCATION_GROUP", "JOB_TITLE",
-                    "CURRENCY", "BENEFITS_NAME", "BENEFITS_AMOUNT", "AMOUNT_FROM", 
-                    "AMOUNT_TO"]:
-            if key in prediction_result:
-                value = prediction_result[key]
-                escaped_value = re.escape(value)
-                pattern = "^" + escaped_value.replace("/", "/\\s*") + "$"
-                pattern = re.compile(pattern, re.IGNORECASE)
-                if key == "BENEFITS_NAME":
-                    query_key = "name"
-                    count = table.count_documents({query_key: pattern})
-                    if count > 0:
-                        query[query_key] = pattern
-                        exact_match[key] = value
-                    else:
-                        flag_not_found[key] = value
-
-                elif key == "CLIENT_NAME":
-                    query_key = "client.name"
-                    count = table.count_documents({query_key: pattern})
-                    if count > 0:
-                        query[query_key] = pattern
-                        exact_match[key] = value
-                    else:
-                        flag_not_found[key] = value
-
-                elif key == "JOB_TITLE":
-                    query_key = "jobgrade.name"
-                    count = table.count_documents({query_key: pattern})
-                    if count > 0:
-                        query[query_key] = pattern
-                        exact_match[key] = value
-                    else:
-                        flag_not_found[key] = value
-
-                elif key == "LOCATION":
-                    query_key = "location.name"
-                    count = table.count_documents({query_key: pattern})
-                    if count > 0:
-                        query[query_key] = pattern
-                        exact_match[key] = value
-                    else:
-                        flag_not_found[key] = value
-                
-                elif key == "LOCATION_GROUP":
-                    query_key = "location.locationgroup.name"
-                    count = table.count_documents({query_key: pattern})
-                    if count > 0:
-                        query[query_key] = pattern
-                        exact_match[key] = value
-                    else:
-                        flag_not_found[key] = value
-
-
-                elif key == "CURRENCY":
-                    query_key = "currency.code"
-                    count = table.count_documents({query_key: pattern})
-                    if count > 0:
-                        query[query_key] = pattern
-                        exact_match[key] = value
-                    else:
-                        flag_not_found[key] = value
-
-                elif key == "BENEFITS_AMOUNT":
-                    query_key = "value"
-                    count = table.count_documents({query_key: pattern})
-                    if count > 0:
-                        query[query_key] = pattern
-                        exact_match[key] = value
-                    else:
-                        flag_not_found[key] = value
-                        
-                elif key == 'AMOUNT_FROM':
-                    benefits_from = prediction_result['AMOUNT_FROM']
-                    benefits_from = DBQueryHandler.extract_value(benefits_from)
-                    query_key = "value"
-                    count = table.count_documents({query_key: {'$gte': benefits_from}})
-                    if count > 0:
-                        query[query_key] = {'$gte': benefits_from}
-                        exact_match["BENEFITS_AMOUNT"] = benefits_from
-                    else:
-                        flag_not_found["BENEFITS_AMOUNT"] = benefits_from        
-
-                elif key == 'AMOUNT_TO':
-                    benefits_to = prediction_result['AMOUNT_TO']
-                    benefits_to = DBQueryHandler.extract_value(benefits_to)
-                    query_key = "value"
-                    count = table.count_documents({query_key: {'$lte': benefits_to}})
-                    if count > 0:
-                        query[query_key] = {'$lte': benefits_to}
-                        exact_match["BENEFITS_AMOUNT"] = benefits_to
-                    else:
-                        flag_not_found["BENEFITS_AMOUNT"] = benefits_to        
-
-        if "MAX_MONEY_ATTRIBUTES" in prediction_result:
-            results = table.find(query).sort("value", -1).limit(1)
-
-        elif "MIN_MONEY_ATTRIBUTES" in prediction_result:
-            results = table.find(query).sort("value", 1).limit(1)
-        else:
-            results = table.find(query)
-        benefits_dict = DBQueryHandler.get_benefits_dict(results)
-        df = pd.DataFrame(benefits_dict)
-        return df, exact_match, flag_not_found
-
-    @staticmethod
-    def get_jobentries_dict(results):
-        """
-        Converts query results to a job entries dictionary.
-
-        Args:
-            results: The query results from the database.
-
-        Returns:
-            A dictionary representing the job entries.
-        """
-        jobentries_dict = {
-            "Client_Name": [],
-            "Our_Job_Title": [],
-            "Client_Job_Title": [],
-            "Candidate_Location": [],
-            "Annual_Salary": [],
-            "Currency": [],
-            "Date": [],
-        }
-        for result in results:
-            jobentries_dict["Client_Name"].append(result["client"])
-            jobentries_dict["Our_Job_Title"].append(result["jobTitle"])
-            jobentries_dict["Client_Job_Title"].append(result["jobgrade"]["name"])
-            jobentries_dict["Candidate_Location"].append(result["location"]["name"])
-            jobentries_dict["Annual_Salary"].append(result["salary"])
-            jobentries_dict["Currency"].append(result["currency"]["code"])
-            jobentries_dict["Date"].append(result["date"].date())
-        return jobentries_dict
-
+        return self.query_table(prediction_result, table_name)
 
     def get_jobentries_table(self, prediction_result, table_name):
         """
@@ -573,136 +196,8 @@ class DBQueryHandler:
             pandas.DataFrame: A DataFrame containing the retrieved job entries.
 
         """
-        query = {}
-        exact_match = {}
-        flag_not_found = {}
-        table = self.db[table_name]
-        for key in ["LOCATION", "LOCATION_GROUP", "JOB_TITLE", "CURRENCY", "CLIENT_NAME", 
-                    "MAX_MONEY_ATTRIBUTES", "MIN_MONEY_ATTRIBUTES", "AMOUNT_FROM", "AMOUNT_TO",
-                    "SALARY_AMOUNT"]:
-            if key in prediction_result:
-                value = prediction_result[key]
-                escaped_value = re.escape(value)
-                pattern = "^" + escaped_value.replace("/", "/\\s*") + "$"
-                pattern = re.compile(pattern, re.IGNORECASE)
-                if key == "CLIENT_NAME":
-                    query_key = "client"
-                    count = table.count_documents({query_key: pattern})
-                    if count > 0:
-                        query[query_key] = pattern
-                        exact_match[key] = value
-                    else:
-                        flag_not_found[key] = value
-
-                elif key == "SALARY_AMOUNT":
-                    query_key = "salary"
-                    salary_amount = prediction_result["SALARY_AMOUNT"]
-                    salary_amount = DBQueryHandler.extract_value(salary_amount)
-                    count = table.count_documents({query_key: salary_amount})
-                    if count > 0:
-                        query[query_key] = salary_amount
-                        exact_match[key] = salary_amount
-                    else:
-                        flag_not_found[key] = salary_amount
-
-                elif key == "CURRENCY":
-                    query_key = "currency.code"
-                    count = table.count_documents({query_key: pattern})
-                    if count > 0:
-                        query[query_key] = pattern
-                        exact_match[key] = value
-                    else:
-                        flag_not_found[key] = value
-
-                elif key == "JOB_TITLE":
-                    query_key = "jobTitle"
-                    count = table.count_documents({query_key: pattern})
-                    if count > 0:
-                        query[query_key] = pattern
-                        exact_match[key] = value
-                    else:
-                        flag_not_found[key] = value
-
-                elif key == "LOCATION":
-                    query_key = "location.name"
-                    count = table.count_documents({query_key: pattern})
-                    if count > 0:
-                        query[query_key] = pattern
-                        exact_match[key] = value
-                    else:
-                        flag_not_found[key] = value
-
-                elif key == "LOCATION_GROUP":
-                    query_key = "location.locationgroup.name"
-                    count = table.count_documents({query_key: pattern})
-                    print(count)
-                    print(pattern)
-                    if count > 0:
-                        query[query_key] = pattern
-                        exact_match[key] = value
-                    else:
-                        flag_not_found[key] = value
-
-                elif key =='AMOUNT_FROM':
-                    salary_from = prediction_result['AMOUNT_FROM']
-                    salary_from = DBQueryHandler.extract_value(salary_from)
-                    query_key = "salary"
-                    count = table.count_documents({query_key: {"$gte" : salary_from}})
-                    if count > 0:
-                        query[query_key] = {'$gte': salary_from}
-                        exact_match["SALARY_AMOUNT"] = salary_from
-                    else:
-                        flag_not_found["SALARY_AMOUNT"] = salary_from
-
-                elif key == 'AMOUNT_TO':
-                    salary_to = prediction_result['AMOUNT_TO']
-                    salary_to = DBQueryHandler.extract_value(salary_to)
-                    query_key = "salary"
-                    count = table.count_documents({query_key: {"$lte" : salary_to}})
-                    if count > 0:
-                        query[query_key] = {'$lte': salary_to}
-                        exact_match["SALARY_AMOUNT"] = salary_to
-                    else:
-                        flag_not_found["SALARY_AMOUNT"] = salary_to
-
-        if "MAX_MONEY_ATTRIBUTES" in prediction_result:
-            job_results = table.find(query).sort("salary", -1).limit(1)
-        elif "MIN_MONEY_ATTRIBUTES" in prediction_result:
-            job_results = table.find(query).sort("salary", 1).limit(1)
-        else:
-            job_results = table.find(query)
-        jobentries_dict = DBQueryHandler.get_jobentries_dict(job_results)
-        df = pd.DataFrame(jobentries_dict)
-        return df, exact_match, flag_not_found
-    
-    @staticmethod
-    def get_candidates_dict(results):
-        candidates_dict = {
-            "Client_Name": [],
-            "Our_Job_Title": [],
-            "Client_Job_Title": [],
-            "Skill": [],
-            "Client_Location": [],
-            "Candidate_Location": [],
-            "Salary_From": [],
-            "Salary_To": [],
-            "Currency": [],
-            "Date": [],
-        }
-        for result in results:
-            candidates_dict["Client_Name"].append(result["client"]["name"])
-            candidates_dict["Our_Job_Title"].append(result["jobTitle"])
-            candidates_dict["Client_Job_Title"].append(result["jobTitle"])
-            candidates_dict["Skill"].append(result["skill_code"])
-            candidates_dict["Client_Location"].append(result["location"]["name"])
-            candidates_dict["Candidate_Location"].append(result["location"]["name"])
-            candidates_dict["Salary_From"].append(result["salary_from"])
-            candidates_dict["Salary_To"].append(result["salary_to"])
-            candidates_dict["Currency"].append(result["currency"]["code"])
-            candidates_dict["Date"].append(result["date"].date())
-        return candidates_dict
-
-    
+        return self.query_table(prediction_result, table_name)
+
     def get_candidate_payscale(self, prediction_result, table_name):
         """
         Retrieves candidate pay scale information from a database table based on the provided prediction result.
@@ -711,10 +206,10 @@ class DBQueryHandler:
             prediction_result (dict): A dictionary containing predicted values for specific keys.
                 - 'CLIENT_NAME': The client name value.
                 - 'JOB_TITLE': The job title value.
-                - 'CLIENT_TYPE': The client type/skill value.
+                - 'SKILLS': The skill value.
                 - 'LOCATION': The location value.
-                - 'SALARY_FROM': The lower limit of the salary range value.
-                - 'SALARY_TO': The upper limit of the salary range value.
+                - 'AMOUNT_FROM': The lower limit of the salary range value.
+                - 'AMOUNT_TO': The upper limit of the salary range value.
                 - 'CURRENCY': The currency value.
             table_name (str): The name of the database table to query.
 
@@ -722,112 +217,16 @@ class DBQueryHandler:
             pandas.DataFrame: A DataFrame containing the retrieved candidate pay scale information.
 
         """
-        query = {}
-        exact_match = {}
-        flag_not_found = {}
-        table = self.db[table_name]
-        for key in ['CLIENT_NAME', 'JOB_TITLE', 'SKILLS', 'LOCATION', 'LOCATION_GROUP',
-                    'CURRENCY', 'MAX_MONEY_ATTRIBUTES', 'MIN_MONEY_ATTRIBUTES',
-                    'AMOUNT_FROM', 'AMOUNT_TO']:
-            if key in prediction_result:
-                value = prediction_result[key]
-                escaped_value = re.escape(value)
-                pattern = "^" + escaped_value.replace("/", "/\\s*") + "$"
-                pattern = re.compile(pattern, re.IGNORECASE)
-                if key == 'CLIENT_NAME':
-                    query_key = 'client.name'
-                    count = table.count_documents({query_key: pattern})
-                    if count > 0:
-                        query[query_key] = pattern
-                        exact_match[key] = value
-                    else:
-                        flag_not_found[key] = value
-
-                elif key == 'CURRENCY':
-                    query_key = 'currency.code'
-                    count = table.count_documents({query_key: pattern})
-                    if count > 0:
-                        query[query_key] = pattern
-                        exact_match[key] = value
-                    else:
-                        flag_not_found[key] = value
-
-                elif key == 'JOB_TITLE':
-                    query_key = 'jobTitle'
-                    count = table.count_documents({query_key: pattern})
-                    if count > 0:
-                        query[query_key] = pattern
-                        exact_match[key] = value
-                    else:
-                        flag_not_found[key] = value
-
-                elif key == 'LOCATION':
-                    query_key = 'location.name'
-                    count = table.count_documents({query_key: pattern})
-                    if count > 0:
-                        query[query_key] = pattern
-                        exact_match[key] = value
-                    else:
-                        flag_not_found[key] = value
-
-                elif key == "LOCATION_GROUP":
-                    query_key = "location.locationgroup.name"
-                    count = table.count_documents({query_key: pattern})
-                    if count > 0:
-                        query[query_key] = pattern
-                        exact_match[key] = value
-                    else:
-                        flag_not_found[key] = value
-
-                elif key == 'SKILLS':
-                    query_key = 'skill_code'
-                    count = table.count_documents({query_key: pattern})
-                    if count > 0:
-                        query[query_key] = pattern
-                        exact_match[key] = value
-                    else:
-                        flag_not_found[key] = value
-
-                elif key == 'AMOUNT_FROM':
-                    salary_from = prediction_result['SALARY_FROM']
-                    salary_from = DBQueryHandler.extract_value(salary_from)
-                    query_key = "salary_from"
-                    count = table.count_documents({query_key: {"$gte" : salary_from}})
-                    if count > 0:
-                        query[query_key] = {'$gte': salary_from}
-                        exact_match["SALARY_FROM"] = salary_from
-                    else:
-                        flag_not_found["SALARY_FROM"] = salary_from
-
-                elif key == 'AMOUNT_TO':
-                    salary_to = prediction_result['SALARY_TO']
-                    salary_to = DBQueryHandler.extract_value(salary_to)
-                    query_key = 'salary_to'
-                    count = table.count_documents({query_key: {"$lte" : salary_to}})
-                    if count > 0:
-                        query[query_key] = {'$lte': salary_to}
-                        exact_match["SALARY_TO"] = salary_to
-                    else:
-                        flag_not_found["SALARY_TO"] = salary_to
-
-        if "MAX_MONEY_ATTRIBUTES" in prediction_result:
-            job_results = table.find(query).sort("salary_to", -1).limit(1)
-        elif "MIN_MONEY_ATTRIBUTES" in prediction_result:
-            job_results = table.find(query).sort("salary_to", 1).limit(1)
-        else:
-            job_results = table.find(query)
-
-        candidates_dict = DBQueryHandler.get_candidates_dict(job_results)
-        df = pd.DataFrame(candidates_dict)
-        return df, exact_match, flag_not_found
-    
+        return self.query_table(prediction_result, table_name)
+
     def get_recommendation_df(self, faiss_index_ids):
 
         table_name = "jobsearch_vectordb"
         table = self.db[table_name]
         query = {"faiss_index_id": {"$in": faiss_index_ids}}
-        matching_documents = list(table.find(query))
-        df = pd.DataFrame(matching_documents)
+        with stage("dataframe"):
+            matching_documents = list(table.find(query))
+            df = pd.DataFrame(matching_documents)
         return df
   
 
@@ -0,0 +1,166 @@
+import time
+import threading
+import config as cfg
+from admission import admit, released
+from collections import OrderedDict
+from lazy_imports import lazy_import
+from tracing import metrics, stage
+
+np = lazy_import("numpy")
+faiss = lazy_import("faiss")
+
+# Vector entity linking against the canonical values of the collections.
+#
+# For each table and linked entity (cfg.LINKED_ENTITIES: job titles, benefit names,
+# skills) the distinct values of the field the entity is matched on (cfg.entity_fields,
+# e.g. jobgrade.name, job_title, name, skill_code) are embedded with the search
+# recommender's sentence transformer into a small inner-product FAISS index. An entity
+# value without an exact match is linked to its nearest canonical values, which become
+# the suggestions for that value, so respond_query does not need the 100-neighbour
+# posting search when every missing value could be linked.
+
+
+def normalize_value(value):
+    return " ".join(str(value).lower().split())
+
+
+class CanonicalCatalog:
+    """
+    The distinct values of one table field and their unit-length embeddings.
+
+    Attributes:
+        values (list): Canonical values, in index order.
+        index: faiss.IndexFlatIP over the value embeddings.
+    """
+
+    def __init__(self, values, vectors):
+        self.values = values
+        self.index = faiss.IndexFlatIP(vectors.shape[1])
+        self.index.add(vectors)
+
+    def nearest(self, vector, k, threshold):
+        scores, ids = self.index.search(vector, min(k, len(self.values)))
+        return [(self.values[i], float(score)) for score, i in zip(scores[0], ids[0])
+                if i >= 0 and score >= threshold]
+
+
+class EntityLinker:
+    """
+    Links unmatched entity values to canonical catalog values by embedding similarity.
+
+    The catalogs are rebuilt from the database every `refresh_interval` seconds, so new
+    job grades or benefits become linkable without a restart.
+
+    Attributes:
+        encoder: An object with a SentenceTransformer-style `encode(sentences)` method.
+        entities (tuple): The linked entity keys.
+        k (int): Maximum suggestions per value.
+        threshold (float): Minimum cosine similarity of a suggestion.
+        catalogs (dict): (table name, entity) -> CanonicalCatalog.
+    """
+
+    def __init__(self, encoder, entities=cfg.LINKED_ENTITIES, k=cfg.ENTITY_LINK_CANDIDATES,
+                 threshold=cfg.ENTITY_LINK_THRESHOLD, cache_size=cfg.ENTITY_LINK_CACHE_SIZE):
+        self.encoder = encoder
+        self.entities = tuple(entities)
+        self.k = k
+        self.threshold = threshold
+        self.cache_size = cache_size
+        self.catalogs = {}
+        self.built_at = None
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self):
+        return self.built_at is not None
+
+    def catalog_fields(self):
+        return [(table_name, entity, field) for table_name, fields in cfg.entity_fields.items()
+                for entity, field in fields.items() if entity in self.entities]
+
+    def encode(self, texts):
+        # Linking runs inside respond_query; its DB slot is not held while waiting for the encoder.
+        with released("db"), admit("encoder"):
+            vectors = np.array(self.encoder.encode(list(texts)), dtype="float32").reshape(len(texts), -1)
+        faiss.normalize_L2(vectors)
+        return vectors
+
+    def build(self, db):
+        values = {}
+        for table_name, entity, field in self.catalog_fields():
+            values[(table_name, entity)] = sorted({value for value in db[table_name].distinct(field)
+                                                   if isinstance(value, str) and value.strip()})
+        # A value shared by several catalogs (e.g. job grades) is encoded once.
+        unique_values = sorted(set().union(*values.values())) if values else []
+        vectors = {}
+        if unique_values:
+            encoded = self.encode(unique_values)
+            vectors = {value: encoded[i] for i, value in enumerate(unique_values)}
+        catalogs = {key: CanonicalCatalog(catalog_values, np.stack([vectors[value] for value in catalog_values]))
+                    for key, catalog_values in values.items() if catalog_values}
+        with self._lock:
+            self.catalogs = catalogs
+            self._cache.clear()
+            self.built_at = time.time()
+        metrics.inc("entity_link_builds_total", help_text="Entity linking catalog builds")
+        print(f"Entity linking catalogs built: {sum(len(c.values) for c in catalogs.values())} values, "
+              f"{len(unique_values)} embeddings")
+
+    def run(self, db_factory, refresh_interval=cfg.ENTITY_LINK_REFRESH_INTERVAL):
+        db = db_factory()
+        if self.ready:
+            # Built before the thread started.
+            time.sleep(refresh_interval)
+        while True:
+            try:
+                self.build(db)
+            except Exception as e:
+                print(f"Entity linking catalog build failed: {e!r}")
+            time.sleep(refresh_interval)
+
+    def start(self, db_factory):
+        threading.Thread(target=self.run, args=(db_factory,), name="entity-linker", daemon=True).start()
+
+    def link(self, table_name, entity, value):
+        """
+        The canonical values of `table_name` nearest to `value`, most similar first.
+
+        Returns:
+            list: Up to `k` values with a cosine similarity of at least `threshold`.
+        """
+        catalog = self.catalogs.get((table_name, entity))
+        if catalog is None or not isinstance(value, str):
+            return []
+        key = (table_name, entity, normalize_value(value))
+        with self._lock:
+            options = self._cache.get(key)
+            if options is not None:
+                self._cache.move_to_end(key)
+                return options
+        with stage("entity_link"):
+            nearest = catalog.nearest(self.encode([value]), self.k, self.threshold)
+        options = [candidate for candidate, _ in nearest if normalize_value(candidate) != key[2]]
+        with self._lock:
+            self._cache[key] = options
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return options
+
+    def link_entities(self, table_name, flag_not_found):
+        """
+        Link the linkable entities of `flag_not_found` (entity -> value not found).
+
+        Returns:
+            dict: entity -> suggested canonical values, for the entities that could be linked.
+        """
+        linked = {}
+        for entity, value in flag_not_found.items():
+            if entity in self.entities:
+                options = self.link(table_name, entity, value)
+                if options:
+                    linked[entity] = options
+        metrics.inc("entity_link_requests_total", help_text="Responses with unmatched entities looked up in the catalogs")
+        if linked and len(linked) == len(flag_not_found):
+            metrics.inc("entity_link_resolved_total", help_text="Responses whose unmatched entities were all linked")
+        return linked
@@ -0,0 +1,145 @@
+import os
+import threading
+import contextvars
+import config as cfg
+from concurrent.futures import ThreadPoolExecutor
+from dbquery_handler import DBQueryHandler
+from tracing import metrics
+from rule_based_ner import DEGRADED_KEY
+from utils import ROUTES, route_table
+
+# Existence checks started while the NER completion is still streaming.
+#
+# Each get_*_table method first runs count_documents({field: pattern}) for every text entity
+# to decide between exact_match and flag_not_found. With streaming NER these checks are
+# submitted as soon as an entity has been parsed, for every table the query may still be
+# routed to, and the handler's own count_documents calls pick up the results.
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+def prefetch_executor():
+    """
+    The prefetch thread pool of this process, created on first use.
+
+    A pool created before os.fork (prefork_server.py) would have no threads in the
+    forked workers, so each process gets its own.
+    """
+    global _executor, _executor_pid
+    with _executor_lock:
+        if _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(max_workers=cfg.NER_PREFETCH_WORKERS, thread_name_prefix="prefetch")
+            _executor_pid = os.getpid()
+        return _executor
+
+
+def candidate_tables(entities):
+    """
+    The tables a query can still be routed to, given the entities seen so far.
+    """
+    tables = []
+    for table_name, keys in ROUTES:
+        tables.append(table_name)
+        if any(key in entities for key in keys):
+            break
+    return tables
+
+
+class PrefetchedCollection:
+    """
+    A collection whose single-pattern count_documents calls are answered from prefetches.
+    """
+
+    def __init__(self, collection, counts):
+        self.collection = collection
+        self.counts = counts
+
+    def count_documents(self, query, *args, **kwargs):
+        if len(query) == 1 and not args and not kwargs:
+            (field, pattern), = query.items()
+            future = self.counts.get((field, getattr(pattern, "pattern", None)))
+            if future is not None and not future.cancelled():
+                metrics.inc("ner_prefetch_hits_total", help_text="Existence checks answered by a prefetch")
+                return future.result()
+        return self.collection.count_documents(query, *args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.collection, name)
+
+
+class PrefetchedDatabase:
+    def __init__(self, db, counts):
+        self.db = db
+        self.counts = counts
+
+    def __getitem__(self, name):
+        return PrefetchedCollection(self.db[name], self.counts.get(name, {}))
+
+    def __getattr__(self, name):
+        return getattr(self.db, name)
+
+
+class EntityPrefetcher:
+    """
+    Starts the existence checks of entities as they arrive from the NER stream.
+
+    Attributes:
+        db: The database of the request's DBQueryHandler.
+        counts (dict): table -> {(field, pattern): Future of the count}.
+    """
+
+    def __init__(self, db, executor=None):
+        self.db = db
+        self.executor = executor or prefetch_executor()
+        self.entities = {}
+        self.counts = {}
+
+    def prefetch(self, key, value):
+        self.entities[key] = value
+        if not isinstance(value, str):
+            return
+        pattern = DBQueryHandler.entity_pattern(value)
+        for table_name in candidate_tables(self.entities):
+            field = cfg.entity_fields[table_name].get(key)
+            if field is None:
+                continue
+            metrics.inc("ner_prefetch_checks_total", help_text="Existence checks started during NER streaming")
+            context = contextvars.copy_context()
+            self.counts.setdefault(table_name, {})[(field, pattern.pattern)] = self.executor.submit(
+                context.run, self.db[table_name].count_documents, {field: pattern})
+
+    def cancel_except(self, table_name):
+        """
+        Cancel the checks of every table other than `table_name` (None: all tables) that
+        have not started yet, once the query has been routed.
+        """
+        for other_table, counts in self.counts.items():
+            if other_table == table_name:
+                continue
+            for future in counts.values():
+                if future.cancel():
+                    metrics.inc("ner_prefetch_cancelled_total", help_text="Existence checks cancelled after routing")
+
+    def database(self):
+        return PrefetchedDatabase(self.db, self.counts)
+
+
+def extract_with_prefetch(ner_obj, query, query_handler):
+    """
+    Stream the entities of `query` and prefetch their existence checks into `query_handler`.
+
+    Returns:
+        dict: The entities, as returned by NamedEntityExtractor.extract_named_entities.
+    """
+    prefetcher = EntityPrefetcher(query_handler.db)
+    ner_response = ner_obj.stream_named_entities(query, on_entity=prefetcher.prefetch)
+    # process_query only queries the routed table; degraded responses with unclassified
+    # words are answered from FAISS alone (see utils.respond_query).
+    if ner_response.get(DEGRADED_KEY):
+        prefetcher.cancel_except(None)
+    else:
+        prefetcher.cancel_except(route_table(ner_response))
+    query_handler.db = prefetcher.database()
+    return ner_response
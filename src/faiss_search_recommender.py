@@ -1,22 +1,149 @@
-import faiss
-import numpy as np
-from sentence_transformers import SentenceTransformer
+import os
+import time
+import queue
+import weakref
+import threading
+import config as cfg
+from collections import OrderedDict
+from admission import PRIORITIES, admit, released, request_context
+from concurrent.futures import Future
+from lazy_imports import lazy_import
+from tracing import metrics, stage
+
+# torch (through sentence_transformers) and faiss are only imported when a recommender
+# is built, so importing this module stays cheap.
+np = lazy_import("numpy")
+faiss = lazy_import("faiss")
+sentence_transformers = lazy_import("sentence_transformers")
 
 class SearchRecommender:
-    def __init__(self, model_name, faiss_index_path):
+    """
+    Recommends similar job postings by searching the FAISS index with the query embedding.
+
+    Concurrent calls to `recommend_faiss_index` are coalesced: requests arriving within
+    `batch_window` seconds (or until `max_batch_size` requests are waiting) are encoded
+    with a single `SentenceTransformer.encode` call and searched with a single
+    `index.search` call, and each caller receives its own row of the result. Results
+    are kept in an LRU cache of `cache_size` queries.
+
+    With `shards` > 0 (or cfg.FAISS_SHARD_ADDRESSES set) the index is searched through a
+    ShardedIndex (see sharded_index.py) instead of one in-process index.
+    """
+
+    def __init__(self, model_name, faiss_index_path, batch_window=cfg.ENCODER_BATCH_WINDOW,
+                 max_batch_size=cfg.ENCODER_MAX_BATCH_SIZE, k=cfg.FAISS_TOP_K, model=None, index=None,
+                 cache_size=cfg.RECOMMENDATION_CACHE_SIZE, shards=cfg.FAISS_SHARDS):
         self.model_name = model_name
         self.faiss_index_path = faiss_index_path
-        self.model = SentenceTransformer(self.model_name)
-        self.fais_index = faiss.read_index(self.faiss_index_path)
+        # An already loaded model/index (e.g. the synthetic ones used by benchmarks) can be passed in.
+        self.model = model if model is not None else sentence_transformers.SentenceTransformer(self.model_name)
+        if index is None and cfg.FAISS_SHARD_ADDRESSES:
+            from sharded_index import ShardedIndex
+            index = ShardedIndex(addresses=cfg.FAISS_SHARD_ADDRESSES)
+        elif index is None and shards:
+            from sharded_index import ShardedIndex, shard_paths
+            index = ShardedIndex(shard_paths(self.faiss_index_path, shards))
+        self.fais_index = index if index is not None else faiss.read_index(self.faiss_index_path)
+        self.batch_window = batch_window
+        self.max_batch_size = max_batch_size
+        self.k = k
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._requests = queue.Queue()
+        self._worker = None
+        self._worker_lock = threading.Lock()
+        if hasattr(os, "register_at_fork"):
+            this = weakref.ref(self)
+            os.register_at_fork(after_in_child=lambda: this() is not None and this().after_fork())
+
+    def after_fork(self):
+        # The batcher thread does not survive os.fork (pre-fork workers), but the queue keeps
+        # its waiter state: a forked child starts with a fresh queue and its own batcher.
+        self._requests = queue.Queue()
+        self._worker = None
+        self._worker_lock = threading.Lock()
+        self._cache_lock = threading.Lock()
+
+    def search_batch(self, queries):
+        """
+        Encode and search several queries at once.
+
+        Args:
+            queries (list): The query strings.
+
+        Returns:
+            list: One list of neighbour ids per query.
+        """
+        metrics.inc("encoder_batches_total", help_text="Batched encode+search calls")
+        metrics.inc("encoder_batched_queries_total", len(queries), help_text="Queries encoded in batches")
+        # One encoder slot per batch, held only while the model and the index are working.
+        with admit("encoder"):
+            with stage("faiss.encode"):
+                query_vectors = self.model.encode(list(queries), batch_size=len(queries))
+                query_vectors = np.array(query_vectors).reshape(len(queries), -1).astype('float32')
+            with stage("faiss.search"):
+                distances, indices = self.fais_index.search(query_vectors, self.k)
+        return [neighbor_ids.tolist() for neighbor_ids in indices]
 
     def recommend_faiss_index(self, query):
-        query_vector = self.model.encode(query)
-        query_vector = np.array(query_vector).reshape(1, -1).astype('float32')
-        k = 100 
-        distances, indices = self.fais_index.search(query_vector, k)
-        neighbor_ids = indices[0]
-        return neighbor_ids.tolist()
-    
+        with self._cache_lock:
+            neighbor_ids = self._cache.get(query)
+            if neighbor_ids is not None:
+                self._cache.move_to_end(query)
+        if neighbor_ids is not None:
+            metrics.inc("recommendation_cache_hits_total", help_text="FAISS searches answered from cache")
+            return list(neighbor_ids)
+        # The caller's DB slot is free for other requests while the query is encoded.
+        with released("db"):
+            if not self.batch_window:
+                neighbor_ids = self.search_batch([query])[0]
+            else:
+                self._ensure_worker()
+                future = Future()
+                # Includes the time spent waiting for the batch window.
+                with stage("faiss.recommend"):
+                    self._requests.put((query, future, request_context.get()))
+                    neighbor_ids = future.result()
+        with self._cache_lock:
+            self._cache[query] = neighbor_ids
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return list(neighbor_ids)
 
+    def _ensure_worker(self):
+        with self._worker_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run_batches, name="faiss-batcher", daemon=True)
+                self._worker.start()
 
+    def _collect_batch(self):
+        batch = [self._requests.get()]
+        flush_at = time.monotonic() + self.batch_window
+        while len(batch) < self.max_batch_size:
+            remaining = flush_at - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._requests.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
 
+    def _run_batches(self):
+        while True:
+            batch = self._collect_batch()
+            # Identical queries in the same window are encoded once.
+            unique_queries = list(dict.fromkeys(query for query, _, _ in batch))
+            # The batch is admitted with the priority and deadline of its most urgent request.
+            contexts = [context for _, _, context in batch if context is not None]
+            request_context.set(min(contexts, key=lambda context: (PRIORITIES[context.priority], context.deadline))
+                                if contexts else None)
+            try:
+                results = dict(zip(unique_queries, self.search_batch(unique_queries)))
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+            for query, future, _ in batch:
+                future.set_result(list(results[query]))
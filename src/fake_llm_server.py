@@ -0,0 +1,103 @@
+import re
+import json
+import time
+import random
+import argparse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from rule_based_ner import RuleBasedEntityExtractor
+
+# A minimal OpenAI-compatible chat completion server for local testing.
+# It answers /v1/chat/completions with the rule based entities of the query in the prompt
+# and can inject latency and failures to exercise the LLMClient retry/hedging/breaker logic.
+#
+# python fake_llm_server.py --port 8099 --latency 0.2 --error-rate 0.1
+# OPENAI_API_BASE=http://127.0.0.1:8099/v1 uvicorn app:app
+
+extractor = RuleBasedEntityExtractor()
+
+
+class FakeChatCompletionHandler(BaseHTTPRequestHandler):
+    latency = 0.0
+    jitter = 0.0
+    error_rate = 0.0
+    malformed_rate = 0.0
+    token_latency = 0.0
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_stream(self, model, content, chunk_size=4):
+        # Server-sent events in the format of the OpenAI streaming API, a few characters per chunk.
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        for start in range(0, len(content), chunk_size):
+            chunk = {"id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": int(time.time()),
+                     "model": model, "choices": [{"index": 0, "finish_reason": None,
+                                                  "delta": {"content": content[start:start + chunk_size]}}]}
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            self.wfile.flush()
+            time.sleep(self.token_latency)
+        self.wfile.write(b"data: [DONE]\n\n")
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self.send_json(404, {"error": {"message": "Not found", "type": "invalid_request_error"}})
+            return
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        time.sleep(self.latency + random.uniform(0, self.jitter))
+        if random.random() < self.error_rate:
+            self.send_json(503, {"error": {"message": "Injected failure", "type": "server_error"}})
+            return
+        prompt = request["messages"][-1]["content"]
+        match = re.search(r'### Input Query: "(.*)"', prompt)
+        query = match.group(1) if match else prompt
+        if random.random() < self.malformed_rate:
+            content = "Sorry, I cannot help with that."
+        else:
+            content = json.dumps(extractor.extract_named_entities(query))
+        if request.get("stream"):
+            self.send_stream(request.get("model", "fake"), content)
+            return
+        self.send_json(200, {
+            "id": "chatcmpl-fake",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "fake"),
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": content}}],
+            "usage": {"prompt_tokens": len(prompt.split()), "completion_tokens": len(content.split()),
+                      "total_tokens": len(prompt.split()) + len(content.split())}
+        })
+
+
+def make_server(host="127.0.0.1", port=8099, latency=0.0, jitter=0.0, error_rate=0.0, malformed_rate=0.0,
+                token_latency=0.0):
+    handler = type("ConfiguredHandler", (FakeChatCompletionHandler,),
+                   {"latency": latency, "jitter": jitter, "error_rate": error_rate,
+                    "malformed_rate": malformed_rate, "token_latency": token_latency})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake OpenAI-compatible chat completion server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--latency", type=float, default=0.0, help="Base response latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Extra random latency in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with 503")
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="Fraction of non-JSON answers")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="Delay between streamed chunks in seconds")
+    args = parser.parse_args()
+    server = make_server(args.host, args.port, args.latency, args.jitter, args.error_rate, args.malformed_rate,
+                         args.token_latency)
+    print(f"Fake LLM server listening on http://{args.host}:{args.port}/v1")
+    server.serve_forever()
@@ -0,0 +1,141 @@
+import time
+import hashlib
+import threading
+import multiprocessing
+import config as cfg
+from collections import OrderedDict
+from tracing import metrics
+
+# Conditional requests (ETag / If-None-Match) for search results.
+#
+# The ETag of a response is a hash of its body and the current data version, a digest of
+# the document count and newest _id of every collection (polled by CollectionVersions).
+# Clients send it back in If-None-Match and get a 304 without a body when the result has
+# not changed. The ETag last sent for a (query, media type) at the current data version is
+# remembered for ETAG_PRECHECK_TTL seconds; a matching If-None-Match within that time is
+# answered with 304 before NER and the database lookups run. In-place updates that keep
+# counts and _ids unchanged are only picked up once the remembered ETag expires.
+
+VERSIONED_COLLECTIONS = list(cfg.table_views) + ["jobsearch_vectordb"]
+
+
+def content_etag(body, version=""):
+    digest = hashlib.blake2b(body, digest_size=12)
+    digest.update(version.encode())
+    # Weak, so the same ETag is valid for the compressed and uncompressed representations.
+    return f'W/"{digest.hexdigest()}"'
+
+
+def etag_matches(if_none_match, etag):
+    """
+    Weak comparison of an If-None-Match header with an ETag.
+    """
+    if not if_none_match or etag is None:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
+
+
+class CollectionVersions:
+    """
+    A digest of the collections' document counts and newest _ids, refreshed every `interval` seconds.
+
+    With `shared`, the version is kept in shared memory: the pre-fork master polls and the
+    workers forked from it read the same value without a polling thread of their own.
+    The version is None until the first poll has succeeded; no ETags are issued before.
+    """
+
+    def __init__(self, collections=VERSIONED_COLLECTIONS, interval=cfg.DATA_VERSION_INTERVAL, shared=False):
+        self.collections = collections
+        self.interval = interval
+        self._shared = multiprocessing.Array("c", 64) if shared else None
+        self._version = None
+
+    @property
+    def version(self):
+        if self._shared is not None:
+            with self._shared.get_lock():
+                return self._shared.value.decode() or None
+        return self._version
+
+    @version.setter
+    def version(self, value):
+        if self._shared is not None:
+            with self._shared.get_lock():
+                self._shared.value = value.encode()
+        else:
+            self._version = value
+
+    def compute(self, db):
+        digest = hashlib.blake2b(digest_size=8)
+        for name in self.collections:
+            collection = db[name]
+            if hasattr(collection, "estimated_document_count"):
+                count = collection.estimated_document_count()
+            else:
+                count = collection.count_documents({})
+            newest = list(collection.find({}, {"_id": 1}).sort("_id", -1).limit(1))
+            digest.update(f"{name}:{count}:{newest[0]['_id'] if newest else ''};".encode())
+        return digest.hexdigest()
+
+    def poll(self, db):
+        try:
+            self.version = self.compute(db)
+        except Exception as e:
+            print(f"Data version check failed: {e!r}")
+
+    def run(self, db_factory):
+        db = db_factory()
+        while True:
+            self.poll(db)
+            time.sleep(self.interval)
+
+    def start(self, db_factory):
+        threading.Thread(target=self.run, args=(db_factory,), name="data-version", daemon=True).start()
+
+
+class ETagStore:
+    """
+    The ETags last sent per (query, media type) and data version, for `ttl` seconds.
+    """
+
+    def __init__(self, capacity=cfg.ETAG_STORE_SIZE, ttl=cfg.ETAG_PRECHECK_TTL):
+        self.capacity = capacity
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, version):
+        with self._lock:
+            entry = self.entries.get(key)
+        if entry is None:
+            return None
+        etag, entry_version, stored_at = entry
+        if entry_version != version or time.monotonic() - stored_at > self.ttl:
+            return None
+        return etag
+
+    def put(self, key, version, etag):
+        with self._lock:
+            self.entries[key] = (etag, version, time.monotonic())
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
+
+    def precheck(self, key, version, if_none_match):
+        """
+        The remembered ETag of `key` if it matches `if_none_match`, else None.
+        """
+        etag = self.get(key, version)
+        if etag_matches(if_none_match, etag):
+            metrics.inc("etag_precheck_hits_total", help_text="304 responses sent without running the pipeline")
+            return etag
+        return None
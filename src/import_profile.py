@@ -0,0 +1,52 @@
+import sys
+import time
+import argparse
+import subprocess
+
+# Import-time profile of the service modules.
+#
+# Runs `python -X importtime` in a fresh interpreter for the given modules and prints
+# the slowest imports by cumulative and self time, plus the total wall time.
+#
+# python import_profile.py app --top 15
+# python import_profile.py utils dbquery_handler --budget 1.0   # exit 1 if slower than 1s
+
+
+def profile_imports(modules):
+    """
+    Import `modules` in a fresh interpreter with -X importtime.
+
+    Returns:
+        tuple: (wall time in seconds, list of (module, self_us, cumulative_us) rows).
+    """
+    code = "; ".join(f"import {module}" for module in modules)
+    started = time.perf_counter()
+    completed = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                               capture_output=True, text=True)
+    wall_time = time.perf_counter() - started
+    if completed.returncode != 0:
+        raise RuntimeError(completed.stderr.strip().splitlines()[-1])
+    rows = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((name.strip(), int(self_us), int(cumulative_us)))
+    return wall_time, rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import-time profile of service modules")
+    parser.add_argument("modules", nargs="+", help="Modules to import, e.g. app")
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--budget", type=float, default=None, help="Fail if the import takes longer (seconds)")
+    args = parser.parse_args()
+
+    wall_time, rows = profile_imports(args.modules)
+    print(f"{'cumulative ms':>14}{'self ms':>10}  module")
+    for name, self_us, cumulative_us in sorted(rows, key=lambda row: row[2], reverse=True)[:args.top]:
+        print(f"{cumulative_us / 1000:>14.1f}{self_us / 1000:>10.1f}  {name}")
+    print(f"\nImported {', '.join(args.modules)} in {wall_time:.3f}s (including interpreter start-up)")
+    if args.budget is not None and wall_time > args.budget:
+        print(f"Import budget of {args.budget:.3f}s exceeded")
+        sys.exit(1)
@@ -0,0 +1,349 @@
+import os
+import glob
+import time
+import argparse
+import multiprocessing
+import concurrent.futures
+import config as cfg
+from lazy_imports import lazy_import
+from query_plans import field_getter
+
+np = lazy_import("numpy")
+pd = lazy_import("pandas")
+faiss = lazy_import("faiss")
+pymongo = lazy_import("pymongo")
+json_util = lazy_import("bson.json_util")
+
+# Bulk build of the vector DB: faiss_index.bin (cfg.FAISS_INDEX_PATH), the
+# jobsearch_vectordb collection and data/vector_db_jobsearch.csv (cfg.VECTOR_DB_PATH).
+#
+# Every document of the six collections becomes one row of cfg.VECTOR_DB_COLUMNS (through
+# the column -> field mapping of cfg.table_specs) and one vector, the embedding of the row
+# rendered as text. Row i of the index is the row with faiss_index_id i.
+#
+# The run is planned once: the collections are split into chunks of --chunk-size documents
+# by _id. Chunks are read from MongoDB in the main process and embedded by a pool of
+# worker processes, each with its own model, which write straight into a memory-mapped
+# vectors.npy in the work directory. Completed chunks are recorded in manifest.json, so an
+# interrupted run picks up where it stopped when started again with the same work
+# directory. Documents added after the planning pass are picked up by the next full run.
+#
+# python ingest_vectordb.py --workers 8                # full rebuild, or resume
+# python ingest_vectordb.py --restart                  # discard the checkpoint and start over
+# python ingest_vectordb.py --encoder hashing --db-name benchmark --no-collection
+
+VECTOR_DB_COLLECTION = "jobsearch_vectordb"
+
+
+def document_row(table_name, document):
+    """
+    The vector DB row of a collection document; fields missing from the document are None.
+    """
+    row = dict.fromkeys(cfg.VECTOR_DB_COLUMNS)
+    for column, path in cfg.table_specs[table_name]["columns"].items():
+        try:
+            row[column] = field_getter(path)(document)
+        except (KeyError, TypeError):
+            pass
+    # Client and candidate location are the same place in every collection that has one of them.
+    row["Client_Location"] = row["Client_Location"] or row["Candidate_Location"]
+    row["Candidate_Location"] = row["Candidate_Location"] or row["Client_Location"]
+    return row
+
+
+def render_text(row):
+    # e.g. "Client Name Google, Our Job Title Manager, Client Location London, Annual Salary 85000, ..."
+    return ", ".join(f"{column.replace('_', ' ')} {value}" for column, value in row.items()
+                     if column in cfg.VECTOR_DB_COLUMNS and value is not None)
+
+
+def projection(table_name):
+    return dict.fromkeys(cfg.table_specs[table_name]["columns"].values(), 1)
+
+
+# Worker processes: one encoder each, loaded by the pool initializer.
+_encoder = None
+
+
+def load_encoder(encoder_name, model_name, threads):
+    global _encoder
+    if encoder_name == "hashing":
+        from synthetic_data import HashingEncoder
+        _encoder = HashingEncoder()
+        return
+    import torch
+    import sentence_transformers
+    torch.set_num_threads(threads)
+    _encoder = sentence_transformers.SentenceTransformer(model_name)
+
+
+def embedding_dimension():
+    return _encoder.get_sentence_embedding_dimension()
+
+
+def embed_chunk(vectors_path, start, texts, batch_size):
+    """
+    Encode `texts` and write their vectors to rows [start, start + len(texts)) of the memmap.
+    """
+    vectors = np.asarray(_encoder.encode(texts, batch_size=batch_size), dtype="float32").reshape(len(texts), -1)
+    memmap = np.load(vectors_path, mmap_mode="r+")
+    memmap[start:start + len(texts)] = vectors
+    memmap.flush()
+    return len(texts)
+
+
+class IngestionRun:
+    """
+    A restartable build of the vector DB, checkpointed in `work_dir`.
+
+    Attributes:
+        manifest (dict): The plan (chunks of each collection with their _id bounds and
+            faiss_index_id ranges), the completed chunks and the finished final steps.
+    """
+
+    def __init__(self, db, work_dir=cfg.INGEST_DIR, chunk_size=cfg.INGEST_CHUNK_SIZE, tables=None):
+        self.db = db
+        self.work_dir = work_dir
+        self.chunk_size = chunk_size
+        self.tables = list(tables or cfg.table_views)
+        self.manifest_path = os.path.join(work_dir, "manifest.json")
+        self.vectors_path = os.path.join(work_dir, "vectors.npy")
+        self.rows_dir = os.path.join(work_dir, "rows")
+        self.manifest = None
+
+    def save_manifest(self):
+        temporary_path = self.manifest_path + ".tmp"
+        manifest = {**self.manifest, "completed": sorted(self.manifest["completed"])}
+        with open(temporary_path, "w") as file:
+            file.write(json_util.dumps(manifest, indent=1))
+        os.replace(temporary_path, self.manifest_path)
+
+    def load_manifest(self):
+        if not os.path.exists(self.manifest_path):
+            return False
+        with open(self.manifest_path) as file:
+            self.manifest = json_util.loads(file.read())
+        self.manifest["completed"] = set(self.manifest["completed"])
+        return True
+
+    def plan(self):
+        """
+        Split the collections into chunks by _id, reading only the _id index.
+        """
+        chunks = []
+        total = 0
+        for table_name in self.tables:
+            started = time.perf_counter()
+            count = 0
+            lower = None
+            for document in self.db[table_name].find({}, {"_id": 1}).sort("_id", 1).batch_size(100000):
+                if count % self.chunk_size == 0:
+                    if lower is not None:
+                        chunks[-1]["upper"] = document["_id"]
+                    lower = document["_id"]
+                    chunks.append({"id": len(chunks), "table": table_name, "lower": lower, "upper": None,
+                                   "start": total + count, "size": 0})
+                chunks[-1]["size"] += 1
+                count += 1
+            total += count
+            print(f"{table_name}: {count} documents ({time.perf_counter() - started:.1f}s)")
+        return chunks, total
+
+    def prepare(self, restart=False, model_name=cfg.MODEL_NAME, encoder_name="sentence-transformers"):
+        os.makedirs(self.rows_dir, exist_ok=True)
+        if not restart and self.load_manifest():
+            if (self.manifest["model"], self.manifest["encoder"]) != (model_name, encoder_name):
+                raise ValueError(f"{self.work_dir} holds a run with {self.manifest['encoder']} "
+                                 f"{self.manifest['model']}; use --restart to start over")
+            print(f"Resuming: {len(self.manifest['completed'])}/{len(self.manifest['chunks'])} chunks embedded")
+            return
+        for path in glob.glob(os.path.join(self.rows_dir, "*.parquet")) + [self.vectors_path]:
+            if os.path.exists(path):
+                os.remove(path)
+        chunks, total = self.plan()
+        self.manifest = {"created_at": time.time(), "model": model_name, "encoder": encoder_name,
+                         "total": total, "dimension": None, "chunks": chunks, "completed": set(),
+                         "finished": []}
+        self.save_manifest()
+
+    def read_chunk(self, chunk):
+        query = {"_id": {"$gte": chunk["lower"]}}
+        if chunk["upper"] is not None:
+            query["_id"]["$lt"] = chunk["upper"]
+        cursor = self.db[chunk["table"]].find(query, projection(chunk["table"])).sort("_id", 1)
+        # Documents inserted into the range since planning are left for the next run.
+        return list(cursor.limit(chunk["size"]))
+
+    def rows_path(self, chunk):
+        return os.path.join(self.rows_dir, f"{chunk['id']:08d}.parquet")
+
+    def write_rows(self, chunk, documents):
+        rows = [document_row(chunk["table"], document) for document in documents]
+        # Saved with the chunk when it completes; the rows after it in the chunk's range stay unused.
+        chunk["written"] = len(rows)
+        for i, row in enumerate(rows):
+            row["faiss_index_id"] = chunk["start"] + i
+        df = pd.DataFrame(rows, columns=["faiss_index_id"] + cfg.VECTOR_DB_COLUMNS)
+        temporary_path = self.rows_path(chunk) + ".tmp"
+        df.to_parquet(temporary_path, index=False)
+        os.replace(temporary_path, self.rows_path(chunk))
+        return [render_text(row) for row in rows]
+
+    def embed(self, pool, batch_size=cfg.INGEST_BATCH_SIZE, max_pending=16):
+        """
+        Read, render and embed every chunk not completed yet, `max_pending` chunks at a time.
+        """
+        if self.manifest["dimension"] is None:
+            self.manifest["dimension"] = pool.submit(embedding_dimension).result()
+            self.save_manifest()
+        if not os.path.exists(self.vectors_path):
+            # Rows of documents deleted after planning stay zero; build_index leaves them out.
+            np.lib.format.open_memmap(self.vectors_path, mode="w+", dtype="float32",
+                                      shape=(max(self.manifest["total"], 1), self.manifest["dimension"])).flush()
+        pending_chunks = [chunk for chunk in self.manifest["chunks"] if chunk["id"] not in self.manifest["completed"]]
+        started = time.perf_counter()
+        embedded = 0
+        pending = {}
+
+        def collect(return_when):
+            nonlocal embedded
+            done, _ = concurrent.futures.wait(pending, return_when=return_when)
+            for future in done:
+                chunk = pending.pop(future)
+                embedded += future.result()
+                self.manifest["completed"].add(chunk["id"])
+            self.save_manifest()
+            elapsed = time.perf_counter() - started
+            print(f"{len(self.manifest['completed'])}/{len(self.manifest['chunks'])} chunks, "
+                  f"{embedded / max(elapsed, 1e-9):.0f} documents/s")
+
+        for chunk in pending_chunks:
+            texts = self.write_rows(chunk, self.read_chunk(chunk))
+            if texts:
+                future = pool.submit(embed_chunk, self.vectors_path, chunk["start"], texts, batch_size)
+                pending[future] = chunk
+            else:
+                self.manifest["completed"].add(chunk["id"])
+            if len(pending) >= max_pending:
+                collect(concurrent.futures.FIRST_COMPLETED)
+        if pending:
+            collect(concurrent.futures.ALL_COMPLETED)
+
+    def finish(self, step, function, *args):
+        # The final steps are checkpointed too, so a resumed run does not repeat them.
+        if step in self.manifest["finished"]:
+            return
+        started = time.perf_counter()
+        function(*args)
+        self.manifest["finished"].append(step)
+        self.save_manifest()
+        print(f"{step}: done ({time.perf_counter() - started:.1f}s)")
+
+    def written(self, chunk):
+        if "written" in chunk:
+            return chunk["written"]
+        # Checkpoints written before chunks recorded their row count.
+        path = self.rows_path(chunk)
+        return len(pd.read_parquet(path, columns=["faiss_index_id"])) if os.path.exists(path) else 0
+
+    def build_index(self, index_path, factory="Flat", train_size=100000, add_size=100000):
+        """
+        Build the index from the vectors of the rows actually written, in chunk order.
+
+        A chunk may hold fewer rows than planned (documents deleted after planning); its
+        unused vector rows are skipped, so the index ids are the compacted faiss_index_ids
+        that row_parts assigns and no zero vector can fill a search result.
+        """
+        vectors = np.load(self.vectors_path, mmap_mode="r")
+        ranges = [(chunk["start"], self.written(chunk)) for chunk in self.manifest["chunks"]]
+        ranges = [(start, count) for start, count in ranges if count]
+        index = faiss.index_factory(vectors.shape[1], factory, faiss.METRIC_L2)
+        if not index.is_trained:
+            rows = np.concatenate([np.arange(start, start + count) for start, count in ranges])
+            rng = np.random.default_rng(0)
+            sample = np.sort(rng.choice(rows, size=min(train_size, len(rows)), replace=False))
+            index.train(np.ascontiguousarray(vectors[sample]))
+        for start, count in ranges:
+            for offset in range(start, start + count, add_size):
+                index.add(np.ascontiguousarray(vectors[offset:min(offset + add_size, start + count)]))
+        os.makedirs(os.path.dirname(index_path) or ".", exist_ok=True)
+        faiss.write_index(index, index_path + ".tmp")
+        os.replace(index_path + ".tmp", index_path)
+
+    def row_parts(self):
+        # faiss_index_ids are renumbered without the gaps of deleted documents, as in build_index.
+        next_id = 0
+        for chunk in self.manifest["chunks"]:
+            if os.path.exists(self.rows_path(chunk)):
+                part = pd.read_parquet(self.rows_path(chunk))
+                part["faiss_index_id"] = np.arange(next_id, next_id + len(part))
+                next_id += len(part)
+                yield part
+
+    def write_csv(self, csv_path):
+        os.makedirs(os.path.dirname(csv_path) or ".", exist_ok=True)
+        temporary_path = csv_path + ".tmp"
+        header = True
+        with open(temporary_path, "w", newline="") as file:
+            for part in self.row_parts():
+                part.to_csv(file, index=False, header=header)
+                header = False
+        os.replace(temporary_path, csv_path)
+
+    def load_collection(self, name=VECTOR_DB_COLLECTION):
+        # Loaded into a staging collection and renamed over the old one, so searches never
+        # see a half-loaded collection.
+        staging = self.db[f"{name}_ingest"]
+        staging.drop()
+        for part in self.row_parts():
+            part = part.astype(object).where(part.notna(), None)
+            if "Date" in part:
+                part["Date"] = [pd.Timestamp(value).to_pydatetime() if value is not None else None
+                                for value in part["Date"]]
+            staging.insert_many(part.to_dict("records"))
+        staging.create_index("faiss_index_id")
+        staging.rename(name, dropTarget=True)
+
+    def run(self, workers=cfg.INGEST_WORKERS, threads=1, batch_size=cfg.INGEST_BATCH_SIZE,
+            model_name=cfg.MODEL_NAME, encoder_name="sentence-transformers", restart=False,
+            index_path=cfg.FAISS_INDEX_PATH, index_factory="Flat", csv_path=cfg.VECTOR_DB_PATH,
+            load_collection=True):
+        self.prepare(restart, model_name, encoder_name)
+        started = time.perf_counter()
+        # Spawned rather than forked: the parent holds a MongoClient and possibly torch threads.
+        with concurrent.futures.ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                initializer=load_encoder, initargs=(encoder_name, model_name, threads)) as pool:
+            # Two chunks per worker in flight: one being encoded, one queued behind it.
+            self.embed(pool, batch_size, max_pending=2 * workers)
+        print(f"Embedded {self.manifest['total']} documents in {time.perf_counter() - started:.1f}s")
+        self.finish("index", self.build_index, index_path, index_factory)
+        self.finish("csv", self.write_csv, csv_path)
+        if load_collection:
+            self.finish("collection", self.load_collection)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the FAISS index, jobsearch_vectordb and the vector DB CSV")
+    parser.add_argument("--work-dir", default=cfg.INGEST_DIR, help="Checkpoint directory (vectors, rows, manifest)")
+    parser.add_argument("--restart", action="store_true", help="Discard the checkpoint and plan a new run")
+    parser.add_argument("--tables", nargs="+", default=list(cfg.table_views))
+    parser.add_argument("--chunk-size", type=int, default=cfg.INGEST_CHUNK_SIZE, help="Documents per chunk")
+    parser.add_argument("--workers", type=int, default=cfg.INGEST_WORKERS, help="Embedding processes")
+    parser.add_argument("--threads", type=int, default=1, help="Torch threads per embedding process")
+    parser.add_argument("--batch-size", type=int, default=cfg.INGEST_BATCH_SIZE, help="Encoder batch size")
+    parser.add_argument("--model", default=cfg.MODEL_NAME)
+    parser.add_argument("--encoder", choices=["sentence-transformers", "hashing"], default="sentence-transformers",
+                        help="hashing: the model-free HashingEncoder of synthetic_data.py, for tests")
+    parser.add_argument("--index", default=cfg.FAISS_INDEX_PATH)
+    parser.add_argument("--index-factory", default="Flat", help="faiss.index_factory string")
+    parser.add_argument("--csv", default=cfg.VECTOR_DB_PATH)
+    parser.add_argument("--no-collection", action="store_true", help="Do not replace jobsearch_vectordb")
+    parser.add_argument("--mongo-url", default=cfg.MONGODB_URL)
+    parser.add_argument("--db-name", default=cfg.DB_NAME)
+    args = parser.parse_args()
+
+    db = pymongo.MongoClient(args.mongo_url)[args.db_name]
+    IngestionRun(db, args.work_dir, args.chunk_size, args.tables).run(
+        args.workers, args.threads, args.batch_size, args.model, args.encoder, args.restart,
+        args.index, args.index_factory, args.csv, not args.no_collection)
@@ -1,16 +1,37 @@
 import json
-import openai
+import threading
 import config as cfg
+from admission import admit
+from collections import OrderedDict
 from json import JSONDecodeError
+from llm_client import LLMClient, LLMError
+from rule_based_ner import DEGRADED_KEY, RuleBasedEntityExtractor
+from streaming_json import IncrementalObjectParser
+from tracing import current_trace, metrics, record, stage
 
 
 
 class NamedEntityExtractor:
+    """
+    Extracts job search entities from a query with GPT-4.
 
-    openai.api_key = open(cfg.OPENAI_API_PATH, "r").read().strip('\n')
-    def __init__(self):
-        self.model_name = "gpt-4"
+    The LLM is reached through an LLMClient (deadlines, retries, hedging and a circuit
+    breaker). Results are cached by normalised query text and cache hits skip the LLM.
+    With a SemanticEntityCache, paraphrases of earlier queries skip the LLM as well.
+    When the LLM cannot answer, the rule based extractor is used instead and the entities
+    are marked as degraded (see rule_based_ner.DEGRADED_KEY).
+    """
+
+    def __init__(self, llm_client=None, fallback_extractor=None, cache_size=cfg.NER_CACHE_SIZE,
+                 semantic_cache=None):
+        self.model_name = cfg.LLM_MODEL_NAME
         self.role = "user"
+        self.llm_client = llm_client or LLMClient(model_name=self.model_name)
+        self.fallback_extractor = fallback_extractor or RuleBasedEntityExtractor()
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self.semantic_cache = semantic_cache
 
     def filter_json(self, text):
         start_pos = text.find("{")
@@ -18,13 +39,12 @@ class NamedEntityExtractor:
         json_string = text[start_pos:end_pos]
         return json_string
 
-    def extract_named_entities(self, query):
-        self.query = query
-        completion = openai.ChatCompletion.create(
-            model=self.model_name,
-            messages=[
-                {"role": self.role,
-                "content": f"""You are a NER Extraction Bot and you will also extract entities which are similar to the given entities. 
+    @staticmethod
+    def normalize_query(query):
+        return " ".join(query.lower().split())
+
+    def build_prompt(self, query):
+        return f"""You are a NER Extraction Bot and you will also extract entities which are similar to the given entities. 
                 ### Named entities to extract:
 
                 JOB: Keywords similar to the words jobs, jobtitle, jobtitles, job titles, vacancies, job vacancies, opportunities, job listings, employment opportunities, employments mentioned in the query
@@ -76,7 +96,7 @@ class NamedEntityExtractor:
 
                 These are examples on how the output should be like. They should be in a JSON Format even if no named entites are found.
 
-                ### Input Query: "{self.query}"
+                ### Input Query: "{query}"
 
                 ### Instructions: 
                 For the given input query, correct the spelling of the query and return the corrected query if it has a spelling mistake and then extract NER.
@@ -105,26 +125,182 @@ class NamedEntityExtractor:
                 MAX_MONEY_ATTRIBUTES: highest, greatest, biggest, best, strongest, maximum, top
                 MIN_MONEY_ATTRIBUTES: lowest, worst, least, smallest, weakest, minimum, bottom
                 DONOT extract 'highest salary', 'lowest salary' as MAX_MONEY_ATTRIBUTES or MIN_MONEY_ATTRIBUTES
-                """}
-            ],
-            max_tokens=256,
-            temperature=0.05,
-            top_p=1,
-            frequency_penalty=0,
-            presence_penalty=0
-        )
+                """
+
+    def parse_completion(self, completion):
+        """
+        Parse a chat completion into an entity dictionary.
+
+        Raises:
+            ValueError: If the completion does not contain a JSON object, so that the
+                LLMClient retries the call instead of silently degrading.
+        """
         response = completion['choices'][0]['message']['content']
-        # Assuming you have already executed the completion and stored the result in the 'completion' variable
         tokens_used = completion['usage']['total_tokens']
-        print("Total tokens used:", tokens_used)
+        metrics.inc("llm_tokens_total", tokens_used, help_text="Tokens used by NER completions")
+        json_response = json.loads(self.filter_json(response))
+        if not isinstance(json_response, dict):
+            raise JSONDecodeError("Expected a JSON object", response, 0)
+        # Extract keys with non-None values
+        return {key: value for key, value in json_response.items() if value is not None and value != ""}
+
+    def remember(self, query, entities, source="llm"):
+        """
+        Cache the entities of `query`.
+
+        Args:
+            source (str): Where the entities came from: "llm", or "semantic" when copied
+                from a similar query in the semantic cache (see `source_of`).
+        """
+        key = self.normalize_query(query)
+        with self._cache_lock:
+            self.cache[key] = (entities, source)
+            self.cache.move_to_end(key)
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+
+    def lookup(self, query):
+        key = self.normalize_query(query)
+        with self._cache_lock:
+            entry = self.cache.get(key)
+            if entry is not None:
+                self.cache.move_to_end(key)
+        return dict(entry[0]) if entry is not None else None
+
+    def source_of(self, query):
+        """
+        The source of the cached entities of `query` ("llm" or "semantic"), or None when
+        they are not cached, e.g. because they came from the rule based fallback.
+        """
+        with self._cache_lock:
+            entry = self.cache.get(self.normalize_query(query))
+        return entry[1] if entry is not None else None
+
+    def semantic_lookup(self, query):
+        """
+        Look `query` up in the semantic cache.
+
+        Returns:
+            tuple: (cached entities or None, query embedding or None).
+        """
+        if self.semantic_cache is None:
+            return None, None
+        try:
+            with stage("ner.semantic_cache"):
+                vector = self.semantic_cache.encode(query)
+                return self.semantic_cache.lookup(query, vector), vector
+        except Exception as e:
+            print(f"Semantic NER cache unavailable: {e!r}")
+            return None, None
+
+    def fallback(self, query, known=None):
+        """
+        The rule based entities of `query`, marked as degraded (see rule_based_ner.DEGRADED_KEY).
+
+        Args:
+            known (dict, optional): Entities already streamed from the LLM; their words count as classified.
+        """
+        entities = self.fallback_extractor.extract_named_entities(query)
+        if known:
+            entities = {**entities, **known}
+        entities[DEGRADED_KEY] = RuleBasedEntityExtractor.unclassified_words(query, entities)
+        return entities
+
+    def cached_entities(self, query):
+        """
+        Look `query` up in the exact and the semantic cache.
+
+        Returns:
+            tuple: (cached entities or None, query embedding for the semantic cache or None).
+        """
+        cached = self.lookup(query)
+        if cached is not None:
+            metrics.inc("ner_cache_hits_total", help_text="NER calls answered from the entity cache")
+            return cached, None
+        cached, query_vector = self.semantic_lookup(query)
+        if cached is not None:
+            metrics.inc("ner_semantic_cache_hits_total", help_text="NER calls answered from the semantic cache")
+            self.remember(query, cached, source="semantic")
+        return cached, query_vector
+
+    def completion_params(self):
+        return {"max_tokens": 256, "temperature": 0.05, "top_p": 1, "frequency_penalty": 0, "presence_penalty": 0}
+
+    def extract_named_entities(self, query):
+        self.query = query
+        cached, query_vector = self.cached_entities(query)
+        if cached is not None:
+            return cached
+        messages = [{"role": self.role, "content": self.build_prompt(query)}]
         try:
-            json_response = self.filter_json(response)
-            json_response = json.loads(json_response)
-            # Extract keys with non-None values
-            final_json_response = {key: value for key, value in json_response.items() if value is not None and value != ""}
-            print(final_json_response)
-            return final_json_response
-        except JSONDecodeError as e:
-            return {"query": self.query}
+            with admit("llm"):
+                final_json_response = self.llm_client.complete(
+                    messages,
+                    parse=self.parse_completion,
+                    **self.completion_params()
+                )
+        except LLMError as e:
+            print(f"NER falling back to rule based extraction: {e}")
+            metrics.inc("ner_fallbacks_total", help_text="NER calls answered without the LLM")
+            return self.fallback(query)
+        final_json_response.setdefault("query", query)
+        print(final_json_response)
+        self.remember(query, final_json_response)
+        if query_vector is not None:
+            self.semantic_cache.add(query, final_json_response, query_vector)
+        return final_json_response
+
+    def stream_named_entities(self, query, on_entity=None):
+        """
+        Extract entities from a streamed completion.
+
+        `on_entity(key, value)` is called for every entity as soon as its value has been
+        parsed, so callers can start database work before the LLM has finished. If the
+        stream fails, the rule based entities that were not streamed yet are added.
 
+        Returns:
+            dict: All entities, as returned by `extract_named_entities`.
+        """
+        self.query = query
+        entities = {}
+
+        def emit(key, value):
+            if value is None or value == "" or key in entities:
+                return
+            entities[key] = value
+            if on_entity is not None:
+                on_entity(key, value)
 
+        cached, query_vector = self.cached_entities(query)
+        if cached is not None:
+            for key, value in cached.items():
+                emit(key, value)
+            return entities
+        messages = [{"role": self.role, "content": self.build_prompt(query)}]
+        parser = IncrementalObjectParser()
+        trace = current_trace()
+        chunks = 0
+        try:
+            with admit("llm"):
+                for content in self.llm_client.stream(messages, **self.completion_params()):
+                    # Streamed completions carry no usage; every chunk is about one token.
+                    chunks += 1
+                    for key, value in parser.feed(content):
+                        if not entities and trace is not None:
+                            record("ner.first_entity", trace.elapsed())
+                        emit(key, value)
+            if not parser.done:
+                raise LLMError("Streamed completion did not contain a complete JSON object")
+        except LLMError as e:
+            print(f"NER stream falling back to rule based extraction: {e}")
+            metrics.inc("ner_fallbacks_total", help_text="NER calls answered without the LLM")
+            for key, value in self.fallback(query, known=entities).items():
+                emit(key, value)
+            return entities
+        finally:
+            metrics.inc("llm_tokens_total", chunks, help_text="Tokens used by NER completions")
+        entities.setdefault("query", query)
+        self.remember(query, entities)
+        if query_vector is not None:
+            self.semantic_cache.add(query, entities, query_vector)
+        return entities
@@ -0,0 +1,44 @@
+import sys
+import types
+import importlib
+
+
+class LazyModule(types.ModuleType):
+    """
+    A stand-in for a module that is imported on first attribute access.
+
+    After loading, the real module's namespace is copied onto the stand-in so later
+    lookups are plain attribute reads. A missing package only raises ImportError
+    when it is actually used, not when the importing module is loaded.
+    """
+
+    def __init__(self, name):
+        super().__init__(name)
+        self.__dict__["_lazy_loaded"] = False
+
+    def _load(self):
+        module = importlib.import_module(self.__name__)
+        self.__dict__.update(module.__dict__)
+        self.__dict__["_lazy_loaded"] = True
+        return module
+
+    def __getattr__(self, attribute):
+        return getattr(self._load(), attribute)
+
+    def __repr__(self):
+        state = "loaded" if self.__dict__["_lazy_loaded"] else "not loaded"
+        return f"<lazy module {self.__name__!r} ({state})>"
+
+
+def lazy_import(name):
+    """
+    Return `name` from sys.modules if it is already imported, otherwise a LazyModule.
+
+    Example:
+        pd = lazy_import("pandas")   # nothing is imported yet
+        pd.DataFrame(...)            # pandas is imported here
+    """
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    return LazyModule(name)
@@ -0,0 +1,289 @@
+import os
+import time
+import random
+import weakref
+import threading
+import config as cfg
+from lazy_imports import lazy_import
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+
+class LLMError(Exception):
+    """Raised when the LLM could not produce a usable completion."""
+
+
+class CircuitOpenError(LLMError):
+    """Raised when the circuit breaker rejects a call without contacting the LLM."""
+
+
+class DeadlineExceeded(LLMError):
+    """Raised when the overall deadline of a call runs out."""
+
+
+openai = lazy_import("openai")
+DEFAULT_API_BASE = "https://api.openai.com/v1"
+
+
+def non_retryable_errors():
+    # Errors that will not go away by retrying the same request.
+    return (openai.error.InvalidRequestError,
+            openai.error.AuthenticationError,
+            openai.error.PermissionError)
+
+
+def load_api_key(api_base=cfg.OPENAI_API_BASE):
+    """
+    Read the OpenAI API key from OPENAI_API_KEY or cfg.OPENAI_API_PATH.
+
+    Local OpenAI-compatible servers (any api_base other than OpenAI's) do not need a key.
+    """
+    api_key = os.getenv("OPENAI_API_KEY")
+    if api_key:
+        return api_key
+    if os.path.exists(cfg.OPENAI_API_PATH):
+        with open(cfg.OPENAI_API_PATH, "r") as file:
+            return file.read().strip('\n')
+    if api_base != DEFAULT_API_BASE:
+        return "local"
+    raise LLMError(f"No OpenAI API key: set OPENAI_API_KEY or create {cfg.OPENAI_API_PATH}")
+
+
+class CircuitBreaker:
+    """
+    A thread-safe circuit breaker.
+
+    The breaker opens after `failure_threshold` consecutive failures and rejects calls
+    for `reset_timeout` seconds. After that a single trial call is let through
+    (half-open); its outcome either closes the breaker again or re-opens it. A trial
+    that has not reported back within `reset_timeout` seconds is given up on and
+    another trial is let through.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            now = time.monotonic()
+            if self.state == self.OPEN and now - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self.opened_at = now
+                return True
+            if self.state == self.HALF_OPEN and now - self.opened_at >= self.reset_timeout:
+                self.opened_at = now
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+
+class LLMClient:
+    """
+    A resilient transport around `openai.ChatCompletion.create`.
+
+    Every call gets a per-attempt timeout and an overall deadline, failed attempts are
+    retried with exponential backoff and jitter, and slow attempts can be hedged by a
+    duplicate request once `hedge_delay` seconds have passed. A circuit breaker stops
+    calling the upstream after repeated failures.
+
+    Attributes:
+        model_name: The chat model to call.
+        api_base: Base URL of the OpenAI-compatible API.
+        breaker: The CircuitBreaker shared by all calls of this client.
+    """
+
+    def __init__(self, model_name=cfg.LLM_MODEL_NAME, api_base=cfg.OPENAI_API_BASE,
+                 request_timeout=cfg.LLM_REQUEST_TIMEOUT, deadline=cfg.LLM_DEADLINE,
+                 max_retries=cfg.LLM_MAX_RETRIES, backoff_base=cfg.LLM_BACKOFF_BASE,
+                 backoff_max=cfg.LLM_BACKOFF_MAX, hedge_delay=cfg.LLM_HEDGE_DELAY,
+                 breaker=None, api_key=None):
+        self.model_name = model_name
+        self.api_base = api_base
+        self.api_key = api_key
+        self.request_timeout = request_timeout
+        self.deadline = deadline
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge_delay = hedge_delay
+        self.breaker = breaker or CircuitBreaker(cfg.LLM_BREAKER_FAILURE_THRESHOLD,
+                                                 cfg.LLM_BREAKER_RESET_TIMEOUT)
+        self._executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="llm")
+        if hasattr(os, "register_at_fork"):
+            this = weakref.ref(self)
+            os.register_at_fork(after_in_child=lambda: this() is not None and this().after_fork())
+
+    def after_fork(self):
+        # The executor's threads do not survive os.fork (pre-fork workers) while it still
+        # counts them as idle, so a forked child would queue work nobody runs.
+        self._executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="llm")
+
+    def _backoff(self, attempt):
+        delay = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        return random.uniform(0, delay)
+
+    def _call(self, messages, params, timeout, parse):
+        completion = openai.ChatCompletion.create(
+            model=self.model_name,
+            messages=messages,
+            api_base=self.api_base,
+            api_key=self.api_key,
+            request_timeout=timeout,
+            **params
+        )
+        return parse(completion) if parse else completion
+
+    def _attempt(self, messages, params, timeout, parse):
+        """
+        Run one (possibly hedged) attempt and return the first successful result.
+        """
+        futures = [self._executor.submit(self._call, messages, params, timeout, parse)]
+        give_up_at = time.monotonic() + timeout
+        if self.hedge_delay and self.hedge_delay < timeout:
+            done, _ = wait(futures, timeout=self.hedge_delay)
+            if not done:
+                futures.append(self._executor.submit(self._call, messages, params, timeout, parse))
+        pending = set(futures)
+        error = None
+        while pending:
+            done, pending = wait(pending, timeout=max(0.0, give_up_at - time.monotonic()),
+                                 return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                try:
+                    return future.result()
+                except Exception as e:
+                    error = e
+        raise error or DeadlineExceeded(f"LLM attempt timed out after {timeout:.1f}s")
+
+    def complete(self, messages, parse=None, **params):
+        """
+        Create a chat completion.
+
+        Args:
+            messages (list): The chat messages to send.
+            parse (callable, optional): Applied to the raw completion. A ValueError raised
+                here (e.g. a JSON decoding error) counts as a failed attempt and is retried.
+            **params: Extra sampling parameters passed to the API.
+
+        Returns:
+            The raw completion, or the output of `parse`.
+
+        Raises:
+            CircuitOpenError: If the breaker is open.
+            LLMError: If every attempt failed or the deadline ran out.
+        """
+        if self.api_key is None:
+            self.api_key = load_api_key(self.api_base)
+        if not self.breaker.allow():
+            raise CircuitOpenError("LLM circuit breaker is open")
+        deadline_at = time.monotonic() + self.deadline
+        last_error = None
+        for attempt in range(self.max_retries + 1):
+            remaining = deadline_at - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                result = self._attempt(messages, params, min(self.request_timeout, remaining), parse)
+                self.breaker.record_success()
+                return result
+            except non_retryable_errors() as e:
+                self.breaker.record_failure()
+                raise LLMError(str(e)) from e
+            except Exception as e:
+                last_error = e
+                print(f"LLM attempt {attempt + 1} failed: {e!r}")
+            if attempt < self.max_retries:
+                time.sleep(min(self._backoff(attempt), max(0.0, deadline_at - time.monotonic())))
+        self.breaker.record_failure()
+        if last_error is None:
+            raise DeadlineExceeded(f"LLM deadline of {self.deadline:.1f}s exceeded")
+        raise LLMError(f"LLM call failed after retries: {last_error!r}") from last_error
+
+    def _open_stream(self, messages, params, timeout):
+        return openai.ChatCompletion.create(
+            model=self.model_name,
+            messages=messages,
+            api_base=self.api_base,
+            api_key=self.api_key,
+            request_timeout=timeout,
+            stream=True,
+            **params
+        )
+
+    def stream(self, messages, **params):
+        """
+        Create a streaming chat completion and yield its content as it arrives.
+
+        Failed attempts are retried with backoff only until the first content has been
+        yielded; an error after that is raised to the caller, which may already have used
+        part of the answer. Streams are not hedged.
+
+        Raises:
+            CircuitOpenError: If the breaker is open.
+            LLMError: If every attempt failed, the stream broke off or the deadline ran out.
+        """
+        if self.api_key is None:
+            self.api_key = load_api_key(self.api_base)
+        if not self.breaker.allow():
+            raise CircuitOpenError("LLM circuit breaker is open")
+        settled = False
+        try:
+            deadline_at = time.monotonic() + self.deadline
+            last_error = None
+            for attempt in range(self.max_retries + 1):
+                remaining = deadline_at - time.monotonic()
+                if remaining <= 0:
+                    break
+                streaming = False
+                try:
+                    for chunk in self._open_stream(messages, params, min(self.request_timeout, remaining)):
+                        if time.monotonic() > deadline_at:
+                            raise DeadlineExceeded(f"LLM deadline of {self.deadline:.1f}s exceeded")
+                        content = chunk["choices"][0].get("delta", {}).get("content")
+                        if content:
+                            streaming = True
+                            yield content
+                    settled = True
+                    self.breaker.record_success()
+                    return
+                except non_retryable_errors() as e:
+                    raise LLMError(str(e)) from e
+                except Exception as e:
+                    if streaming:
+                        raise LLMError(f"LLM stream interrupted: {e!r}") from e
+                    last_error = e
+                    print(f"LLM stream attempt {attempt + 1} failed: {e!r}")
+                if attempt < self.max_retries:
+                    time.sleep(min(self._backoff(attempt), max(0.0, deadline_at - time.monotonic())))
+            if last_error is None:
+                raise DeadlineExceeded(f"LLM deadline of {self.deadline:.1f}s exceeded")
+            raise LLMError(f"LLM stream failed after retries: {last_error!r}") from last_error
+        finally:
+            # Every way out other than a complete stream counts as a failure, including a
+            # consumer that stops iterating (GeneratorExit) or raises while handling content,
+            # so a half-open breaker is never left waiting for a trial that will not report.
+            if not settled:
+                self.breaker.record_failure()
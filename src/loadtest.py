@@ -0,0 +1,212 @@
+import time
+import json
+import asyncio
+import argparse
+import tempfile
+import threading
+import itertools
+import httpx
+import uvicorn
+import config as cfg
+from benchmark import DelayedEntityExtractor, load_query_corpus, open_database, percentile
+from dbquery_handler import DBQueryHandler
+from entity_linking import EntityLinker
+from http_caching import CollectionVersions
+from rollups import CompensationRollups
+from faiss_search_recommender import SearchRecommender
+from synthetic_data import HashingEncoder, build_synthetic_index
+
+# Load test of the FastAPI app with a concurrency sweep.
+#
+# Drives POST /search through an in-process ASGI transport (default) or a local uvicorn
+# server, with mongomock/synthetic FAISS and a stubbed (or fake-server) LLM behind it.
+# For every concurrency level it records throughput, latency percentiles, errors and the
+# event loop lag of the serving loop, and can compare the run against a previous report.
+#
+# python loadtest.py --concurrency 1,4,16,64 --duration 10 --ner-latency 0.3 --output run.json
+# python loadtest.py --transport uvicorn --ner fake-server --compare run.json
+
+
+class LoopLagMonitor:
+    """
+    Measures how late the event loop wakes up a coroutine that sleeps `interval` seconds.
+    """
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.samples = []
+        self.running = False
+
+    async def run(self):
+        self.running = True
+        loop = asyncio.get_running_loop()
+        while self.running:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, loop.time() - expected))
+
+    def reset(self):
+        samples, self.samples = self.samples, []
+        return samples
+
+    def stop(self):
+        self.running = False
+
+
+def build_fake_services(args):
+    client, db, vectordb_size = open_database(args.documents, args.seed)
+    recommender = SearchRecommender(model_name=cfg.MODEL_NAME, faiss_index_path=None,
+                                    model=HashingEncoder(), index=build_synthetic_index(vectordb_size, seed=args.seed))
+    if args.ner == "fake-server":
+        from fake_llm_server import make_server
+        from llm_client import LLMClient
+        from job_search_ner import NamedEntityExtractor
+        server = make_server(port=args.fake_llm_port, latency=args.ner_latency)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        api_base = f"http://127.0.0.1:{args.fake_llm_port}/v1"
+        ner_obj = NamedEntityExtractor(llm_client=LLMClient(api_base=api_base))
+    else:
+        ner_obj = DelayedEntityExtractor(args.ner_latency)
+    rollups = CompensationRollups()
+    rollups.build(db)
+    entity_linker = EntityLinker(recommender.model)
+    entity_linker.build(db)
+    collection_versions = CollectionVersions()
+    collection_versions.version = collection_versions.compute(db)
+    query_handler_factory = lambda: DBQueryHandler(client=client, db=db, rollups=rollups, entity_linker=entity_linker)
+    return {"ner_obj": ner_obj, "search_recommender": recommender, "query_handler_factory": query_handler_factory,
+            "rollups": rollups, "entity_linker": entity_linker, "collection_versions": collection_versions}
+
+
+async def run_level(http, queries, concurrency, duration, monitor):
+    latencies = []
+    statuses = {}
+    query_cycle = itertools.cycle(queries)
+    stop_at = time.perf_counter() + duration
+
+    async def worker():
+        while time.perf_counter() < stop_at:
+            query = next(query_cycle)
+            started = time.perf_counter()
+            try:
+                response = await http.post("/search", data={"query": query})
+                status = response.status_code
+            except Exception as e:
+                status = type(e).__name__
+            latencies.append(time.perf_counter() - started)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    monitor.reset()
+    started = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - started
+    lag = monitor.reset()
+    ok = statuses.get(200, 0)
+    return {
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "throughput_rps": ok / elapsed if elapsed else 0.0,
+        "error_rate": 1 - ok / len(latencies) if latencies else 0.0,
+        "statuses": {str(key): value for key, value in statuses.items()},
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "loop_lag_p50_ms": percentile(lag, 50) * 1000,
+        "loop_lag_p99_ms": percentile(lag, 99) * 1000,
+        "loop_lag_max_ms": max(lag, default=0.0) * 1000,
+    }
+
+
+def start_uvicorn(app, port, monitor):
+    """
+    Serve the app from a background thread and run the lag monitor on the server's loop.
+    """
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_until_complete, args=(server.serve(),), daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    asyncio.run_coroutine_threadsafe(monitor.run(), loop)
+    return server
+
+
+async def sweep(args, queries):
+    from app import app, configure_services
+    from utils import history_writer
+    # Keep synthetic traffic out of the real query history.
+    history_writer.history_dir = tempfile.mkdtemp(prefix="loadtest-history-")
+    configure_services(**build_fake_services(args))
+    monitor = LoopLagMonitor()
+    server = None
+    if args.transport == "uvicorn":
+        server = start_uvicorn(app, args.port, monitor)
+        http = httpx.AsyncClient(base_url=f"http://127.0.0.1:{args.port}", timeout=args.timeout,
+                                 limits=httpx.Limits(max_connections=None))
+    else:
+        # In-process: the app shares this loop, so the monitor sees the app's blocking directly.
+        asyncio.get_running_loop().create_task(monitor.run())
+        http = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://loadtest",
+                                 timeout=args.timeout)
+    results = []
+    async with http:
+        await run_level(http, queries, 1, args.warmup, monitor)
+        for concurrency in args.concurrency:
+            result = await run_level(http, queries, concurrency, args.duration, monitor)
+            print_row(result)
+            results.append(result)
+    monitor.stop()
+    if server is not None:
+        server.should_exit = True
+    return results
+
+
+def print_row(result):
+    print(f"{result['concurrency']:>6}{result['requests']:>9}{result['throughput_rps']:>10.1f}"
+          f"{result['p50_ms']:>10.1f}{result['p95_ms']:>10.1f}{result['p99_ms']:>10.1f}"
+          f"{result['error_rate'] * 100:>8.1f}%{result['loop_lag_p99_ms']:>10.1f}{result['loop_lag_max_ms']:>10.1f}")
+
+
+def compare(results, previous_path):
+    with open(previous_path) as file:
+        previous = {row["concurrency"]: row for row in json.load(file)["results"]}
+    print("\nChange against", previous_path)
+    print(f"{'conc':>6}{'rps':>10}{'p50':>10}{'p99':>10}")
+    for row in results:
+        old = previous.get(row["concurrency"])
+        if old is None:
+            continue
+        changes = [f"{(row[key] / old[key] - 1) * 100:+.0f}%" if old[key] else "n/a"
+                   for key in ("throughput_rps", "p50_ms", "p99_ms")]
+        print(f"{row['concurrency']:>6}" + "".join(f"{change:>10}" for change in changes))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Concurrency sweep against the /search endpoint")
+    parser.add_argument("--transport", choices=["asgi", "uvicorn"], default="asgi")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--concurrency", default="1,2,4,8,16,32",
+                        type=lambda value: [int(level) for level in value.split(",")])
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds per concurrency level")
+    parser.add_argument("--warmup", type=float, default=2.0, help="Seconds of warm-up at concurrency 1")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--documents", type=int, default=10000, help="Synthetic documents to seed")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--ner", choices=["stub", "fake-server"], default="stub")
+    parser.add_argument("--ner-latency", type=float, default=0.0, help="Simulated LLM latency in seconds")
+    parser.add_argument("--fake-llm-port", type=int, default=8099)
+    parser.add_argument("--history-dir", default=cfg.HISTORY_DIR, help="Query history directory to replay")
+    parser.add_argument("--output", default=None, help="Write the report as JSON")
+    parser.add_argument("--compare", default=None, help="A previous JSON report to compare against")
+    args = parser.parse_args()
+
+    queries = load_query_corpus(args.history_dir)
+    print(f"{'conc':>6}{'requests':>9}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+          f"{'errors':>9}{'lag p99':>10}{'lag max':>10}")
+    results = asyncio.run(sweep(args, queries))
+    report = {"config": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+              "results": results}
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+    if args.compare:
+        compare(results, args.compare)
@@ -0,0 +1,256 @@
+import os
+import re
+import json
+import threading
+import config as cfg
+from lazy_imports import lazy_import
+from snapshot import collection_file
+from tracing import stage
+
+duckdb = lazy_import("duckdb")
+
+# Embedded storage backend: DuckDB over Parquet snapshots of the MongoDB collections
+# (written by snapshot.py).
+#
+# LocalDatabase and LocalCollection implement the part of the pymongo interface that
+# DBQueryHandler and the rollups use (db[name], count_documents, find, sort, limit), so the
+# get_*_table methods run unchanged against local data. Queries are translated to SQL:
+#   {"a.b": re.compile("^x$", re.I)}      -> regexp_matches("a.b", '^x$', 'i')
+#   {"a": 5}                              -> "a" = 5
+#   {"a": {"$gte": 1, "$lte": 9}}         -> "a" >= 1 AND "a" <= 9
+#   {"a": {"$in": [...]}}                 -> "a" IN (...)
+#   {"a": {"$ne": None}}                  -> "a" IS NOT NULL
+# Nested documents are stored as dotted column names and rebuilt on read.
+
+OPERATORS = {"$eq": "=", "$gt": ">", "$gte": ">=", "$lt": "<", "$lte": "<=", "$ne": "!="}
+
+
+def quote(column):
+    return '"' + column.replace('"', '""') + '"'
+
+
+def unflatten(row):
+    document = {}
+    for column, value in row.items():
+        parts = column.split(".")
+        target = document
+        for part in parts[:-1]:
+            target = target.setdefault(part, {})
+        target[parts[-1]] = value
+    return document
+
+
+def regex_options(pattern):
+    return "i" if pattern.flags & re.IGNORECASE else ""
+
+
+def translate_query(query, columns):
+    """
+    Translate a MongoDB filter into a SQL WHERE clause and its parameters.
+
+    Like MongoDB, a condition on a field the collection does not have matches nothing.
+    """
+    clauses = []
+    params = []
+    for field, condition in query.items():
+        if field not in columns:
+            clauses.append("FALSE")
+            continue
+        column = quote(field)
+        if isinstance(condition, re.Pattern):
+            clauses.append(f"regexp_matches(CAST({column} AS VARCHAR), ?, '{regex_options(condition)}')")
+            params.append(condition.pattern)
+        elif isinstance(condition, dict):
+            for operator, value in condition.items():
+                if operator == "$in":
+                    values = list(value)
+                    if not values:
+                        clauses.append("FALSE")
+                        continue
+                    clauses.append(f"{column} IN ({', '.join('?' for _ in values)})")
+                    params.extend(values)
+                elif value is None and operator in ("$eq", "$ne"):
+                    clauses.append(f"{column} IS {'NOT ' if operator == '$ne' else ''}NULL")
+                elif operator in OPERATORS:
+                    clauses.append(f"{column} {OPERATORS[operator]} ?")
+                    params.append(value)
+                else:
+                    raise ValueError(f"Unsupported query operator: {operator}")
+        else:
+            clauses.append(f"{column} = ?")
+            params.append(condition)
+    return " AND ".join(clauses) or "TRUE", params
+
+
+def explain_sql(database, sql, params):
+    # The DuckDB physical plan, in the shape of profiling.summarize_explain.
+    rows = database.cursor().execute("EXPLAIN " + sql, params).fetchall()
+    return {"sql": sql, "plan": "\n".join(str(row[-1]) for row in rows)}
+
+
+class LocalCursor:
+    """
+    A lazily executed query with pymongo's `sort`/`limit`/`hint` chaining.
+    """
+
+    def __init__(self, collection, query, projection=None):
+        self.collection = collection
+        self.query = query or {}
+        self.projection = projection
+        self.order = []
+        self.row_limit = None
+
+    def sort(self, key, direction=1):
+        self.order.append((key, direction))
+        return self
+
+    def limit(self, count):
+        self.row_limit = count or None
+        return self
+
+    def hint(self, index):
+        # DuckDB plans its own scans; index hints only apply to MongoDB.
+        return self
+
+    def columns(self):
+        if not self.projection:
+            return "*"
+        included = [field for field, include in self.projection.items() if include]
+        selected = [column for column in sorted(self.collection.columns)
+                    if any(column == field or column.startswith(field + ".") for field in included)]
+        return ", ".join(quote(column) for column in selected) or "*"
+
+    def sql(self):
+        where, params = translate_query(self.query, self.collection.columns)
+        sql = f"SELECT {self.columns()} FROM {quote(self.collection.name)} WHERE {where}"
+        order = [f"{quote(key)} {'DESC' if direction < 0 else 'ASC'} NULLS LAST"
+                 for key, direction in self.order if key in self.collection.columns]
+        if order:
+            sql += " ORDER BY " + ", ".join(order)
+        if self.row_limit is not None:
+            sql += f" LIMIT {int(self.row_limit)}"
+        return sql, params
+
+    def explain(self):
+        sql, params = self.sql()
+        return explain_sql(self.collection.database, sql, params)
+
+    def __iter__(self):
+        sql, params = self.sql()
+        with stage("duckdb.find"):
+            result = self.collection.database.cursor().execute(sql, params)
+            names = [column[0] for column in result.description]
+            rows = result.fetchall()
+        for row in rows:
+            yield unflatten({name: value for name, value in zip(names, row) if value is not None})
+
+
+class LocalCollection:
+    def __init__(self, database, name, columns):
+        self.database = database
+        self.name = name
+        self.columns = set(columns)
+
+    def count_documents(self, query):
+        where, params = translate_query(query, self.columns)
+        with stage("duckdb.count_documents"):
+            return self.database.cursor().execute(
+                f"SELECT count(*) FROM {quote(self.name)} WHERE {where}", params).fetchone()[0]
+
+    def explain_count(self, query):
+        where, params = translate_query(query, self.columns)
+        return explain_sql(self.database, f"SELECT count(*) FROM {quote(self.name)} WHERE {where}", params)
+
+    def find(self, query=None, projection=None):
+        return LocalCursor(self, query, projection)
+
+    def distinct(self, field):
+        if field not in self.columns:
+            return []
+        with stage("duckdb.distinct"):
+            rows = self.database.cursor().execute(
+                f"SELECT DISTINCT {quote(field)} FROM {quote(self.name)} WHERE {quote(field)} IS NOT NULL").fetchall()
+        return [row[0] for row in rows]
+
+
+class LocalDatabase:
+    """
+    The Parquet snapshots in `snapshot_dir`, loaded into an in-memory DuckDB database.
+
+    Tables are loaded once and read concurrently through per-thread cursors.
+
+    Attributes:
+        snapshot_dir (str): Directory with the Parquet files named by manifest.json.
+        manifest (dict): Snapshot metadata written by snapshot.py.
+    """
+
+    def __init__(self, snapshot_dir=cfg.SNAPSHOT_DIR, threads=cfg.DUCKDB_THREADS):
+        self.snapshot_dir = snapshot_dir
+        manifest_path = os.path.join(snapshot_dir, "manifest.json")
+        if not os.path.exists(manifest_path):
+            raise FileNotFoundError(f"No snapshot in {snapshot_dir}; run snapshot.py first")
+        self.manifest_path = manifest_path
+        self.manifest_mtime = os.stat(manifest_path).st_mtime_ns
+        with open(manifest_path) as file:
+            self.manifest = json.load(file)
+        self.connection = duckdb.connect(":memory:", config={"threads": threads})
+        self.collections = {}
+        for name, info in self.manifest["collections"].items():
+            path = os.path.join(snapshot_dir, collection_file(name, info))
+            self.connection.execute(f"CREATE TABLE {quote(name)} AS SELECT * FROM read_parquet(?)", [path])
+            columns = [row[0] for row in self.connection.execute(f"DESCRIBE {quote(name)}").fetchall()]
+            self.collections[name] = LocalCollection(self, name, columns)
+        self._local = threading.local()
+
+    def cursor(self):
+        cursor = getattr(self._local, "cursor", None)
+        if cursor is None:
+            cursor = self._local.cursor = self.connection.cursor()
+        return cursor
+
+    def __getitem__(self, name):
+        if name not in self.collections:
+            raise KeyError(f"Collection {name} is not in the snapshot {self.snapshot_dir}")
+        return self.collections[name]
+
+    def close(self):
+        # Shared by all handlers of the process (see open_local_database); nothing to do per request.
+        pass
+
+    def is_stale(self):
+        """
+        Whether snapshot.py has written a newer snapshot (another created_at) since this one was loaded.
+        """
+        try:
+            mtime = os.stat(self.manifest_path).st_mtime_ns
+            if mtime == self.manifest_mtime:
+                return False
+            with open(self.manifest_path) as file:
+                created_at = json.load(file).get("created_at")
+        except (OSError, ValueError):
+            return False
+        self.manifest_mtime = mtime
+        return created_at != self.manifest.get("created_at")
+
+
+_local_database = None
+_local_database_lock = threading.Lock()
+
+
+def open_local_database(snapshot_dir=cfg.SNAPSHOT_DIR):
+    """
+    Return the process-wide LocalDatabase, loading the snapshot on first use and again
+    whenever snapshot.py has written a new one.
+    """
+    global _local_database
+    with _local_database_lock:
+        if _local_database is None or _local_database.snapshot_dir != snapshot_dir:
+            _local_database = LocalDatabase(snapshot_dir)
+        elif _local_database.is_stale():
+            try:
+                _local_database = LocalDatabase(snapshot_dir)
+                print(f"Reloaded the snapshot of {_local_database.manifest['created_at']}")
+            except Exception as e:
+                # Handlers keep the previous snapshot until the next one loads.
+                print(f"Could not reload the snapshot in {snapshot_dir}: {e!r}")
+        return _local_database
@@ -0,0 +1,42 @@
+from pymongo import monitoring
+from tracing import metrics, record
+
+
+class MongoCommandTimer(monitoring.CommandListener):
+    """
+    A pymongo CommandListener that records every `count_documents` and `find` issued
+    through a MongoClient as a `mongo.*` stage.
+
+    `count_documents` is sent as an aggregate with a counting $group, and cursor
+    iteration shows up as getMore; both are mapped back to the driver call.
+    """
+
+    def __init__(self):
+        self._pending = {}
+
+    @staticmethod
+    def stage_name(event):
+        command = event.command
+        name = event.command_name
+        if name == "aggregate":
+            pipeline = command.get("pipeline", [])
+            if pipeline and "$group" in pipeline[-1] and pipeline[-1]["$group"].get("_id") == 1:
+                return "mongo.count_documents"
+        if name == "getMore":
+            return "mongo.find"
+        return f"mongo.{name}"
+
+    def started(self, event):
+        self._pending[event.request_id] = self.stage_name(event)
+
+    def succeeded(self, event):
+        name = self._pending.pop(event.request_id, f"mongo.{event.command_name}")
+        record(name, event.duration_micros / 1e6)
+
+    def failed(self, event):
+        name = self._pending.pop(event.request_id, f"mongo.{event.command_name}")
+        record(name, event.duration_micros / 1e6)
+        metrics.inc("mongo_command_failures_total", help_text="Failed MongoDB commands", command=name)
+
+
+mongo_command_timer = MongoCommandTimer()
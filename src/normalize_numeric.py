@@ -0,0 +1,96 @@
+import argparse
+import config as cfg
+from lazy_imports import lazy_import
+from numeric import num_field, shadow_field_names, shadow_fields, usd_field
+
+pymongo = lazy_import("pymongo")
+
+# Backfill of the numeric shadow fields (see numeric.py) and their range indexes.
+#
+# Re-run after bulk imports or exchange rate changes; documents are rewritten in batches
+# of --batch-size with unordered bulk updates.
+#
+# python normalize_numeric.py
+# python normalize_numeric.py --tables jobentries benefits --indexes-only
+
+
+def numeric_indexes(table_name):
+    """
+    Range indexes for a table: each shadow field alone (cross-currency ranges and
+    superlatives on <field>_usd) and behind currency.code (ranges within one currency).
+    """
+    indexes = []
+    for field in cfg.money_fields.get(table_name, ()):
+        indexes.append([(usd_field(field), pymongo.ASCENDING)])
+        indexes.append([("currency.code", pymongo.ASCENDING), (num_field(field), pymongo.ASCENDING)])
+    for field in cfg.percentage_fields.get(table_name, ()):
+        indexes.append([(num_field(field), pymongo.ASCENDING)])
+    return indexes
+
+
+def normalize_collection(db, table_name, batch_size=1000):
+    """
+    Write the shadow fields of every document of `table_name`.
+
+    Returns:
+        int: The number of documents updated.
+    """
+    table = db[table_name]
+    updated = 0
+    batch = []
+    for document in table.find({}):
+        batch.append(pymongo.UpdateOne({"_id": document["_id"]}, {"$set": shadow_fields(table_name, document)}))
+        if len(batch) >= batch_size:
+            updated += table.bulk_write(batch, ordered=False).modified_count
+            batch = []
+    if batch:
+        updated += table.bulk_write(batch, ordered=False).modified_count
+    return updated
+
+
+def create_numeric_indexes(db, table_name):
+    for keys in numeric_indexes(table_name):
+        db[table_name].create_index(keys)
+
+
+def numeric_tables():
+    return list(cfg.money_fields) + [table for table in cfg.percentage_fields if table not in cfg.money_fields]
+
+
+def missing_numeric_setup(db, tables=None):
+    """
+    What this script still has to create in `db`: shadow fields that no document of a
+    non-empty collection has, and (on MongoDB) missing range indexes.
+
+    Returns:
+        list: One "<table>: <field or index>" description per missing item.
+    """
+    missing = []
+    for table_name in tables or numeric_tables():
+        table = db[table_name]
+        if next(iter(table.find({}).limit(1)), None) is None:
+            continue
+        for field in shadow_field_names(table_name):
+            if next(iter(table.find({field: {"$ne": None}}).limit(1)), None) is None:
+                missing.append(f"{table_name}: field {field}")
+        if hasattr(table, "index_information"):
+            existing = [list(index["key"]) for index in table.index_information().values()]
+            for keys in numeric_indexes(table_name):
+                if [tuple(key) for key in keys] not in [[tuple(key) for key in index] for index in existing]:
+                    missing.append(f"{table_name}: index {keys}")
+    return missing
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill numeric shadow fields and range indexes")
+    parser.add_argument("--tables", nargs="+", default=numeric_tables())
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--indexes-only", action="store_true")
+    args = parser.parse_args()
+
+    db = pymongo.MongoClient(cfg.MONGODB_URL)[cfg.DB_NAME]
+    for table_name in args.tables:
+        if not args.indexes_only:
+            print(f"{table_name}: {normalize_collection(db, table_name, args.batch_size)} documents updated")
+        create_numeric_indexes(db, table_name)
+        print(f"{table_name}: range indexes ready")
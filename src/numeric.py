@@ -0,0 +1,80 @@
+import re
+import config as cfg
+
+# Typed numeric values for money and percentage fields.
+#
+# Amounts are stored as strings or numbers of mixed shape ("50K", "$1.2M", "12%", 45000)
+# and salaries are in many currencies. Every field listed in cfg.money_fields and
+# cfg.percentage_fields gets numeric shadow fields next to it:
+#   <field>_num  - the parsed number, in the document's currency (or percent)
+#   <field>_usd  - money fields only: the amount converted with cfg.USD_EXCHANGE_RATES
+# Queries filter and sort on the shadow fields, which carry range indexes
+# (see normalize_numeric.py).
+
+AMOUNT_PATTERN = re.compile(r"(-?\d+(?:\.\d+)?)\s*(k|m|bn|b|thousand|million|billion|%|percent)?(?![a-z])",
+                            re.IGNORECASE)
+MULTIPLIERS = {"k": 1e3, "thousand": 1e3, "m": 1e6, "million": 1e6, "b": 1e9, "bn": 1e9, "billion": 1e9}
+
+
+def parse_amount(value):
+    """
+    Parse an amount or percentage such as 45000, "50K", "$1.5M", "120,000 USD" or "12.5%".
+
+    Returns:
+        float or None: The number (percentages are returned as the percent value, e.g. 12.5),
+        or None if `value` contains no number.
+    """
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    match = AMOUNT_PATTERN.search(str(value).replace(",", ""))
+    if match is None:
+        return None
+    return float(match.group(1)) * MULTIPLIERS.get((match.group(2) or "").lower(), 1)
+
+
+def to_usd(amount, currency_code):
+    """
+    Convert an amount to USD, or return None if the currency has no known rate.
+    """
+    rate = cfg.USD_EXCHANGE_RATES.get(str(currency_code or "").upper())
+    if amount is None or rate is None:
+        return None
+    return amount * rate
+
+
+def num_field(field):
+    return f"{field}_num"
+
+
+def usd_field(field):
+    return f"{field}_usd"
+
+
+def shadow_field_names(table_name):
+    names = []
+    for field in cfg.money_fields.get(table_name, ()):
+        names += [num_field(field), usd_field(field)]
+    names += [num_field(field) for field in cfg.percentage_fields.get(table_name, ())]
+    return names
+
+
+def shadow_fields(table_name, document):
+    """
+    The numeric shadow fields of a document of `table_name`.
+    """
+    currency_code = (document.get("currency") or {}).get("code")
+    shadow = {}
+    for field in cfg.money_fields.get(table_name, ()):
+        amount = parse_amount(document.get(field))
+        shadow[num_field(field)] = amount
+        shadow[usd_field(field)] = to_usd(amount, currency_code)
+    for field in cfg.percentage_fields.get(table_name, ()):
+        shadow[num_field(field)] = parse_amount(document.get(field))
+    return shadow
+
+
+def with_shadow_fields(table_name, document):
+    document.update(shadow_fields(table_name, document))
+    return document
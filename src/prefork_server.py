@@ -0,0 +1,276 @@
+import gc
+import os
+import time
+import signal
+import socket
+import argparse
+import functools
+import config as cfg
+from lazy_imports import lazy_import
+
+torch = lazy_import("torch")
+uvicorn = lazy_import("uvicorn")
+
+# Pre-fork deployment of the FastAPI app (Linux/macOS, needs os.fork).
+#
+# The master process loads the sentence transformer, the FAISS index and the compensation
+# rollups once, freezes them (eval mode, no gradients, gc.freeze) and forks the workers,
+# which share those pages copy-on-write and serve the same listening socket. Each added
+# worker only costs its own interpreter state and caches, not another copy of the model.
+#
+# Background work runs once, in the master: the cache warm-up before forking (the workers
+# inherit the warmed caches), the data version polls (kept in shared memory, see
+# http_caching.CollectionVersions) and every --refresh-interval seconds the rollup and
+# entity linking refreshes, after which the workers are replaced one by one with fresh
+# forks. Workers start no background threads of their own, so they never write to the
+# shared rollups and do not multiply the database and LLM load. Threads the master started
+# (e.g. during the warm-up) do not survive the fork; the recommender and the LLM client
+# start new ones in each worker (see their after_fork methods).
+#
+# python prefork_server.py --workers 8 --port 8000
+# python prefork_server.py --workers 4 --report-memory 30   # print per-process PSS after 30s
+
+
+def freeze_model(model):
+    """
+    Put a torch module (e.g. a SentenceTransformer) in inference mode.
+
+    eval() disables dropout, and parameters without gradients never get .grad buffers
+    allocated, so the weight pages stay shared with the master.
+    """
+    model.eval()
+    for parameter in model.parameters():
+        parameter.requires_grad_(False)
+    return model
+
+
+def load_shared_services():
+    """
+    Build the pipeline components in the master and register them with the app.
+    """
+    from app import configure_services
+    from cache_warmer import CacheWarmer
+    from dbquery_handler import DBQueryHandler
+    from entity_linking import EntityLinker
+    from faiss_search_recommender import SearchRecommender
+    from http_caching import CollectionVersions
+    from job_search_ner import NamedEntityExtractor
+    from normalize_numeric import missing_numeric_setup
+    from rollups import CompensationRollups
+    from semantic_cache import SemanticEntityCache
+
+    recommender = SearchRecommender(model_name=cfg.MODEL_NAME, faiss_index_path=cfg.FAISS_SEARCH_INDEX_PATH)
+    freeze_model(recommender.model)
+    semantic_cache = SemanticEntityCache(recommender.model) if cfg.NER_SEMANTIC_CACHE_ENABLED else None
+    rollups = None
+    entity_linker = None
+    collection_versions = None
+    # MongoClient is not fork-safe: build with a temporary client; every handler of the
+    # workers and of the warm-up opens (and closes) its own.
+    query_handler = DBQueryHandler()
+    if cfg.NUMERIC_FIELDS_CHECK:
+        missing = missing_numeric_setup(query_handler.db)
+        if missing:
+            raise RuntimeError(f"Numeric shadow fields or range indexes are missing, run normalize_numeric.py "
+                               f"first (or set NUMERIC_FIELDS_CHECK=0): {', '.join(missing)}")
+    if cfg.ROLLUPS_ENABLED:
+        rollups = CompensationRollups()
+        rollups.build(query_handler.db)
+    if cfg.ENTITY_LINKING_ENABLED:
+        entity_linker = EntityLinker(recommender.model)
+        entity_linker.build(query_handler.db)
+    if cfg.ETAGS_ENABLED:
+        collection_versions = CollectionVersions(shared=True)
+        collection_versions.poll(query_handler.db)
+    query_handler.close_connection()
+    ner_obj = NamedEntityExtractor(semantic_cache=semantic_cache)
+    query_handler_factory = functools.partial(DBQueryHandler, rollups=rollups, entity_linker=entity_linker)
+    cache_warmer = CacheWarmer(ner_obj, recommender, query_handler_factory)
+    if cfg.WARMUP_ENABLED:
+        # On this thread and before forking: every worker starts with the warmed caches.
+        cache_warmer.run()
+    else:
+        cache_warmer.disable()
+    configure_services(ner_obj=ner_obj, search_recommender=recommender, query_handler_factory=query_handler_factory,
+                       rollups=rollups, entity_linker=entity_linker, collection_versions=collection_versions,
+                       cache_warmer=cache_warmer)
+
+
+def poll_data_version():
+    # Written to shared memory, so every worker sees the new version at once.
+    from app import services
+    from dbquery_handler import DBQueryHandler
+
+    collection_versions = services.get("collection_versions")
+    if collection_versions is None:
+        return
+    query_handler = DBQueryHandler()
+    try:
+        collection_versions.poll(query_handler.db)
+    finally:
+        query_handler.close_connection()
+
+
+def refresh_shared_services():
+    """
+    Bring the master's rollups and entity linking catalogs up to date (on the schedule
+    their own refresh threads would use); workers forked afterwards see the new data.
+    """
+    from app import services
+    from dbquery_handler import DBQueryHandler
+
+    rollups = services.get("rollups")
+    entity_linker = services.get("entity_linker")
+    query_handler = DBQueryHandler()
+    try:
+        if rollups is not None:
+            if not rollups.ready or time.time() - rollups.built_at >= cfg.ROLLUP_FULL_REBUILD_INTERVAL:
+                rollups.build(query_handler.db)
+            else:
+                rollups.refresh(query_handler.db)
+        if entity_linker is not None and (
+                not entity_linker.ready or time.time() - entity_linker.built_at >= cfg.ENTITY_LINK_REFRESH_INTERVAL):
+            entity_linker.build(query_handler.db)
+    finally:
+        query_handler.close_connection()
+
+
+def memory_usage(pid):
+    """
+    Rss, Pss and private memory of a process in MiB, from /proc/<pid>/smaps_rollup.
+    """
+    usage = {"Rss": 0, "Pss": 0, "Private": 0}
+    with open(f"/proc/{pid}/smaps_rollup") as file:
+        for line in file:
+            name, _, value = line.partition(":")
+            if name in ("Rss", "Pss"):
+                usage[name] = int(value.split()[0]) / 1024
+            elif name in ("Private_Clean", "Private_Dirty"):
+                usage["Private"] += int(value.split()[0]) / 1024
+    return usage
+
+
+def serve_worker(app, sock, worker_number, args):
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    gc.enable()
+    torch.set_num_threads(args.torch_threads)
+    print(f"Worker {worker_number} (pid {os.getpid()}) serving")
+    server = uvicorn.Server(uvicorn.Config(app, log_level=args.log_level, timeout_keep_alive=args.keep_alive))
+    server.run(sockets=[sock])
+
+
+def main(args):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((args.host, args.port))
+    sock.listen(args.backlog)
+    sock.set_inheritable(True)
+
+    # No collections while loading; afterwards everything allocated so far is moved to the
+    # permanent generation so the workers' collections never write to the shared pages.
+    gc.disable()
+    torch.set_num_threads(args.torch_threads)
+    started = time.perf_counter()
+    load_shared_services()
+    from app import app
+    gc.collect()
+    gc.freeze()
+    print(f"Loaded shared services in {time.perf_counter() - started:.1f}s, "
+          f"{gc.get_freeze_count()} objects frozen")
+
+    children = {}
+    stopping = False
+
+    def spawn(worker_number):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                serve_worker(app, sock, worker_number, args)
+            finally:
+                os._exit(0)
+        children[pid] = worker_number
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def replace_workers():
+        started = time.perf_counter()
+        try:
+            refresh_shared_services()
+        except Exception as e:
+            print(f"Shared services refresh failed, keeping the workers: {e!r}")
+            return
+        # Objects replaced by the refresh are still in the permanent generation.
+        gc.unfreeze()
+        gc.collect()
+        gc.freeze()
+        print(f"Refreshed shared services in {time.perf_counter() - started:.1f}s, replacing the workers")
+        for pid, worker_number in list(children.items()):
+            if stopping:
+                break
+            # Dropped from children first, so its exit is not answered by another restart.
+            del children[pid]
+            spawn(worker_number)
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for worker_number in range(args.workers):
+        spawn(worker_number)
+    next_refresh = time.monotonic() + args.refresh_interval
+    next_version_poll = time.monotonic() + cfg.DATA_VERSION_INTERVAL
+
+    if args.report_memory:
+        time.sleep(args.report_memory)
+        print(f"{'pid':>8}{'rss MiB':>10}{'pss MiB':>10}{'private MiB':>13}")
+        for pid in [os.getpid()] + list(children):
+            usage = memory_usage(pid)
+            print(f"{pid:>8}{usage['Rss']:>10.1f}{usage['Pss']:>10.1f}{usage['Private']:>13.1f}")
+
+    while children:
+        if args.refresh_interval and not stopping and time.monotonic() >= next_refresh:
+            replace_workers()
+            next_refresh = time.monotonic() + args.refresh_interval
+        if not stopping and time.monotonic() >= next_version_poll:
+            poll_data_version()
+            next_version_poll = time.monotonic() + cfg.DATA_VERSION_INTERVAL
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            break
+        if pid == 0:
+            time.sleep(1)
+            continue
+        worker_number = children.pop(pid, None)
+        if not stopping and worker_number is not None:
+            print(f"Worker {worker_number} (pid {pid}) exited with status {status}, restarting")
+            spawn(worker_number)
+    sock.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the app from pre-forked workers sharing one model")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=cfg.PREFORK_WORKERS)
+    parser.add_argument("--torch-threads", type=int, default=cfg.PREFORK_TORCH_THREADS,
+                        help="Intra-op threads per worker, so workers do not oversubscribe the CPUs")
+    parser.add_argument("--backlog", type=int, default=2048)
+    parser.add_argument("--keep-alive", type=int, default=5)
+    parser.add_argument("--log-level", default="warning")
+    parser.add_argument("--refresh-interval", type=float, default=cfg.PREFORK_REFRESH_INTERVAL,
+                        help="Seconds between refreshes of the rollups and entity catalogs in the master, "
+                             "each followed by a rolling replacement of the workers (0 disables)")
+    parser.add_argument("--report-memory", type=float, default=0,
+                        help="Print Rss/Pss/private memory of all processes after this many seconds")
+    main(parser.parse_args())
@@ -0,0 +1,244 @@
+import io
+import os
+import re
+import hmac
+import json
+import time
+import pstats
+import cProfile
+import threading
+import config as cfg
+from collections import deque
+from tracing import metrics
+
+# Admin-only profiling and slow-query capture.
+#
+# POST /admin/profile (with the X-Admin-Token header) runs one query through NER and
+# respond_query with respond_query under cProfile, records every count_documents/find it
+# issues and returns their explain plans together with the profile and stage timings.
+# Every /search slower than SLOW_QUERY_THRESHOLD seconds is appended to SLOW_QUERY_LOG
+# with its entities, the query plans of the tables it queried and its stage timings; the
+# latest ones are also served by GET /admin/slow-queries.
+
+
+def is_admin(headers):
+    # Profiling is disabled unless ADMIN_TOKEN is set.
+    token = cfg.ADMIN_TOKEN
+    return bool(token) and hmac.compare_digest(headers.get("x-admin-token", ""), token)
+
+
+def describe(value):
+    """
+    A JSON-serializable copy of a query document; compiled patterns become $regex conditions.
+    """
+    if isinstance(value, re.Pattern):
+        options = "i" if value.flags & re.IGNORECASE else ""
+        return {"$regex": value.pattern, "$options": options}
+    if isinstance(value, dict):
+        return {str(key): describe(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [describe(item) for item in value]
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    return str(value)
+
+
+class RecordingCursor:
+    """
+    A find cursor that remembers its sort, limit and hint for explaining later.
+    """
+
+    def __init__(self, cursor, operation):
+        self.cursor = cursor
+        self.operation = operation
+
+    def sort(self, key, direction=1):
+        self.cursor = self.cursor.sort(key, direction)
+        self.operation.setdefault("sort", []).append((key, direction))
+        return self
+
+    def limit(self, count):
+        self.cursor = self.cursor.limit(count)
+        self.operation["limit"] = count
+        return self
+
+    def hint(self, index):
+        self.cursor = self.cursor.hint(index)
+        self.operation["hint"] = index
+        return self
+
+    def __iter__(self):
+        return iter(self.cursor)
+
+
+class RecordingCollection:
+    def __init__(self, collection, operations):
+        self.collection = collection
+        self.operations = operations
+
+    def count_documents(self, query):
+        self.operations.append({"collection": self.collection.name, "operation": "count_documents",
+                                "filter": query})
+        return self.collection.count_documents(query)
+
+    def find(self, query=None, projection=None):
+        operation = {"collection": self.collection.name, "operation": "find", "filter": query or {},
+                     "projection": projection}
+        self.operations.append(operation)
+        return RecordingCursor(self.collection.find(query, projection), operation)
+
+    def __getattr__(self, name):
+        return getattr(self.collection, name)
+
+
+class RecordingDatabase:
+    """
+    Wraps a database and records the count_documents and find operations issued through it.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self.operations = []
+
+    def __getitem__(self, name):
+        return RecordingCollection(self.db[name], self.operations)
+
+
+def plan_stages(plan):
+    # The stages of a winning plan from the root down, e.g. "LIMIT <- FETCH <- IXSCAN (currency.code_1)".
+    stages = []
+    while plan:
+        name = plan.get("stage", "?")
+        if plan.get("indexName"):
+            name += f" ({plan['indexName']})"
+        stages.append(name)
+        inputs = plan.get("inputStages") or []
+        plan = plan.get("inputStage") or (inputs[0] if inputs else None)
+    return " <- ".join(stages)
+
+
+def summarize_explain(explain):
+    """
+    The winning plan and execution statistics of a MongoDB explain result.
+    """
+    if "queryPlanner" not in explain:
+        return describe(explain)
+    planner = explain["queryPlanner"]
+    winning = planner.get("winningPlan", {})
+    # Plans run by the slot-based engine nest the classic plan under queryPlan.
+    winning = winning.get("queryPlan", winning)
+    summary = {"plan": plan_stages(winning),
+               "rejected_plans": len(planner.get("rejectedPlans", []))}
+    stats = explain.get("executionStats")
+    if stats:
+        summary.update({key: stats.get(key) for key in
+                        ("nReturned", "totalKeysExamined", "totalDocsExamined", "executionTimeMillis")})
+    return summary
+
+
+def explain_operation(db, operation):
+    """
+    The explain summary of a recorded operation, run against `db` with executionStats.
+    """
+    collection = db[operation["collection"]]
+    if operation["operation"] == "count_documents":
+        if hasattr(collection, "explain_count"):
+            return collection.explain_count(operation["filter"])
+        # count_documents is an aggregate on the wire; the count command has the same plan.
+        explain = db.command({"explain": {"count": operation["collection"], "query": operation["filter"]},
+                              "verbosity": "executionStats"})
+        return summarize_explain(explain)
+    cursor = collection.find(operation["filter"], operation["projection"])
+    for key, direction in operation.get("sort", []):
+        cursor = cursor.sort(key, direction)
+    if operation.get("limit"):
+        cursor = cursor.limit(operation["limit"])
+    if operation.get("hint") is not None:
+        cursor = cursor.hint(operation["hint"])
+    return summarize_explain(cursor.explain())
+
+
+def explain_operations(db, operations):
+    explained = []
+    for operation in operations:
+        entry = describe({key: value for key, value in operation.items() if key != "projection"})
+        try:
+            entry["explain"] = explain_operation(db, operation)
+        except Exception as e:
+            # e.g. mongomock, which has no explain.
+            entry["explain"] = {"error": repr(e)}
+        explained.append(entry)
+    return explained
+
+
+_profile_lock = threading.Lock()
+
+
+def profile_call(top_n, function, *args):
+    """
+    Call `function(*args)` under cProfile.
+
+    Only the calling thread is profiled, so work handed to other threads (e.g. the
+    recommender's encode batcher) shows up as time spent waiting for it.
+
+    Returns:
+        tuple: (result, the top_n functions by cumulative time, the pstats report text).
+    """
+    # One profile at a time: concurrent profiles would skew each other.
+    with _profile_lock:
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            result = function(*args)
+        finally:
+            profiler.disable()
+    metrics.inc("profiles_total", help_text="Admin profiles captured")
+    stream = io.StringIO()
+    stats = pstats.Stats(profiler, stream=stream).sort_stats("cumulative")
+    stats.print_stats(top_n)
+    rows = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:top_n]
+    top = [{"function": f"{filename}:{line}({name})", "calls": calls, "primitive_calls": primitive_calls,
+            "tottime": round(tottime, 6), "cumtime": round(cumtime, 6)}
+           for (filename, line, name), (primitive_calls, calls, tottime, cumtime, _) in rows]
+    return result, top, stream.getvalue()
+
+
+class SlowQueryLog:
+    """
+    Appends requests slower than `threshold` seconds to a JSONL file and keeps the latest in memory.
+
+    Attributes:
+        threshold (float): Latency in seconds above which a request is logged (0 disables the log).
+        path (str): The JSONL file, or None to only keep the entries in memory.
+        recent (deque): The latest `capacity` entries.
+    """
+
+    def __init__(self, threshold=cfg.SLOW_QUERY_THRESHOLD, path=cfg.SLOW_QUERY_LOG,
+                 capacity=cfg.SLOW_QUERY_RECENT):
+        self.threshold = threshold
+        self.path = path
+        self.recent = deque(maxlen=capacity)
+        self._lock = threading.Lock()
+
+    def maybe_log(self, query, ner_response, trace):
+        if not self.threshold or trace is None:
+            return None
+        elapsed = trace.elapsed()
+        if elapsed < self.threshold:
+            return None
+        entry = {"timestamp": time.time(), "query": query, "seconds": round(elapsed, 6),
+                 "entities": describe({key: value for key, value in (ner_response or {}).items() if key != "query"}),
+                 "plans": describe(trace.notes.get("query_plan", [])),
+                 "stages": {name: round(seconds, 6) for name, seconds in trace.totals().items()}}
+        metrics.inc("slow_queries_total", help_text="Searches slower than SLOW_QUERY_THRESHOLD")
+        with self._lock:
+            self.recent.append(entry)
+            if self.path:
+                try:
+                    os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                    with open(self.path, "a") as file:
+                        file.write(json.dumps(entry) + "\n")
+                except OSError as e:
+                    print(f"Could not write the slow query log: {e!r}")
+        print(f"Slow query ({elapsed:.3f}s): {query!r}")
+        return entry
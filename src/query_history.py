@@ -0,0 +1,163 @@
+import os
+import ast
+import glob
+import json
+import time
+import queue
+import threading
+import config as cfg
+from tracing import metrics
+
+
+class QueryHistoryWriter:
+    """
+    Writes query history in the background as append-only JSONL segments.
+
+    `submit` only puts the entry on a bounded queue (and drops it if the queue is full),
+    so logging costs nothing on the request path. A writer thread appends entries in
+    batches of up to `batch_size` or every `flush_interval` seconds and starts a new
+    segment once the current one exceeds `segment_max_bytes` or `segment_max_age` seconds.
+
+    Each line is {"ts": <unix time>, "query": <str>, "entities": <dict>, "source": <str or null>},
+    where source tells where the entities came from ("llm", "semantic" or null if unknown).
+    """
+
+    def __init__(self, history_dir=cfg.HISTORY_DIR, queue_size=cfg.HISTORY_QUEUE_SIZE,
+                 batch_size=cfg.HISTORY_BATCH_SIZE, flush_interval=cfg.HISTORY_FLUSH_INTERVAL,
+                 segment_max_bytes=cfg.HISTORY_SEGMENT_MAX_BYTES, segment_max_age=cfg.HISTORY_SEGMENT_MAX_AGE):
+        self.history_dir = history_dir
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.segment_max_bytes = segment_max_bytes
+        self.segment_max_age = segment_max_age
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = None
+        self._lock = threading.Lock()
+        self._file = None
+        self._segment_started = 0.0
+        self._segment_number = 0
+
+    def submit(self, query, entities, source=None):
+        self._ensure_thread()
+        try:
+            self._queue.put_nowait({"ts": time.time(), "query": query, "entities": entities, "source": source})
+        except queue.Full:
+            metrics.inc("query_history_dropped_total", help_text="History entries dropped on a full queue")
+
+    def _ensure_thread(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="query-history", daemon=True)
+                self._thread.start()
+
+    def _open_segment(self):
+        os.makedirs(self.history_dir, exist_ok=True)
+        self._segment_number += 1
+        path = os.path.join(self.history_dir, f"queries-{int(time.time() * 1000)}-{os.getpid()}-{self._segment_number:06d}.jsonl")
+        self._file = open(path, "a")
+        self._segment_started = time.monotonic()
+
+    def _rotate_if_needed(self):
+        if self._file is None:
+            self._open_segment()
+        elif (self._file.tell() >= self.segment_max_bytes
+              or time.monotonic() - self._segment_started >= self.segment_max_age):
+            self._file.close()
+            self._open_segment()
+
+    def _write(self, batch):
+        self._rotate_if_needed()
+        self._file.write("".join(json.dumps(entry, default=str) + "\n" for entry in batch))
+        self._file.flush()
+
+    def _run(self):
+        while True:
+            entry = self._queue.get()
+            if entry is None:
+                break
+            batch = [entry]
+            flush_at = time.monotonic() + self.flush_interval
+            stop = False
+            while len(batch) < self.batch_size:
+                try:
+                    entry = self._queue.get(timeout=max(0.0, flush_at - time.monotonic()))
+                except queue.Empty:
+                    break
+                if entry is None:
+                    stop = True
+                    break
+                batch.append(entry)
+            try:
+                self._write(batch)
+            except OSError as e:
+                print(f"Failed to write query history: {e}")
+            if stop:
+                break
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def close(self, timeout=5.0):
+        """
+        Flush pending entries and stop the writer thread.
+        """
+        if self._thread is None or not self._thread.is_alive():
+            return
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+
+class QueryHistoryStore:
+    """
+    Reads the query history: the JSONL segments plus the legacy `query.txt` file
+    ("query->entities" lines written by earlier versions).
+    """
+
+    def __init__(self, history_dir=cfg.HISTORY_DIR):
+        self.history_dir = history_dir
+
+    def segments(self):
+        return sorted(glob.glob(os.path.join(self.history_dir, "queries-*.jsonl")))
+
+    def read_legacy(self):
+        path = os.path.join(self.history_dir, "query.txt")
+        if not os.path.exists(path):
+            return
+        modified = os.path.getmtime(path)
+        with open(path) as file:
+            for line in file:
+                query, _, entities = line.rstrip("\n").partition("->")
+                if not query.strip():
+                    continue
+                try:
+                    entities = ast.literal_eval(entities) if entities else {}
+                except (ValueError, SyntaxError):
+                    entities = {}
+                # The legacy format has no timestamps; the file time is the best estimate.
+                yield {"ts": modified, "query": query.strip(), "entities": entities}
+
+    def read(self, since=None):
+        """
+        Iterate over history entries, oldest segment first.
+
+        Args:
+            since (float, optional): Only yield entries with a unix timestamp >= since.
+        """
+        for entry in self.read_legacy():
+            if since is None or entry["ts"] >= since:
+                yield entry
+        for path in self.segments():
+            with open(path) as file:
+                for line in file:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # A partially written last line of a segment.
+                        continue
+                    if since is None or entry["ts"] >= since:
+                        yield entry
+
+    def queries(self, since=None):
+        return [entry["query"] for entry in self.read(since) if entry.get("query")]
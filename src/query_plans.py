@@ -0,0 +1,230 @@
+import re
+import datetime
+import functools
+import operator
+import config as cfg
+from numeric import num_field, parse_amount, usd_field
+from tracing import metrics
+
+# Compiled query plans for the DBQueryHandler table queries.
+#
+# A table's query is described by cfg.entity_fields (text entities and the document field
+# each one matches) and cfg.table_specs (numeric entities, MAX/MIN sort field, result
+# columns). compile_plan turns that description into a QueryPlan once per (table, set of
+# entity keys in the NER response) and caches it, so a request only binds its values:
+# one existence check per entity, then a single find with the plan's projection, sort,
+# limit and index hint, flattened into DataFrame columns by precompiled field getters.
+#
+# A new table needs a cfg.entity_fields and a cfg.table_specs entry, not new code.
+
+SUPERLATIVES = {"MAX_MONEY_ATTRIBUTES": -1, "MIN_MONEY_ATTRIBUTES": 1}
+
+
+@functools.lru_cache(maxsize=4096)
+def entity_pattern(value):
+    # Case-insensitive exact match, tolerating spaces after "/" (e.g. "Technology/ IT")
+    escaped_value = re.escape(value)
+    pattern = "^" + escaped_value.replace("/", "/\\s*") + "$"
+    return re.compile(pattern, re.IGNORECASE)
+
+
+def field_getter(path):
+    """
+    A function returning the value at a dotted path of a document (KeyError if missing).
+    """
+    parts = path.split(".")
+    if len(parts) == 1:
+        return operator.itemgetter(path)
+
+    def get(document):
+        for part in parts:
+            document = document[part]
+        return document
+    return get
+
+
+@functools.lru_cache(maxsize=None)
+def table_flattener(table_name):
+    """
+    The function converting the documents of `table_name` to a dict of result columns.
+    """
+    columns = cfg.table_specs[table_name]["columns"]
+    getters = [(column, field_getter(path)) for column, path in columns.items()]
+
+    def flatten(results):
+        table = {column: [] for column in columns}
+        appenders = [(table[column].append, get) for column, get in getters]
+        for result in results:
+            for append, get in appenders:
+                value = get(result)
+                append(value.date() if isinstance(value, datetime.datetime) else value)
+        return table
+    return flatten
+
+
+def merge_condition(query, field, condition):
+    # An equality and a range on the same field (e.g. "10% bonus, at most 15%") are combined.
+    existing = query.get(field)
+    if existing is None:
+        query[field] = condition
+        return
+    existing = existing if isinstance(existing, dict) else {"$eq": existing}
+    condition = condition if isinstance(condition, dict) else {"$eq": condition}
+    query[field] = {**existing, **condition}
+
+
+class QueryPlan:
+    """
+    The query of one table for one set of entity keys.
+
+    Attributes:
+        table_name (str): The collection queried.
+        signature (frozenset): The entity keys the plan was compiled for.
+        text_checks (list): (entity, document field) of the text entities, in check order.
+        amount_checks (list): (entity, field, operator, exact_match key, is money field) of the numeric entities.
+        direction (int): -1 for MAX_MONEY_ATTRIBUTES, 1 for MIN_MONEY_ATTRIBUTES, None otherwise.
+        projection (dict): The document fields read by the flattener.
+        flatten: Function converting the found documents to result columns.
+        rollups (bool): Whether MAX/MIN queries may be answered by the compensation rollups.
+    """
+
+    def __init__(self, table_name, signature):
+        spec = cfg.table_specs[table_name]
+        self.table_name = table_name
+        self.signature = signature
+        self.text_checks = [(entity, field) for entity, field in cfg.entity_fields[table_name].items()
+                            if entity in signature]
+        money_fields = cfg.money_fields.get(table_name, ())
+        self.amount_checks = [(entity, field, operator_name, match_key, field in money_fields)
+                              for entity, field, operator_name, match_key in spec.get("amounts", ())
+                              if entity in signature]
+        self.sort = spec.get("sort")
+        self.sort_is_money = self.sort in money_fields
+        self.direction = None
+        if self.sort is not None:
+            for entity, direction in SUPERLATIVES.items():
+                if entity in signature:
+                    self.direction = direction
+                    break
+        self.projection = dict.fromkeys(spec["columns"].values(), 1)
+        self.projection["_id"] = 0
+        self.flatten = table_flattener(table_name)
+        self.rollups = spec.get("rollups", False)
+        self.uses_range_index = self.direction is not None or any(
+            operator_name is not None for _, _, operator_name, _, _ in self.amount_checks)
+
+    @staticmethod
+    def amount_field(field, is_money, exact_match):
+        # Money compares native amounts within one matched currency and USD amounts across currencies.
+        return num_field(field) if not is_money or "CURRENCY" in exact_match else usd_field(field)
+
+    def bind(self, table, prediction_result):
+        """
+        Check each entity of `prediction_result` and build the query of the matching ones.
+
+        Returns:
+            tuple: (query, exact_match, flag_not_found).
+        """
+        query = {}
+        exact_match = {}
+        flag_not_found = {}
+        for entity, field in self.text_checks:
+            value = prediction_result[entity]
+            pattern = entity_pattern(value)
+            if table.count_documents({field: pattern}) > 0:
+                query[field] = pattern
+                exact_match[entity] = value
+            else:
+                flag_not_found[entity] = value
+        for entity, field, operator_name, match_key, is_money in self.amount_checks:
+            amount = parse_amount(prediction_result[entity])
+            if amount is None:
+                # Nothing numeric to compare with (e.g. "competitive").
+                flag_not_found[match_key] = prediction_result[entity]
+                continue
+            if operator_name is None:
+                query_key = num_field(field)
+                condition = amount
+            else:
+                query_key = self.amount_field(field, is_money, exact_match)
+                condition = {operator_name: amount}
+            if table.count_documents({query_key: condition}) > 0:
+                merge_condition(query, query_key, condition)
+                exact_match[match_key] = amount
+            else:
+                flag_not_found[match_key] = amount
+        return query, exact_match, flag_not_found
+
+    def hint(self, exact_match):
+        """
+        The numeric range index (see normalize_numeric.py) serving the query, or None.
+        """
+        if not cfg.QUERY_PLAN_HINTS or not self.uses_range_index or self.sort is None:
+            return None
+        if self.sort_is_money and "CURRENCY" not in exact_match:
+            return [(usd_field(self.sort), 1)]
+        if self.sort_is_money:
+            return [("currency.code", 1), (num_field(self.sort), 1)]
+        return [(num_field(self.sort), 1)]
+
+    def sorted_query(self, query, exact_match):
+        """
+        The query and sort key of a MAX/MIN find. Documents without a number (unparsable
+        amounts, currencies without a rate) would sort first for MIN and are left out.
+        """
+        sort_key = self.amount_field(self.sort, self.sort_is_money, exact_match)
+        query = dict(query)
+        merge_condition(query, sort_key, {"$ne": None})
+        return query, sort_key
+
+    def describe(self, query, exact_match):
+        """
+        The find this plan issues for a bound query (for the slow query log).
+        """
+        description = {"table": self.table_name, "entities": sorted(self.signature), "filter": query}
+        if self.direction is not None:
+            description["filter"], sort_key = self.sorted_query(query, exact_match)
+            description["sort"] = [sort_key, self.direction]
+            description["limit"] = 1
+        hint = self.hint(exact_match)
+        if hint is not None:
+            description["hint"] = hint
+        return description
+
+    def find(self, table, query, exact_match):
+        if self.direction is None:
+            cursor = table.find(query, self.projection)
+        else:
+            query, sort_key = self.sorted_query(query, exact_match)
+            cursor = table.find(query, self.projection).sort(sort_key, self.direction).limit(1)
+        hint = self.hint(exact_match)
+        if hint is not None:
+            cursor = cursor.hint(hint)
+        return cursor
+
+
+@functools.lru_cache(maxsize=None)
+def plan_keys(table_name):
+    spec = cfg.table_specs[table_name]
+    keys = set(cfg.entity_fields[table_name])
+    keys.update(entity for entity, _, _, _ in spec.get("amounts", ()))
+    if spec.get("sort") is not None:
+        keys.update(SUPERLATIVES)
+    return frozenset(keys)
+
+
+def plan_signature(table_name, prediction_result):
+    return plan_keys(table_name).intersection(prediction_result)
+
+
+@functools.lru_cache(maxsize=cfg.QUERY_PLAN_CACHE_SIZE)
+def compile_plan(table_name, signature):
+    metrics.inc("query_plan_compilations_total", help_text="Query plans compiled", table=table_name)
+    return QueryPlan(table_name, signature)
+
+
+def plan_for(table_name, prediction_result):
+    """
+    The cached QueryPlan of `table_name` for the entity keys of `prediction_result`.
+    """
+    return compile_plan(table_name, plan_signature(table_name, prediction_result))
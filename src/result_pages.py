@@ -0,0 +1,78 @@
+import time
+import threading
+import config as cfg
+from collections import OrderedDict
+from lazy_imports import lazy_import
+from tracing import metrics
+
+pd = lazy_import("pandas")
+
+# Paged /search results.
+#
+# A client asks for rows [offset, offset + limit) of a result with the "offset" and
+# "limit" form fields, and gets the total row count in the X-Total-Count header. Full
+# results are kept for RESULT_CACHE_TTL seconds per normalized query and data version,
+# so the following pages are sliced from memory instead of running the pipeline again.
+
+
+def parse_page(form_data):
+    """
+    The (offset, limit) of a request; limit is None when the whole result is wanted.
+
+    Raises:
+        ValueError: If offset or limit is not a non-negative integer.
+    """
+    offset = int(form_data.get("offset") or 0)
+    limit = form_data.get("limit")
+    limit = int(limit) if limit not in (None, "") else None
+    if offset < 0 or (limit is not None and limit <= 0):
+        raise ValueError("offset must be >= 0 and limit > 0")
+    if limit is not None:
+        limit = min(limit, cfg.MAX_PAGE_SIZE)
+    return offset, limit
+
+
+def page_of(result, offset, limit):
+    """
+    Rows [offset, offset + limit) of a result table, and its total row count.
+
+    Error dictionaries are returned whole.
+    """
+    if not isinstance(result, pd.DataFrame):
+        return result, None
+    if limit is None and offset == 0:
+        return result, len(result)
+    end = None if limit is None else offset + limit
+    return result.iloc[offset:end], len(result)
+
+
+class ResultCache:
+    """
+    Recent full results per normalized query, valid for one data version and `ttl` seconds.
+    """
+
+    def __init__(self, capacity=cfg.RESULT_CACHE_SIZE, ttl=cfg.RESULT_CACHE_TTL):
+        self.capacity = capacity
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, query, version):
+        with self._lock:
+            entry = self.entries.get(query)
+            if entry is None:
+                return None
+            result, entry_version, stored_at = entry
+            if entry_version != version or time.monotonic() - stored_at > self.ttl:
+                del self.entries[query]
+                return None
+            self.entries.move_to_end(query)
+        metrics.inc("result_cache_hits_total", help_text="Result pages served from the result cache")
+        return result
+
+    def put(self, query, version, result):
+        with self._lock:
+            self.entries[query] = (result, version, time.monotonic())
+            self.entries.move_to_end(query)
+            while len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
@@ -0,0 +1,331 @@
+import math
+import time
+import bisect
+import itertools
+import threading
+import config as cfg
+from array import array
+from numeric import parse_amount, to_usd
+from tracing import metrics
+
+# Entities that filter on the summarised value itself; queries using them are not
+# answered from rollups.
+VALUE_FILTER_KEYS = ("AMOUNT_FROM", "AMOUNT_TO", "SALARY_AMOUNT", "BONUS_PERCENT", "BENEFITS_AMOUNT")
+
+
+def normalize(value):
+    return " ".join(str(value).lower().split()) if value is not None else None
+
+
+def get_path(document, path):
+    for part in path.split("."):
+        if not isinstance(document, dict):
+            return None
+        document = document.get(part)
+    return document
+
+
+# Percentiles come from a mergeable log-bucketed histogram (as in DDSketch): a positive
+# value v is counted in bucket ceil(log(v) / log(GAMMA)), so every percentile is within
+# cfg.ROLLUP_SKETCH_ACCURACY relative error of the exact value, in memory that grows with
+# the logarithm of the value range instead of with the number of values.
+GAMMA = (1 + cfg.ROLLUP_SKETCH_ACCURACY) / (1 - cfg.ROLLUP_SKETCH_ACCURACY)
+LOG_GAMMA = math.log(GAMMA)
+# Values <= 0 share the bucket below every other one.
+ZERO_BUCKET = -2 ** 31
+
+
+def bucket_of(value):
+    return math.ceil(math.log(value) / LOG_GAMMA) if value > 0 else ZERO_BUCKET
+
+
+def bucket_value(bucket):
+    return 0.0 if bucket == ZERO_BUCKET else 2 * GAMMA ** bucket / (GAMMA + 1)
+
+
+def earlier(document_id, other_id):
+    # Between documents with the same value, the one inserted first (smallest _id) is kept.
+    return other_id is None or (document_id is not None and document_id < other_id)
+
+
+class RollupCell:
+    """
+    Summary statistics of one group: count, sum, min, max, the _ids of the documents
+    holding the minimum and maximum value and the histogram for the percentiles. The
+    histogram is a sorted array of (bucket << 32 | count) entries; a cell with a single
+    value (most leaf cells) has none and its percentiles are that value.
+    """
+
+    __slots__ = ("count", "total", "min", "max", "buckets", "min_id", "max_id")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        self.buckets = None
+        self.min_id = None
+        self.max_id = None
+
+    def histogram(self):
+        if self.buckets is None:
+            return ((bucket_of(self.min), 1),)
+        return [(entry >> 32, entry & 0xFFFFFFFF) for entry in self.buckets]
+
+    def count_in_bucket(self, bucket, count):
+        if self.buckets is None:
+            # The single value held so far.
+            self.buckets = array("q", [bucket_of(self.min) << 32 | 1])
+        i = bisect.bisect_left(self.buckets, bucket << 32)
+        if i < len(self.buckets) and self.buckets[i] >> 32 == bucket:
+            self.buckets[i] += count
+        else:
+            self.buckets.insert(i, bucket << 32 | count)
+
+    def add(self, value, document_id):
+        if self.count:
+            self.count_in_bucket(bucket_of(value), 1)
+        if self.count == 0 or value < self.min:
+            self.min, self.min_id = value, document_id
+        if self.count == 0 or value > self.max:
+            self.max, self.max_id = value, document_id
+        self.count += 1
+        self.total += value
+
+    def merge(self, other):
+        if other.count == 0:
+            return
+        if self.count:
+            for bucket, count in other.histogram():
+                self.count_in_bucket(bucket, count)
+        elif other.buckets is not None:
+            self.buckets = array("q", other.buckets)
+        if self.count == 0 or other.min < self.min or (other.min == self.min and earlier(other.min_id, self.min_id)):
+            self.min, self.min_id = other.min, other.min_id
+        if self.count == 0 or other.max > self.max or (other.max == self.max and earlier(other.max_id, self.max_id)):
+            self.max, self.max_id = other.max, other.max_id
+        self.count += other.count
+        self.total += other.total
+
+    def percentile(self, q):
+        # Nearest-rank percentile, from the histogram and clamped to the exact min and max.
+        rank = min(self.count, max(1, math.ceil(q / 100 * self.count)))
+        seen = 0
+        value = self.max
+        for bucket, count in self.histogram():
+            seen += count
+            if rank <= seen:
+                value = bucket_value(bucket)
+                break
+        return min(self.max, max(self.min, value))
+
+    def summary(self):
+        summary = {"count": self.count, "min": self.min, "max": self.max, "mean": self.total / self.count}
+        for q in cfg.ROLLUP_PERCENTILES:
+            summary[f"p{q}"] = self.percentile(q)
+        return summary
+
+
+class TableRollup:
+    """
+    The rollup of one collection.
+
+    Every combination of at most `max_filters` fixed dimension values (the others
+    wildcarded as None) has a cell, so those dimension filters are answered with a single
+    dictionary lookup; `covers` tells whether a key is one of them. Only dimensions that
+    queries can filter on (cfg.entity_fields) are kept. A full build adds each document to
+    its leaf cell (all dimensions fixed) only and then merges every leaf into its cells;
+    incremental refreshes add the few new documents to all of their cells directly.
+    """
+
+    def __init__(self, table_name, spec, max_filters=cfg.ROLLUP_MAX_FILTERS):
+        self.table_name = table_name
+        self.value_field = spec["value"]
+        self.currency_field = spec.get("currency")
+        self.partition = spec["partition"]
+        queried = cfg.entity_fields.get(table_name, {})
+        self.dimensions = {entity: field for entity, field in spec["dimensions"].items() if entity in queried}
+        self.max_filters = max_filters
+        self.masks = [mask for mask in itertools.product((True, False), repeat=len(self.dimensions))
+                      if sum(mask) <= max_filters]
+        self.cells = {}
+        self.known_values = {entity: set() for entity in list(self.partition) + list(self.dimensions)}
+        self.last_id = None
+
+    def entities(self):
+        return list(self.partition) + list(self.dimensions)
+
+    def cell_keys(self, leaf_key):
+        # A dimension whose value is missing (None) is the same in the fixed and the wildcard key.
+        partition, dimensions = leaf_key[:len(self.partition)], leaf_key[len(self.partition):]
+        return {partition + tuple(value_key if keep else None for value_key, keep in zip(dimensions, mask))
+                for mask in self.masks}
+
+    def covers(self, key):
+        return sum(value_key is not None for value_key in key[len(self.partition):]) <= self.max_filters
+
+    def cell(self, key):
+        cell = self.cells.get(key)
+        if cell is None:
+            cell = self.cells[key] = RollupCell()
+        return cell
+
+    def add(self, document, expand=True):
+        """
+        Add a document to its leaf cell only, or with `expand` to all of its cells.
+        """
+        if self.last_id is None or document["_id"] > self.last_id:
+            self.last_id = document["_id"]
+        value = parse_amount(get_path(document, self.value_field))
+        if self.currency_field is not None:
+            value = to_usd(value, get_path(document, self.currency_field))
+        if value is None:
+            return
+        partition = tuple(normalize(get_path(document, field)) for field in self.partition.values())
+        dimensions = tuple(normalize(get_path(document, field)) for field in self.dimensions.values())
+        for entity, value_key in zip(self.entities(), partition + dimensions):
+            if value_key is not None:
+                self.known_values[entity].add(value_key)
+        leaf_key = partition + dimensions
+        for key in (self.cell_keys(leaf_key) if expand else (leaf_key,)):
+            self.cell(key).add(value, document["_id"])
+
+    def expand(self):
+        """
+        Replace the leaf cells of a build by the cells of at most `max_filters` dimensions.
+        """
+        leaves, self.cells = self.cells, {}
+        for leaf_key, leaf in leaves.items():
+            for key in self.cell_keys(leaf_key):
+                self.cell(key).merge(leaf)
+
+    def key(self, filters):
+        """
+        The cell key for entity filters, or None if a partition entity is missing.
+        """
+        partition = tuple(normalize(filters.get(entity)) for entity in self.partition)
+        if None in partition:
+            return None
+        return partition + tuple(normalize(filters.get(entity)) for entity in self.dimensions)
+
+
+class CompensationRollups:
+    """
+    In-process salary, bonus and benefit summaries keyed by job grade, location,
+    location group, client and currency (see cfg.rollup_specs).
+
+    The tables are built from MongoDB once, refreshed incrementally with documents whose
+    _id is newer than the last one seen, and rebuilt in full periodically to pick up
+    updates and deletes.
+    """
+
+    def __init__(self, specs=cfg.rollup_specs):
+        self.specs = specs
+        self.tables = {}
+        self.built_at = None
+        self.refreshed_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self):
+        return self.built_at is not None
+
+    def build(self, db):
+        tables = {}
+        for table_name, spec in self.specs.items():
+            rollup = TableRollup(table_name, spec)
+            for document in db[table_name].find().sort("_id", 1):
+                rollup.add(document, expand=False)
+            rollup.expand()
+            tables[table_name] = rollup
+        with self._lock:
+            self.tables = tables
+            self.built_at = self.refreshed_at = time.time()
+        metrics.inc("rollup_builds_total", help_text="Full rollup rebuilds")
+
+    def refresh(self, db):
+        for table_name, rollup in list(self.tables.items()):
+            query = {"_id": {"$gt": rollup.last_id}} if rollup.last_id is not None else {}
+            documents = list(db[table_name].find(query).sort("_id", 1))
+            with self._lock:
+                for document in documents:
+                    rollup.add(document)
+        self.refreshed_at = time.time()
+
+    def run(self, db_factory, interval=cfg.ROLLUP_REFRESH_INTERVAL,
+            full_rebuild_interval=cfg.ROLLUP_FULL_REBUILD_INTERVAL):
+        db = db_factory()
+        while True:
+            try:
+                if not self.ready or time.time() - self.built_at >= full_rebuild_interval:
+                    self.build(db)
+                else:
+                    self.refresh(db)
+            except Exception as e:
+                print(f"Rollup refresh failed: {e!r}")
+            time.sleep(interval)
+
+    def start(self, db_factory):
+        threading.Thread(target=self.run, args=(db_factory,), name="rollups", daemon=True).start()
+
+    def summary(self, table_name, filters):
+        """
+        Statistics for the rows of `table_name` matching the entity filters.
+
+        Returns:
+            dict or None: count/min/max/mean/percentiles, or None if nothing matches.
+
+        Raises:
+            ValueError: If the filters fix more dimensions than the rollups keep cells for.
+        """
+        rollup = self.tables.get(table_name)
+        if rollup is None:
+            return None
+        key = rollup.key(filters)
+        if key is not None and not rollup.covers(key):
+            raise ValueError(f"At most {rollup.max_filters} dimension filters are supported")
+        with self._lock:
+            cell = rollup.cells.get(key) if key is not None else None
+            return cell.summary() if cell is not None else None
+
+    def serve_extreme(self, table_name, prediction_result):
+        """
+        Answer a MAX_MONEY_ATTRIBUTES/MIN_MONEY_ATTRIBUTES query from the rollups.
+
+        Entity values are checked against the known values of each dimension the way the
+        table handlers check them with count_documents: found values filter, unknown ones
+        are reported in flag_not_found.
+
+        Returns:
+            tuple or None: (_ids of the matching documents, exact_match, flag_not_found),
+            or None when the query has to go to MongoDB (no superlative, value filters,
+            more than `max_filters` dimension filters or rollups not built yet).
+        """
+        rollup = self.tables.get(table_name)
+        if rollup is None or not self.ready:
+            return None
+        if "MAX_MONEY_ATTRIBUTES" in prediction_result:
+            use_max = True
+        elif "MIN_MONEY_ATTRIBUTES" in prediction_result:
+            use_max = False
+        else:
+            return None
+        if any(key in prediction_result for key in VALUE_FILTER_KEYS):
+            return None
+        exact_match = {}
+        flag_not_found = {}
+        for entity in rollup.entities():
+            if entity in prediction_result:
+                value = prediction_result[entity]
+                if normalize(value) in rollup.known_values[entity]:
+                    exact_match[entity] = value
+                else:
+                    flag_not_found[entity] = value
+        key = rollup.key(exact_match)
+        if key is None or not rollup.covers(key):
+            return None
+        with self._lock:
+            cell = rollup.cells.get(key)
+            document_id = None if cell is None else (cell.max_id if use_max else cell.min_id)
+        metrics.inc("rollup_hits_total", help_text="Queries answered from compensation rollups", table=table_name)
+        return ([document_id] if document_id is not None else []), exact_match, flag_not_found
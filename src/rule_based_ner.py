@@ -0,0 +1,90 @@
+import re
+
+# Entities extracted by these rules while the LLM is unavailable carry this key, with the
+# words of the query the rules could not classify (job titles, locations, client names, ...).
+# Such degraded responses are neither cached nor stored, and respond_query answers them with
+# FAISS recommendations when words were left over instead of an unfiltered table.
+DEGRADED_KEY = "degraded"
+
+# Words that carry no entity of their own.
+STOP_WORDS = frozenset("""
+a about above across after all also am an and any are as at be below between by can could do does
+each for from get give how i in is it list many me much my of on or our over per please show than
+that the their there these this those to under up want what when where which who whose with would
+you your annual annually average month monthly year yearly paid pay offered offering range amount
+amounts find tell need looking know percent k m
+""".split())
+WORD_PATTERN = re.compile(r"[^\W\d_][\w'&-]*")
+
+
+class RuleBasedEntityExtractor:
+    """
+    A keyword based entity extractor used when the LLM is unavailable.
+
+    It only recognises the keyword-like entities (SALARY, BONUS, JOB, LOCATION_GROUP,
+    CURRENCY, amounts, ...), enough for `process_query` to route the query to the right
+    table. Job titles, locations and client names are not recognised; `unclassified_words`
+    reports them so callers do not answer with a table missing those filters.
+    """
+
+    keyword_entities = {
+        "SALARY_RANGE": ["salary range", "pay range", "payscale", "pay scale", "compensation range",
+                         "salary brackets", "income brackets", "remuneration range", "stipend range"],
+        "SALARY": ["salary", "salaries", "compensation", "income", "earn", "earnings", "pay",
+                   "remuneration", "wages", "stipend"],
+        "BONUS": ["bonus", "bonuses"],
+        "BENEFITS": ["benefit", "benefits"],
+        "JOB": ["job titles", "jobtitles", "job title", "jobs", "vacancies", "opportunities", "job listings"],
+        "CLIENT": ["clients", "client", "companies", "company", "organizations", "organization"],
+        "MAX_MONEY_ATTRIBUTES": ["highest", "greatest", "biggest", "maximum", "top"],
+        "MIN_MONEY_ATTRIBUTES": ["lowest", "least", "smallest", "minimum", "bottom"],
+    }
+    location_groups = ['uk', 'europe', 'middle east', 'apac', 'north america', 'india', 'central america',
+                       'south america', 'south korea', 'asean', 'nordics', 'africa']
+    currencies = ["USD", "GBP", "EUR", "INR", "NPR", "AUD", "CAD", "AED", "SGD", "JPY", "CHF", "KRW"]
+    amount = r"(\d[\d,]*(?:\.\d+)?\s*[kKmM]?)"
+
+    def remember(self, query, entities):
+        # Nothing is cached: extraction is cheap enough to repeat.
+        pass
+
+    def extract_named_entities(self, query):
+        text = query.lower()
+        entities = {}
+        for entity, keywords in self.keyword_entities.items():
+            for keyword in keywords:
+                if re.search(r"\b" + re.escape(keyword) + r"\b", text):
+                    entities[entity] = keyword
+                    break
+        if "SALARY_RANGE" in entities:
+            entities.pop("SALARY", None)
+        for group in self.location_groups:
+            if re.search(r"\b" + re.escape(group) + r"\b", text):
+                entities["LOCATION_GROUP"] = group
+                break
+        for currency in self.currencies:
+            if re.search(r"\b" + currency + r"\b", query, re.IGNORECASE):
+                entities["CURRENCY"] = currency
+                break
+        match = re.search(r"(?:greater than|more than|above|over|at least|from)\s+" + self.amount, text)
+        if match:
+            entities["AMOUNT_FROM"] = match.group(1)
+        match = re.search(r"(?:less than|below|under|at most|up to|to)\s+" + self.amount, text)
+        if match:
+            entities["AMOUNT_TO"] = match.group(1)
+        match = re.search(r"(\d+(?:\.\d+)?)\s*(?:%|percent)", text)
+        if match and "BONUS" in entities:
+            entities["BONUS_PERCENT"] = match.group(1)
+        entities["query"] = query
+        return entities
+
+    @staticmethod
+    def unclassified_words(query, entities):
+        """
+        The words of `query` that are neither stop words nor part of an extracted value.
+        """
+        covered = set(STOP_WORDS)
+        for key, value in entities.items():
+            if key != "query" and isinstance(value, str):
+                covered.update(WORD_PATTERN.findall(value.lower()))
+        return [word for word in WORD_PATTERN.findall(query.lower()) if word not in covered]
@@ -0,0 +1,118 @@
+import re
+import threading
+import config as cfg
+from collections import OrderedDict
+from lazy_imports import lazy_import
+from rule_based_ner import STOP_WORDS, WORD_PATTERN
+
+np = lazy_import("numpy")
+faiss = lazy_import("faiss")
+
+# Entities whose values are copied from the query text. A cached answer is only reused when
+# all of them appear in the new query as well; keyword entities such as SALARY or CLIENT
+# may be paraphrased freely.
+VALUE_ENTITIES = ("JOB_TITLE", "LOCATION", "LOCATION_GROUP", "CLIENT_NAME", "CLIENT_TYPE", "SKILLS", "CURRENCY",
+                  "BENEFITS_NAME", "BENEFITS_AMOUNT", "BONUS_PERCENT", "SALARY_AMOUNT", "AMOUNT_FROM", "AMOUNT_TO",
+                  "MAX_MONEY_ATTRIBUTES", "MIN_MONEY_ATTRIBUTES")
+NUMBER_PATTERN = re.compile(r"\d+(?:[.,]\d+)*")
+# Words that turn a lookup into a MAX/MIN query; both queries must use the same ones.
+SUPERLATIVE_WORDS = frozenset({"highest", "greatest", "biggest", "maximum", "max", "top", "most", "best",
+                               "lowest", "least", "smallest", "minimum", "min", "bottom", "worst"})
+
+
+def normalize_text(text):
+    return " ".join(str(text).lower().split())
+
+
+class SemanticEntityCache:
+    """
+    Reuses NER results for paraphrased queries.
+
+    Query embeddings of LLM answers are kept in an inner-product FAISS index of unit
+    vectors (cosine similarity). A new query reuses the entities of a cached one when
+    the similarity is at least `threshold` and the cheap consistency checks pass: every
+    value entity of the cached answer occurs in the new query, every content word of the
+    new query (any case, stop words aside) occurs in the cached query or in one of its
+    entity values, so "senior manager in london" never reuses the answer for "manager",
+    and both queries contain the same numbers and superlatives ("highest", "lowest", ...).
+    Beyond `capacity` the oldest entries are evicted.
+
+    Attributes:
+        encoder: An object with a SentenceTransformer-style `encode(sentences)` method.
+        threshold (float): Minimum cosine similarity for a hit.
+        capacity (int): Maximum number of cached queries.
+    """
+
+    def __init__(self, encoder, threshold=cfg.NER_SEMANTIC_THRESHOLD, capacity=cfg.NER_SEMANTIC_CACHE_SIZE,
+                 candidates=4):
+        self.encoder = encoder
+        self.threshold = threshold
+        self.capacity = capacity
+        self.candidates = candidates
+        self.index = None
+        self.entries = OrderedDict()
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def encode(self, query):
+        vector = np.array(self.encoder.encode([query]), dtype="float32").reshape(1, -1)
+        faiss.normalize_L2(vector)
+        return vector
+
+    @staticmethod
+    def consistent(query, cached_query, entities):
+        text = normalize_text(query)
+        cached_text = normalize_text(cached_query)
+        for key in VALUE_ENTITIES:
+            if key in entities and normalize_text(entities[key]) not in text:
+                return False
+        # The other way round: the new query must not add content the cached answer has no entity for.
+        words = set(WORD_PATTERN.findall(text))
+        cached_words = set(WORD_PATTERN.findall(cached_text))
+        covered = cached_words | STOP_WORDS
+        for key, value in entities.items():
+            if key != "query":
+                covered.update(WORD_PATTERN.findall(normalize_text(value)))
+        if not words <= covered:
+            return False
+        if SUPERLATIVE_WORDS.intersection(words) != SUPERLATIVE_WORDS.intersection(cached_words):
+            return False
+        return set(NUMBER_PATTERN.findall(text)) == set(NUMBER_PATTERN.findall(cached_text))
+
+    def lookup(self, query, vector):
+        """
+        Return the cached entities for a query similar to `query`, or None.
+
+        The returned dictionary is a copy with "query" set to the new query.
+        """
+        with self._lock:
+            if self.index is None or not self.entries:
+                return None
+            scores, ids = self.index.search(vector, min(self.candidates, len(self.entries)))
+            for score, entry_id in zip(scores[0], ids[0]):
+                if score < self.threshold:
+                    break
+                entry = self.entries.get(int(entry_id))
+                if entry is None:
+                    continue
+                cached_query, entities = entry
+                if self.consistent(query, cached_query, entities):
+                    return {**entities, "query": query}
+        return None
+
+    def add(self, query, entities, vector):
+        with self._lock:
+            if self.index is None:
+                self.index = faiss.IndexIDMap(faiss.IndexFlatIP(vector.shape[1]))
+            entry_id = self._next_id
+            self._next_id += 1
+            self.index.add_with_ids(vector, np.array([entry_id], dtype="int64"))
+            self.entries[entry_id] = (query, dict(entities))
+            if len(self.entries) > self.capacity:
+                # remove_ids rewrites the whole flat index, so evict a tenth at once.
+                keep = int(self.capacity * 0.9)
+                evicted = [self.entries.popitem(last=False)[0] for _ in range(len(self.entries) - keep)]
+                self.index.remove_ids(np.array(evicted, dtype="int64"))
+
+    def __len__(self):
+        return len(self.entries)
@@ -0,0 +1,98 @@
+import json
+import importlib.util
+from starlette.responses import Response
+from lazy_imports import lazy_import
+from tracing import stage
+
+pd = lazy_import("pandas")
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# pyarrow is optional; Arrow is only offered when it is installed.
+pa = lazy_import("pyarrow") if importlib.util.find_spec("pyarrow") else None
+
+# Search results are serialized exactly once, straight from the DataFrame returned by
+# respond_query, in the format negotiated through the Accept header:
+#   application/json                        - list of records (default)
+#   application/vnd.jobsearch.columns+json  - {"columns": [...], "data": {column: [values]}}
+#   application/vnd.apache.arrow.stream     - Arrow IPC stream (needs pyarrow)
+
+JSON_MEDIA_TYPE = "application/json"
+COLUMNS_MEDIA_TYPE = "application/vnd.jobsearch.columns+json"
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+
+
+def dumps(payload):
+    if orjson is not None:
+        return orjson.dumps(payload, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(payload, default=str).encode()
+
+
+def negotiate(accept):
+    """
+    Pick the response media type for an Accept header value.
+    """
+    accept = (accept or "").lower()
+    if ARROW_MEDIA_TYPE in accept and pa is not None:
+        return ARROW_MEDIA_TYPE
+    if COLUMNS_MEDIA_TYPE in accept:
+        return COLUMNS_MEDIA_TYPE
+    return JSON_MEDIA_TYPE
+
+
+def to_records(df):
+    # NaN is not valid JSON; orjson turns None into null.
+    return df.astype(object).where(df.notna(), None).to_dict(orient="records")
+
+
+def to_columns(df):
+    return {"columns": list(df.columns),
+            "data": {column: df[column].astype(object).where(df[column].notna(), None).tolist()
+                     for column in df.columns}}
+
+
+def to_arrow(df):
+    try:
+        table = pa.Table.from_pandas(df, preserve_index=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # Mixed-type object columns (e.g. dates next to strings) are sent as strings.
+        object_columns = df.select_dtypes(include="object").columns
+        table = pa.Table.from_pandas(df.astype({column: str for column in object_columns}), preserve_index=False)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def serialize(result, media_type=JSON_MEDIA_TYPE):
+    """
+    Serialize a respond_query result.
+
+    Args:
+        result (pandas.DataFrame or dict): A result table, or an error dictionary.
+        media_type (str): One of the media types returned by `negotiate`.
+
+    Returns:
+        tuple: (body bytes, media type actually used). Error dictionaries are always JSON.
+    """
+    with stage("serialization"):
+        if not isinstance(result, pd.DataFrame):
+            return dumps(result), JSON_MEDIA_TYPE
+        if media_type == ARROW_MEDIA_TYPE:
+            return to_arrow(result), ARROW_MEDIA_TYPE
+        if media_type == COLUMNS_MEDIA_TYPE:
+            return dumps(to_columns(result)), COLUMNS_MEDIA_TYPE
+        return dumps(to_records(result)), JSON_MEDIA_TYPE
+
+
+class SearchResponse(Response):
+    """
+    A response that serializes a respond_query result once, in the negotiated format.
+    """
+
+    def __init__(self, result, media_type=JSON_MEDIA_TYPE, **kwargs):
+        body, media_type = serialize(result, media_type)
+        super().__init__(content=body, media_type=media_type, **kwargs)
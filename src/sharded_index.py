@@ -0,0 +1,244 @@
+import os
+import time
+import argparse
+import threading
+import tempfile
+import multiprocessing
+import config as cfg
+from multiprocessing.connection import Client, Listener
+from lazy_imports import lazy_import
+
+np = lazy_import("numpy")
+faiss = lazy_import("faiss")
+
+# Sharded FAISS search.
+#
+# The index is split by id range into `faiss_index.shard-<i>-of-<n>.bin` files next to
+# faiss_index.bin (ids are kept, so results still map to faiss_index_id). Each shard is
+# served by its own process, locally or on another node; ShardedIndex scatters a batch of
+# query vectors to all shards in parallel and merges their top-k lists. It has the
+# `search(vectors, k)` interface of a FAISS index, so SearchRecommender uses it unchanged.
+#
+# python sharded_index.py split --shards 4
+# python sharded_index.py check --shards 4 --queries 200 --k 100   # compare against the monolithic index
+# FAISS_SHARD_AUTHKEY=<secret> python sharded_index.py serve --shard 0 --shards 4 --address 10.0.0.5:7100
+#
+# The shard protocol pickles its messages and the receiving side unpickles them, so anyone
+# who can connect with the key can run code in the process: remote servers refuse to start
+# without FAISS_SHARD_AUTHKEY, listen on 127.0.0.1 unless given another address, and must
+# only be exposed on a private network.
+
+
+def shard_paths(index_path, shard_count):
+    base, extension = os.path.splitext(index_path)
+    return [f"{base}.shard-{shard}-of-{shard_count}{extension}" for shard in range(shard_count)]
+
+
+def split_index(index, shard_count):
+    """
+    Split an index whose vectors can be reconstructed into `shard_count` id ranges.
+
+    Returns:
+        list: One IndexIDMap2 per shard, with the same metric as `index`.
+    """
+    shard_size = -(-index.ntotal // shard_count)
+    shards = []
+    for start in range(0, shard_count * shard_size, shard_size):
+        count = max(0, min(shard_size, index.ntotal - start))
+        if index.metric_type == faiss.METRIC_INNER_PRODUCT:
+            shard = faiss.IndexIDMap2(faiss.IndexFlatIP(index.d))
+        else:
+            shard = faiss.IndexIDMap2(faiss.IndexFlatL2(index.d))
+        if count:
+            shard.add_with_ids(index.reconstruct_n(start, count), np.arange(start, start + count, dtype="int64"))
+        shards.append(shard)
+    return shards
+
+
+def parse_address(address):
+    # "host:port" for TCP, anything else is a Unix socket path.
+    host, _, port = address.rpartition(":")
+    return (host, int(port)) if host and port.isdigit() else address
+
+
+def handle_connection(index, connection):
+    try:
+        while True:
+            request = connection.recv()
+            if request[0] == "info":
+                connection.send((index.ntotal, index.metric_type == faiss.METRIC_INNER_PRODUCT))
+            else:
+                _, vectors, k = request
+                try:
+                    connection.send(index.search(vectors, k))
+                except Exception as e:
+                    connection.send(e)
+    except EOFError:
+        pass
+    finally:
+        connection.close()
+
+
+def serve_shard(path, address, threads=cfg.FAISS_SHARD_THREADS, authkey=cfg.FAISS_SHARD_AUTHKEY):
+    """
+    Serve one shard file on `address`, one thread per client connection.
+
+    FAISS releases the GIL while searching, so clients (e.g. the workers of
+    prefork_server.py) are served in parallel.
+    """
+    if not authkey:
+        raise ValueError("Refusing to serve a shard without an authkey; set FAISS_SHARD_AUTHKEY to a secret")
+    faiss.omp_set_num_threads(threads)
+    index = faiss.read_index(path)
+    with Listener(parse_address(address), authkey=authkey) as listener:
+        while True:
+            connection = listener.accept()
+            threading.Thread(target=handle_connection, args=(index, connection), daemon=True).start()
+
+
+def merge_results(results, k, largest_first=False):
+    """
+    Merge per-shard (distances, ids) pairs into the global top-k of each query.
+    """
+    distances = np.concatenate([result[0] for result in results], axis=1)
+    ids = np.concatenate([result[1] for result in results], axis=1)
+    # Shards holding fewer than k vectors pad with id -1.
+    padding = -np.inf if largest_first else np.inf
+    distances = np.where(ids < 0, padding, distances)
+    order = np.argsort(-distances if largest_first else distances, axis=1, kind="stable")[:, :k]
+    return np.take_along_axis(distances, order, axis=1), np.take_along_axis(ids, order, axis=1)
+
+
+class ShardedIndex:
+    """
+    A FAISS-compatible index whose shards are searched by shard server processes.
+
+    Given shard files, one local server process per shard is started on a Unix socket;
+    given addresses ("host:port"), already running servers (possibly on other nodes,
+    see `python sharded_index.py serve`) are used. Every process using the index opens its
+    own connections on first use, so the index can be created before forking workers.
+
+    Attributes:
+        addresses (list): The shard server addresses.
+        ntotal (int): Number of vectors over all shards.
+        largest_first (bool): True for inner-product shards, False for L2.
+    """
+
+    def __init__(self, paths=None, addresses=None, threads_per_shard=cfg.FAISS_SHARD_THREADS,
+                 authkey=cfg.FAISS_SHARD_AUTHKEY, connect_timeout=60.0):
+        self._processes = []
+        if addresses is not None and not authkey:
+            raise ValueError("Remote shard servers need a shared secret; set FAISS_SHARD_AUTHKEY")
+        # Local shard processes listen on Unix sockets in a private directory, with a fresh key.
+        self.authkey = authkey or os.urandom(32)
+        if addresses is None:
+            socket_dir = tempfile.mkdtemp(prefix="faiss-shards-")
+            addresses = [os.path.join(socket_dir, f"shard-{shard}.sock") for shard in range(len(paths))]
+            # spawn rather than fork: the parent may already run torch/OpenMP threads.
+            context = multiprocessing.get_context("spawn")
+            for path, address in zip(paths, addresses):
+                process = context.Process(target=serve_shard, args=(path, address, threads_per_shard, self.authkey),
+                                          name=f"faiss-shard-{os.path.basename(path)}", daemon=True)
+                process.start()
+                self._processes.append(process)
+        self.addresses = list(addresses)
+        self._pid = None
+        self._connections = []
+        self._lock = threading.Lock()
+        with self._lock:
+            connections = self._connect(connect_timeout)
+            for connection in connections:
+                connection.send(("info",))
+            shard_info = [connection.recv() for connection in connections]
+        self.ntotal = sum(ntotal for ntotal, _ in shard_info)
+        self.largest_first = shard_info[0][1]
+
+    def _connect(self, timeout=10.0):
+        # Connections are per process; forked children must not share their parent's.
+        if self._pid == os.getpid():
+            return self._connections
+        give_up_at = time.monotonic() + timeout
+        connections = []
+        for address in self.addresses:
+            while True:
+                try:
+                    connections.append(Client(parse_address(address), authkey=self.authkey))
+                    break
+                except (FileNotFoundError, ConnectionRefusedError):
+                    if time.monotonic() > give_up_at:
+                        raise
+                    time.sleep(0.1)
+        self._connections = connections
+        self._pid = os.getpid()
+        return connections
+
+    def search(self, vectors, k):
+        vectors = np.ascontiguousarray(vectors, dtype="float32")
+        with self._lock:
+            connections = self._connect()
+            # Scatter first, then gather, so all shards search in parallel.
+            for connection in connections:
+                connection.send(("search", vectors, k))
+            results = [connection.recv() for connection in connections]
+        for result in results:
+            if isinstance(result, Exception):
+                raise result
+        return merge_results(results, k, self.largest_first)
+
+    def close(self):
+        with self._lock:
+            if self._pid == os.getpid():
+                for connection in self._connections:
+                    connection.close()
+            self._connections = []
+            self._pid = None
+            for process in self._processes:
+                process.terminate()
+                process.join(timeout=5)
+            self._processes = []
+
+
+def check_shards(index, sharded_index, queries, k, seed=0):
+    """
+    Search random unit vectors with both indexes and report agreement and latency.
+    """
+    rng = np.random.default_rng(seed)
+    vectors = rng.standard_normal((queries, index.d)).astype("float32")
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    started = time.perf_counter()
+    _, expected = index.search(vectors, k)
+    monolithic_time = time.perf_counter() - started
+    started = time.perf_counter()
+    _, actual = sharded_index.search(vectors, k)
+    sharded_time = time.perf_counter() - started
+    overlap = np.mean([len(set(row_a) & set(row_b)) / k for row_a, row_b in zip(expected, actual)])
+    return {"queries": queries, "k": k, "overlap": float(overlap),
+            "monolithic_ms": monolithic_time * 1000, "sharded_ms": sharded_time * 1000}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Split faiss_index.bin into shards, serve or check them")
+    parser.add_argument("command", choices=["split", "check", "serve"])
+    parser.add_argument("--index", default=cfg.FAISS_INDEX_PATH)
+    parser.add_argument("--shards", type=int, default=cfg.FAISS_SHARDS or 4)
+    parser.add_argument("--shard", type=int, default=0, help="Shard to serve")
+    parser.add_argument("--address", default="127.0.0.1:7100",
+                        help="Address to serve the shard on; use a private network interface for remote shards")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=cfg.FAISS_TOP_K)
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        serve_shard(shard_paths(args.index, args.shards)[args.shard], args.address)
+    index = faiss.read_index(args.index)
+    if args.command == "split":
+        for path, shard in zip(shard_paths(args.index, args.shards), split_index(index, args.shards)):
+            faiss.write_index(shard, path)
+            print(f"{path}: {shard.ntotal} vectors")
+    else:
+        sharded_index = ShardedIndex(shard_paths(args.index, args.shards))
+        report = check_shards(index, sharded_index, args.queries, args.k)
+        sharded_index.close()
+        print(f"{report['queries']} queries, top-{report['k']} overlap with the monolithic index: "
+              f"{report['overlap']:.4f}; monolithic {report['monolithic_ms']:.1f} ms, "
+              f"sharded {report['sharded_ms']:.1f} ms")
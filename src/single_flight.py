@@ -0,0 +1,74 @@
+import asyncio
+from tracing import metrics
+
+# Request coalescing ("single flight") for the /search pipeline.
+#
+# The first request for a key starts the computation as a task; concurrent requests for
+# the same key wait on that task instead of running NER, the DB lookups and FAISS again,
+# and all of them receive its result or its exception. The task is shielded, so a waiter
+# that times out or disconnects does not cancel the computation for the others. Keys are
+# forgotten as soon as the computation finishes: this coalesces in-flight work only, it
+# is not a result cache.
+
+
+class SingleFlightTimeout(Exception):
+    """
+    Raised to a caller whose wait for a (possibly shared) computation exceeded the timeout.
+    """
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key into one computation.
+
+    Attributes:
+        name (str): Label of the single_flight_* metrics.
+        timeout (float): Seconds a caller waits for the result; None waits indefinitely.
+        calls (dict): key -> asyncio.Task of the computation in flight.
+    """
+
+    def __init__(self, name, timeout=None):
+        self.name = name
+        self.timeout = timeout
+        self.calls = {}
+
+    def _forget(self, key, task):
+        if self.calls.get(key) is task:
+            del self.calls[key]
+        # Retrieve the exception, so a failure nobody waited for any more is not logged as unhandled.
+        if not task.cancelled():
+            task.exception()
+
+    async def do(self, key, function, *args):
+        """
+        Run the coroutine function `function(*args)` once for all concurrent callers with `key`.
+
+        Returns:
+            tuple: (result, shared), where shared is True if the call joined a computation
+            started by another caller.
+
+        Raises:
+            SingleFlightTimeout: If the result was not ready within `timeout` seconds.
+            Exception: Whatever the computation raised, re-raised to every caller.
+        """
+        task = self.calls.get(key)
+        shared = task is not None
+        if shared:
+            metrics.inc("single_flight_shared_total", help_text="Calls that joined a computation in flight",
+                        flight=self.name)
+        else:
+            metrics.inc("single_flight_leaders_total", help_text="Calls that started a computation",
+                        flight=self.name)
+            task = asyncio.ensure_future(function(*args))
+            self.calls[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        try:
+            result = await asyncio.wait_for(asyncio.shield(task), self.timeout)
+        except asyncio.TimeoutError:
+            metrics.inc("single_flight_timeouts_total", help_text="Calls that gave up waiting for the result",
+                        flight=self.name)
+            raise SingleFlightTimeout(f"{self.name}: no result within {self.timeout}s") from None
+        return result, shared
+
+    def in_flight(self):
+        return len(self.calls)
@@ -0,0 +1,161 @@
+import os
+import json
+import time
+import argparse
+import datetime
+import config as cfg
+from lazy_imports import lazy_import
+
+pd = lazy_import("pandas")
+pymongo = lazy_import("pymongo")
+
+# Snapshot/sync of the MongoDB collections to Parquet, for the local storage backend
+# (local_storage.py, STORAGE_BACKEND=duckdb).
+#
+# Nested documents are flattened to dotted columns ("location.name") and ObjectIds are
+# stored as their hex strings. Columns whose values mix types (e.g. numbers and strings
+# in paidbonus_percentage) are stored as strings; the numeric shadow fields written by
+# normalize_numeric.py keep the typed values.
+#
+# python snapshot.py                       # full snapshot to cfg.SNAPSHOT_DIR
+# python snapshot.py --incremental         # rewrite only the collections that changed
+#
+# The documents carry no modification time, and in-place updates (e.g. the shadow fields of
+# normalize_numeric.py) keep their _id, so an incremental run compares MongoDB's content
+# hash of each collection (the dbHash command) with the one stored in the manifest and
+# rewrites a collection in full when it differs.
+#
+# Every run that changes something is a new snapshot version: rewritten collections go to
+# new <name>.v<version>.parquet files and the manifest, replaced atomically at the end,
+# names the file of each collection. Files in use are never overwritten, so a reader sees
+# either the previous or the new snapshot set. Files referenced by neither the new nor the
+# previous manifest are removed; those of the previous one stay for readers still loading it.
+
+SNAPSHOT_COLLECTIONS = list(cfg.table_views) + ["jobsearch_vectordb"]
+
+
+def flatten(document, prefix=""):
+    row = {}
+    for key, value in document.items():
+        column = f"{prefix}{key}"
+        if isinstance(value, dict):
+            row.update(flatten(value, f"{column}."))
+        elif isinstance(value, (list, tuple)):
+            row[column] = json.dumps(value, default=str)
+        elif value is not None and not isinstance(value, (str, int, float, bool, datetime.datetime)):
+            row[column] = str(value)
+        else:
+            row[column] = value
+    return row
+
+
+def stringify_mixed_columns(df):
+    for column in df.columns:
+        if df[column].dtype == object:
+            types = {type(value) for value in df[column].dropna()}
+            if len(types) > 1:
+                df[column] = df[column].map(lambda value: None if value is None or value != value else str(value))
+    return df
+
+
+def to_frame(documents):
+    return stringify_mixed_columns(pd.DataFrame([flatten(document) for document in documents]))
+
+
+def collection_hash(db, name):
+    """
+    MongoDB's hash of the contents of collection `name`, or None if the server cannot tell.
+    """
+    try:
+        return db.command("dbHash", collections=[name])["collections"].get(name)
+    except Exception as e:
+        print(f"{name}: no content hash ({e!r})")
+        return None
+
+
+def collection_file(name, info):
+    # Snapshots written before versioning have no "file" in their manifest.
+    return info.get("file", f"{name}.parquet")
+
+
+def snapshot_collection(db, name, path, batch_size=10000):
+    """
+    Write collection `name` to the Parquet file `path`.
+
+    Returns:
+        tuple: (documents read from MongoDB, documents in the snapshot).
+    """
+    frames = []
+    read = 0
+    batch = []
+    for document in db[name].find({}).sort("_id", 1).batch_size(batch_size):
+        batch.append(document)
+        if len(batch) >= batch_size:
+            frames.append(to_frame(batch))
+            read += len(batch)
+            batch = []
+    if batch:
+        frames.append(to_frame(batch))
+        read += len(batch)
+    df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame({"_id": []})
+    # A column can be typed differently in two batches; store such columns as strings.
+    df = stringify_mixed_columns(df)
+    temporary_path = path + ".tmp"
+    df.to_parquet(temporary_path, index=False)
+    os.replace(temporary_path, path)
+    return read, len(df)
+
+
+def snapshot(db, snapshot_dir=cfg.SNAPSHOT_DIR, collections=SNAPSHOT_COLLECTIONS, incremental=False):
+    os.makedirs(snapshot_dir, exist_ok=True)
+    manifest_path = os.path.join(snapshot_dir, "manifest.json")
+    previous_manifest = {"collections": {}}
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as file:
+            previous_manifest = json.load(file)
+    version = previous_manifest.get("version", 0) + 1
+    manifest = {"created_at": time.time(), "incremental": incremental, "version": version,
+                "collections": dict(previous_manifest["collections"])}
+    rewritten = 0
+    for name in collections:
+        started = time.perf_counter()
+        # Taken before reading: a change made during the read is picked up by the next run.
+        content_hash = collection_hash(db, name)
+        previous = previous_manifest["collections"].get(name, {})
+        if (incremental and content_hash is not None and previous.get("hash") == content_hash
+                and os.path.exists(os.path.join(snapshot_dir, collection_file(name, previous)))):
+            print(f"{name}: unchanged, {previous['documents']} in snapshot")
+            continue
+        file_name = f"{name}.v{version}.parquet"
+        read, total = snapshot_collection(db, name, os.path.join(snapshot_dir, file_name))
+        rewritten += 1
+        manifest["collections"][name] = {"documents": total, "hash": content_hash, "file": file_name}
+        print(f"{name}: {read} documents read, {total} in snapshot ({time.perf_counter() - started:.1f}s)")
+    if not rewritten and "created_at" in previous_manifest:
+        # Nothing changed: processes serving the snapshot need not reload it.
+        return previous_manifest
+    # Switches readers to the new files at once.
+    with open(manifest_path + ".tmp", "w") as file:
+        json.dump(manifest, file, indent=2)
+    os.replace(manifest_path + ".tmp", manifest_path)
+    remove_unused_files(snapshot_dir, [manifest, previous_manifest])
+    return manifest
+
+
+def remove_unused_files(snapshot_dir, manifests):
+    in_use = {collection_file(name, info) for manifest in manifests
+              for name, info in manifest["collections"].items()}
+    for file_name in os.listdir(snapshot_dir):
+        if file_name.endswith(".parquet") and file_name not in in_use:
+            os.remove(os.path.join(snapshot_dir, file_name))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Snapshot the MongoDB collections to Parquet")
+    parser.add_argument("--output", default=cfg.SNAPSHOT_DIR)
+    parser.add_argument("--collections", nargs="+", default=SNAPSHOT_COLLECTIONS)
+    parser.add_argument("--incremental", action="store_true")
+    args = parser.parse_args()
+
+    db = pymongo.MongoClient(cfg.MONGODB_URL)[cfg.DB_NAME]
+    snapshot(db, args.output, args.collections, args.incremental)
@@ -0,0 +1,121 @@
+import json
+
+# Incremental parser for the entity object streamed by the LLM, e.g.
+#   'Sure! {"JOB_TITLE": "Data Analyst", "LOCATION": "Lon'  ->  ("JOB_TITLE", "Data Analyst")
+# Text before the first "{" is skipped, like NamedEntityExtractor.filter_json does.
+# Values are emitted as soon as they are complete; nested objects or arrays are emitted
+# whole once their closing bracket arrives.
+
+WHITESPACE = " \t\r\n"
+
+
+class IncrementalObjectParser:
+    """
+    Parses the top-level JSON object of a text that arrives in chunks.
+
+    Call `feed(chunk)` with each piece of text; it returns the (key, value) pairs that
+    were completed by that chunk. `done` is True once the closing brace was read.
+    """
+
+    def __init__(self):
+        self.state = "before_object"
+        self.done = False
+        self.key = None
+        self.token = []
+        self.in_string = False
+        self.escaped = False
+        self.depth = 0
+
+    def feed(self, chunk):
+        pairs = []
+        for char in chunk:
+            if self.done:
+                break
+            pair = self._step(char)
+            if pair is not None:
+                pairs.append(pair)
+        return pairs
+
+    def _read_string(self, char):
+        # Collects a JSON string token (with its quotes); returns True at its closing quote.
+        self.token.append(char)
+        if self.escaped:
+            self.escaped = False
+        elif char == "\\":
+            self.escaped = True
+        elif char == '"':
+            return True
+        return False
+
+    def _finish_value(self):
+        raw = "".join(self.token).strip()
+        self.token = []
+        key, self.key = self.key, None
+        self.state = "after_value"
+        return key, json.loads(raw)
+
+    def _step(self, char):
+        state = self.state
+        if state == "before_object":
+            if char == "{":
+                self.state = "before_key"
+        elif state == "before_key":
+            if char == '"':
+                self.token = ['"']
+                self.state = "key"
+            elif char == "}":
+                self.done = True
+        elif state == "key":
+            if self._read_string(char):
+                self.key = json.loads("".join(self.token))
+                self.token = []
+                self.state = "before_colon"
+        elif state == "before_colon":
+            if char == ":":
+                self.state = "before_value"
+        elif state == "before_value":
+            if char in WHITESPACE:
+                return None
+            self.token = []
+            if char == '"':
+                self.token.append(char)
+                self.state = "string_value"
+            elif char in "{[":
+                self.token.append(char)
+                self.depth = 1
+                self.state = "nested_value"
+            else:
+                self.token.append(char)
+                self.state = "scalar_value"
+        elif state == "string_value":
+            if self._read_string(char):
+                return self._finish_value()
+        elif state == "nested_value":
+            if self.in_string:
+                if self._read_string(char):
+                    self.in_string = False
+                return None
+            self.token.append(char)
+            if char == '"':
+                self.in_string = True
+            elif char in "{[":
+                self.depth += 1
+            elif char in "}]":
+                self.depth -= 1
+                if self.depth == 0:
+                    return self._finish_value()
+        elif state == "scalar_value":
+            if char in ",}" or char in WHITESPACE:
+                pair = self._finish_value()
+                if char == ",":
+                    self.state = "before_key"
+                elif char == "}":
+                    self.done = True
+                return pair
+            self.token.append(char)
+        elif state == "after_value":
+            if char == ",":
+                self.state = "before_key"
+            elif char == "}":
+                self.done = True
+        return None
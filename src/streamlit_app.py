@@ -1,24 +1,111 @@
-import json
+import math
 import requests
 import pandas as pd
 import streamlit as st
+import config as cfg
+from requests.adapters import HTTPAdapter
+
+# Results are fetched page by page (STREAMLIT_PAGE_SIZE rows) over one pooled HTTP
+# session, cached per (query, page) for STREAMLIT_CACHE_TTL seconds, and rendered with
+# st.dataframe, which only draws the visible rows. After the cache expires, a page is
+# revalidated with its ETag and only downloaded again if the result changed.
+
+COLUMNS_MEDIA_TYPE = "application/vnd.jobsearch.columns+json"
+VALIDATED_PAGES = 256
+
+
+class SearchError(Exception):
+    pass
 
 
 st.set_page_config(layout="wide")
 
+
+@st.cache_resource
+def get_session():
+    # One keep-alive connection pool for all reruns and users of this Streamlit server.
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers.update({"Accept": COLUMNS_MEDIA_TYPE, "Accept-Encoding": "br, gzip"})
+    return session
+
+
+@st.cache_resource
+def get_validated_pages():
+    # (query, offset, limit) -> (ETag, DataFrame, total rows) of the last page downloaded.
+    return {}
+
+
+def to_frame(payload):
+    # Ask for the column-oriented payload, which maps straight onto a DataFrame.
+    if "columns" in payload:
+        return pd.DataFrame(payload["data"], columns=payload["columns"])
+    return pd.DataFrame(payload)
+
+
+@st.cache_data(ttl=cfg.STREAMLIT_CACHE_TTL, show_spinner=False)
+def fetch_page(query, offset, limit):
+    """
+    Rows [offset, offset + limit) of the result of `query`, and the total number of rows.
+
+    Returns:
+        tuple: (DataFrame, total rows).
+
+    Raises:
+        SearchError: If the backend did not return a result. Errors are not cached.
+    """
+    key = (query, offset, limit)
+    validated = get_validated_pages()
+    headers = {}
+    if key in validated:
+        headers["If-None-Match"] = validated[key][0]
+    try:
+        response = get_session().post(f"{cfg.SEARCH_API_URL}/search",
+                                      data={"query": query, "offset": offset, "limit": limit},
+                                      headers=headers, timeout=60)
+    except requests.RequestException as e:
+        raise SearchError(f"Failed to fetch results: {e}")
+    if response.status_code == 304 and key in validated:
+        _, df, total = validated[key]
+        return df, total
+    if response.status_code != 200:
+        raise SearchError(f"Failed to fetch results ({response.status_code})")
+    payload = response.json()
+    if isinstance(payload, dict) and "error" in payload:
+        raise SearchError(str(payload["error"]))
+    df = to_frame(payload)
+    total = int(response.headers.get("X-Total-Count", len(df)))
+    if "ETag" in response.headers:
+        validated[key] = (response.headers["ETag"], df, total)
+        while len(validated) > VALIDATED_PAGES:
+            validated.pop(next(iter(validated)))
+    return df, total
+
+
 # Render the Streamlit UI
 if __name__ == "__main__":
     st.write("# Job Search Engine")
     query = st.text_input("Enter your query")
     if st.button("Search"):
-        response = requests.post("http://127.0.0.1:8000/search", data={"query": query})
-        if response.status_code == 200:
-            prediction_result = response.json()
-            df = pd.DataFrame(json.loads(prediction_result))
+        st.session_state["query"] = query
+        st.session_state["page"] = 1
+    if st.session_state.get("query"):
+        page_size = cfg.STREAMLIT_PAGE_SIZE
+        page = st.session_state.get("page", 1)
+        try:
+            with st.spinner("Searching..."):
+                df, total = fetch_page(st.session_state["query"], (page - 1) * page_size, page_size)
+        except SearchError as e:
+            st.write(f"Error: {e}")
+        else:
             if len(df.columns) > 1:
                 st.write("Entities found:")
             else:
                 st.write("Recommended Queries")
-            st.table(df)
-        else:
-            st.write("Error: Failed to fetch results")
+            pages = max(1, math.ceil(total / page_size))
+            if pages > 1:
+                st.number_input(f"Page (of {pages}, {total} rows)", min_value=1, max_value=pages, step=1,
+                                key="page")
+            st.dataframe(df, use_container_width=True, hide_index=True)
@@ -0,0 +1,199 @@
+import random
+import zlib
+import datetime
+import numpy as np
+import config as cfg
+from numeric import with_shadow_fields
+from tracing import stage
+
+# Local stand-ins for the external services, used by the benchmark and load test:
+# synthetic documents for the six collections and jobsearch_vectordb, a hashing
+# encoder in place of the sentence transformer, and a timing wrapper for databases
+# (e.g. mongomock) that do not emit pymongo command events.
+
+JOB_TITLES = ["Data Scientist", "Data Analyst", "ML Engineer", "Software Engineer", "Manager", "Senior Manager",
+              "Consultant", "Senior Consultant", "Associate", "Director", "Partner", "Analyst"]
+LOCATIONS = {"London": "uk", "Manchester": "uk", "Paris": "europe", "Berlin": "europe", "Dubai": "middle east",
+             "Singapore": "apac", "Sydney": "apac", "New York": "north america", "Toronto": "north america",
+             "Bangalore": "india", "Mexico City": "central america", "Sao Paulo": "south america",
+             "Seoul": "south korea", "Jakarta": "asean", "Stockholm": "nordics", "Lagos": "africa"}
+CURRENCIES = ["USD", "GBP", "EUR", "INR", "AED", "SGD", "AUD", "CAD"]
+CLIENT_TYPES = ['Financial Advisory', 'Technology/IT', 'Operations', 'Other', 'Boutique', 'MBB', 'Tier 1', 'Big 4',
+                'Industry Client', 'Office', 'Strategy', 'Tier 2', 'Sales', 'HR Consulting', 'Tier 3']
+SKILLS = ['E-commerce', 'Gaming', 'Engineering', 'Finance', 'Real Estate', 'Recruitment', 'Consulting', 'Technology',
+          'Energy', 'Software Development', 'Insurance', 'Retail', 'Healthcare', 'Investment']
+BENEFITS = ["Vacation Tour", "Paid Time Off", "Travelling Allowances", "Medical Insurance", "Free snacks",
+            "Remote work Options", "Car Fuel Incentives", "Health Insurance", "client retention bonus",
+            "performance bonus"]
+CLIENT_NAMES = ["Google", "Microsoft", "Amazon", "Fusemachines", "Deloitte", "KPMG", "McKinsey", "Accenture",
+                "Barclays", "HSBC", "Siemens", "Unilever"]
+
+SAMPLE_QUERIES = [
+    "Data Scientist in UK",
+    "What is the salary of ML Engineer in USD?",
+    "highest salary of Manager in London",
+    "Show me the list of companies in Technology/IT sector",
+    "What is the salary range of Consultant in Paris?",
+    "bonus of Senior Manager in europe",
+    "highest bonus for Manager",
+    "Health Insurance benefits for Analyst in Dubai",
+    "Job Titles in Singapore",
+    "salary greater than 50K for Data Analyst",
+]
+
+
+class SyntheticDataGenerator:
+    """
+    Generates reproducible documents shaped like the TalentMetrics collections.
+    """
+
+    def __init__(self, seed=0):
+        self.random = random.Random(seed)
+        self.start_date = datetime.datetime(2020, 1, 1)
+
+    def location(self):
+        name = self.random.choice(list(LOCATIONS))
+        return {"name": name, "locationgroup": {"name": LOCATIONS[name]}}
+
+    def date(self):
+        return self.start_date + datetime.timedelta(days=self.random.randrange(1200))
+
+    def document(self, table_name):
+        r = self.random
+        client = {"name": r.choice(CLIENT_NAMES)}
+        currency = {"code": r.choice(CURRENCIES)}
+        jobgrade = {"name": r.choice(JOB_TITLES)}
+        if table_name == "clients":
+            return {"name": client["name"], "location": self.location(),
+                    "clienttype": {"name": r.choice(CLIENT_TYPES)}, "currency": currency}
+        if table_name == "jobtitles":
+            return {"client": client, "job_title": r.choice(JOB_TITLES), "jobgrade": jobgrade,
+                    "location": self.location(), "date": self.date()}
+        if table_name == "salarybonus":
+            return {"client": client, "jobgrade": jobgrade, "location": self.location(), "currency": currency,
+                    "paidbonus_percentage": r.randrange(0, 40), "date": self.date()}
+        if table_name == "benefits":
+            return {"name": r.choice(BENEFITS), "location": self.location(), "client": client, "jobgrade": jobgrade,
+                    "value": r.randrange(1000, 30000, 500), "currency": currency, "date": self.date()}
+        if table_name == "jobentries":
+            return {"client": client["name"], "jobTitle": r.choice(JOB_TITLES), "jobgrade": jobgrade,
+                    "location": self.location(), "salary": r.randrange(20000, 250000, 1000), "currency": currency,
+                    "date": self.date()}
+        if table_name == "candidates":
+            salary_from = r.randrange(20000, 200000, 1000)
+            return {"client": client, "jobTitle": r.choice(JOB_TITLES), "skill_code": r.choice(SKILLS),
+                    "location": self.location(), "salary_from": salary_from,
+                    "salary_to": salary_from + r.randrange(5000, 50000, 1000), "currency": currency,
+                    "date": self.date()}
+        raise ValueError(f"Unknown table: {table_name}")
+
+    def vectordb_document(self, faiss_index_id):
+        r = self.random
+        salary_from = r.randrange(20000, 200000, 1000)
+        location = r.choice(list(LOCATIONS))
+        return {"faiss_index_id": faiss_index_id, "Client_Name": r.choice(CLIENT_NAMES),
+                "Client_Location": location, "Candidate_Location": location,
+                "Client_Type": r.choice(CLIENT_TYPES), "Currency": r.choice(CURRENCIES),
+                "Client_Job_Title": r.choice(JOB_TITLES), "Our_Job_Title": r.choice(JOB_TITLES),
+                "Skill": r.choice(SKILLS), "Annual_Salary": r.randrange(20000, 250000, 1000),
+                "Salary_From": salary_from, "Salary_To": salary_from + 10000,
+                "Benefit_Name": r.choice(BENEFITS), "Value": r.randrange(1000, 30000, 500),
+                "Paid_Bonus": r.randrange(0, 40), "Date": self.date()}
+
+    def seed_database(self, db, total_documents, vectordb_size=None, chunk_size=10000):
+        """
+        Insert `total_documents` documents spread evenly over the six collections,
+        plus `vectordb_size` rows in jobsearch_vectordb (defaults to one sixth of the total).
+        """
+        per_table = max(1, total_documents // len(cfg.table_views))
+        for table_name in cfg.table_views:
+            db[table_name].drop()
+            for start in range(0, per_table, chunk_size):
+                count = min(chunk_size, per_table - start)
+                db[table_name].insert_many([with_shadow_fields(table_name, self.document(table_name))
+                                            for _ in range(count)])
+        vectordb_size = vectordb_size or per_table
+        db["jobsearch_vectordb"].drop()
+        for start in range(0, vectordb_size, chunk_size):
+            count = min(chunk_size, vectordb_size - start)
+            db["jobsearch_vectordb"].insert_many([self.vectordb_document(i) for i in range(start, start + count)])
+        return vectordb_size
+
+
+class HashingEncoder:
+    """
+    A deterministic, model-free stand-in for SentenceTransformer.encode.
+
+    Each token is hashed to a fixed random direction, and the query vector is the
+    normalised sum of its token vectors, so queries sharing words end up close.
+    """
+
+    def __init__(self, dimension=768):
+        self.dimension = dimension
+        self._token_vectors = {}
+
+    def token_vector(self, token):
+        vector = self._token_vectors.get(token)
+        if vector is None:
+            rng = np.random.default_rng(zlib.crc32(token.encode()))
+            vector = self._token_vectors[token] = rng.standard_normal(self.dimension).astype('float32')
+        return vector
+
+    def encode(self, sentences, batch_size=32, **kwargs):
+        single = isinstance(sentences, str)
+        sentences = [sentences] if single else list(sentences)
+        vectors = np.zeros((len(sentences), self.dimension), dtype='float32')
+        for i, sentence in enumerate(sentences):
+            for token in sentence.lower().split():
+                vectors[i] += self.token_vector(token)
+            norm = np.linalg.norm(vectors[i])
+            if norm > 0:
+                vectors[i] /= norm
+        return vectors[0] if single else vectors
+
+    def get_sentence_embedding_dimension(self):
+        return self.dimension
+
+
+def build_synthetic_index(size, dimension=768, seed=0):
+    """
+    Build a flat FAISS index of `size` random unit vectors.
+    """
+    import faiss
+    rng = np.random.default_rng(seed)
+    vectors = rng.standard_normal((size, dimension)).astype('float32')
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    index = faiss.IndexFlatL2(dimension)
+    index.add(vectors)
+    return index
+
+
+class TimedCollection:
+    """
+    Wraps a collection so `count_documents` and `find` are recorded as mongo.* stages.
+    """
+
+    def __init__(self, collection):
+        self._collection = collection
+
+    def count_documents(self, *args, **kwargs):
+        with stage("mongo.count_documents"):
+            return self._collection.count_documents(*args, **kwargs)
+
+    def find(self, *args, **kwargs):
+        with stage("mongo.find"):
+            return self._collection.find(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._collection, name)
+
+
+class TimedDatabase:
+    def __init__(self, db):
+        self._db = db
+
+    def __getitem__(self, name):
+        return TimedCollection(self._db[name])
+
+    def __getattr__(self, name):
+        return getattr(self._db, name)
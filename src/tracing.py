@@ -0,0 +1,195 @@
+import time
+import threading
+import tracemalloc
+import contextvars
+from contextlib import contextmanager
+
+# Request-scoped stage timings plus process-wide Prometheus-style histograms.
+#
+#     trace = start_trace()
+#     with stage("ner"):
+#         ...
+#     trace.server_timing()   # "ner;dur=812.3, mongo.find;dur=41.0"
+#     render_metrics()        # Prometheus text exposition format
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Histogram:
+    """
+    A thread-safe cumulative histogram with a fixed set of bucket upper bounds.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        with self._lock:
+            self.count += 1
+            self.sum += value
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self.counts[i] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return list(self.counts), self.count, self.sum
+
+
+class MetricsRegistry:
+    """
+    Holds labelled histograms and counters and renders them for Prometheus.
+    """
+
+    def __init__(self):
+        self.histograms = {}
+        self.counters = {}
+        self.help = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name, value, help_text="", **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+                self.help.setdefault(name, help_text)
+        histogram.observe(value)
+
+    def inc(self, name, value=1, help_text="", **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+            self.help.setdefault(name, help_text)
+
+    @staticmethod
+    def format_labels(labels, extra=()):
+        pairs = list(labels) + list(extra)
+        if not pairs:
+            return ""
+        return "{" + ",".join('{}="{}"'.format(k, str(v).replace('"', '\\"')) for k, v in pairs) + "}"
+
+    def render(self):
+        lines = []
+        with self._lock:
+            histograms = sorted(self.histograms.items())
+            counters = sorted(self.counters.items())
+        seen = set()
+        for (name, labels), value in counters:
+            if name not in seen:
+                seen.add(name)
+                lines.append(f"# HELP {name} {self.help.get(name, '')}")
+                lines.append(f"# TYPE {name} counter")
+            lines.append(f"{name}{self.format_labels(labels)} {value}")
+        for (name, labels), histogram in histograms:
+            if name not in seen:
+                seen.add(name)
+                lines.append(f"# HELP {name} {self.help.get(name, '')}")
+                lines.append(f"# TYPE {name} histogram")
+            counts, count, total = histogram.snapshot()
+            for bound, bucket_count in zip(histogram.buckets, counts):
+                lines.append(f"{name}_bucket{self.format_labels(labels, [('le', bound)])} {bucket_count}")
+            lines.append(f"{name}_bucket{self.format_labels(labels, [('le', '+Inf')])} {count}")
+            lines.append(f"{name}_sum{self.format_labels(labels)} {total}")
+            lines.append(f"{name}_count{self.format_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+
+class Trace:
+    """
+    The stage timings of a single request.
+
+    Attributes:
+        stages: A list of (stage name, seconds) tuples in completion order.
+        memory_peaks: Peak traced allocation per stage in bytes, filled when `track_memory`
+            is set and tracemalloc is running. Nested stages reset the peak of the outer one,
+            so only leaf stages are exact.
+        notes: Other request details by kind, e.g. the query plans run (see `note`).
+    """
+
+    def __init__(self, track_memory=False):
+        self.started = time.perf_counter()
+        self.stages = []
+        self.track_memory = track_memory
+        self.memory_peaks = {}
+        self.notes = {}
+        self._lock = threading.Lock()
+
+    def add(self, name, seconds):
+        with self._lock:
+            self.stages.append((name, seconds))
+
+    def add_memory(self, name, peak_bytes):
+        with self._lock:
+            self.memory_peaks[name] = max(self.memory_peaks.get(name, 0), peak_bytes)
+
+    def note(self, kind, value):
+        with self._lock:
+            self.notes.setdefault(kind, []).append(value)
+
+    def totals(self):
+        totals = {}
+        with self._lock:
+            for name, seconds in self.stages:
+                totals[name] = totals.get(name, 0.0) + seconds
+        return totals
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def server_timing(self):
+        """
+        Format the per-stage totals as a `Server-Timing` header value (milliseconds).
+        """
+        entries = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.totals().items()]
+        entries.append(f"total;dur={self.elapsed() * 1000:.1f}")
+        return ", ".join(entries)
+
+
+metrics = MetricsRegistry()
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+
+
+def start_trace(track_memory=False):
+    trace = Trace(track_memory)
+    _current_trace.set(trace)
+    return trace
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+def record(name, seconds):
+    """
+    Record a stage duration in the stage histogram and the current request trace.
+    """
+    metrics.observe("search_stage_seconds", seconds, "Latency of each search pipeline stage", stage=name)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add(name, seconds)
+
+
+@contextmanager
+def stage(name):
+    trace = _current_trace.get()
+    track_memory = trace is not None and trace.track_memory and tracemalloc.is_tracing()
+    if track_memory:
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - started)
+        if track_memory:
+            trace.add_memory(name, tracemalloc.get_traced_memory()[1] - baseline)
+
+
+def render_metrics():
+    return metrics.render()
+
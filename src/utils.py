@@ -1,29 +1,27 @@
-import os
 import itertools
-import pandas as pd
 import config as cfg
+from lazy_imports import lazy_import
+from tracing import metrics, stage
+from query_history import QueryHistoryWriter
+from rule_based_ner import DEGRADED_KEY
 
-def store_queries(query, ner_response):
+pd = lazy_import("pandas")
+history_writer = QueryHistoryWriter()
+
+def store_queries(query, ner_response, source=None):
     """
-    Store a query in a text file.
+    Queue a query and its entities for the background history writer.
 
     Args:
         query (str): The query to store.
+        ner_response (dict): The entities extracted from the query.
+        source (str, optional): Where the entities came from, see NamedEntityExtractor.source_of.
 
     Returns:
         None
 
     """
-    work_dir = os.getcwd()
-    path_to_history = os.path.join(os.path.dirname(work_dir), 'history')
-    if not os.path.exists(path_to_history):
-        os.mkdir(path_to_history)
-    file = open(os.path.join(path_to_history, 'query.txt'), "a")
-    file.write(query)
-    file.write("->")
-    file.write(str(ner_response))
-    file.write("\n")
-    file.close()
+    history_writer.submit(query, ner_response, source)
 
 def process_date_column(df):
 
@@ -51,6 +49,9 @@ def apply_filter_conditions(df, filter_conditions, column_map_dict):
     for filter_key, filter_value in filter_conditions.items():
         column = column_map_dict.get(filter_key) 
         if column is not None:
+            if isinstance(filter_value, (int, float)):  # Amounts are matched as parsed numbers
+                filter_mask &= pd.to_numeric(df[column], errors='coerce') == filter_value
+                continue
             if filter_value.isdigit():  # Check if filter_value contains a numeric value
                 filter_value = int(filter_value)  # Convert filter_value to integer
             else:
@@ -59,6 +60,22 @@ def apply_filter_conditions(df, filter_conditions, column_map_dict):
     filtered_df = df[filter_mask]
     return filtered_df
 
+# process_query's routing, in priority order: the first table whose keys occur wins.
+ROUTES = [("jobentries", ("SALARY", "SALARY_AMOUNT")),
+          ("candidates", ("SALARY_RANGE",)),
+          ("salarybonus", ("BONUS", "BONUS_PERCENT")),
+          ("benefits", ("BENEFITS", "BENEFITS_NAME")),
+          ("jobtitles", ("JOB", "JOB_TITLE")),
+          ("clients", ())]
+
+
+def route_table(ner_response):
+    for table_name, keys in ROUTES:
+        if any(key in ner_response for key in keys):
+            return table_name
+    return "clients"
+
+
 def process_query(ner_response, query_handler):
 
     table_name = ""
@@ -87,6 +104,46 @@ def process_query(ner_response, query_handler):
     return df, exact_match, flag_not_found, table_name
 
 
+def build_recommended_queries(query, other_options):
+    """
+    Build alternative queries by substituting every combination of the recommended options.
+
+    Args:
+        query (str): The original query string.
+        other_options (dict): Maps each value in the query to the options that may replace it.
+
+    Returns:
+        pandas.DataFrame: A single "recommendations" column with the rewritten queries.
+    """
+    questions = {"recommendations": []}
+    keys = other_options.keys()
+    for combo in itertools.product(*[other_options[key] for key in keys]):
+        updated_query = query
+        for key, value in zip(keys, combo):
+            updated_query = updated_query.replace(str(key), str(value))
+        questions['recommendations'].append(updated_query)
+    return pd.DataFrame(questions)
+
+
+def respond_degraded(ner_response, search_recommender, query_handler):
+    """
+    Answer a query whose words the rule based fallback could not all classify.
+
+    Querying the routed table with the keyword entities alone would return rows unfiltered
+    by the job title, location or client the query names; the postings most similar to the
+    whole query text are returned instead, in the routed table's columns.
+    """
+    metrics.inc("degraded_recommendations_total", help_text="Degraded NER responses answered by FAISS alone")
+    table_name = route_table(ner_response)
+    recommended_ids = search_recommender.recommend_faiss_index(ner_response["query"])
+    recommended_df = query_handler.get_recommendation_df(recommended_ids)
+    query_handler.close_connection()
+    recommended_df = recommended_df[cfg.table_views[table_name]]
+    if 'Date' in recommended_df.columns:
+        recommended_df = process_date_column(recommended_df)
+    return recommended_df
+
+
 def respond_query(ner_response, search_recommender, query_handler):
     """
     Process the query based on the ner_response and perform database operations using the provided query_handler
@@ -99,13 +156,26 @@ def respond_query(ner_response, search_recommender, query_handler):
         query_handler (DBQueryHandler): An instance of the DBQueryHandler class.
 
     Returns:
-      result (json/string): The result of the query processing, either as a JSON-formatted string or an error message.
+      result (pandas.DataFrame/dict): The result table (matching rows, or a single "recommendations" column of
+      suggested queries), or an error message dictionary. Serialization is left to the caller (see serializers.py).
 
     """
     query = ner_response["query"]
+    if DEGRADED_KEY in ner_response:
+        if ner_response[DEGRADED_KEY]:
+            return respond_degraded(ner_response, search_recommender, query_handler)
+        ner_response = {key: value for key, value in ner_response.items() if key != DEGRADED_KEY}
     if len(ner_response) > 1:
         df, exact_match, flag_not_found, table_name = process_query(ner_response, query_handler)
         if len(flag_not_found) > 0:
+            linked = query_handler.link_entities(table_name, flag_not_found)
+            if linked and len(linked) == len(flag_not_found):
+                # Every unmatched value has canonical suggestions: no posting search needed.
+                query_handler.close_connection()
+                other_options = {flag_not_found[entity]: options for entity, options in linked.items()}
+                with stage("recommendation"):
+                    final_df = build_recommended_queries(query, other_options)
+                return final_df
             recommended_ids = search_recommender.recommend_faiss_index(query)
             recommended_df = query_handler.get_recommendation_df(recommended_ids)
             recommended_df = apply_filter_conditions(df=recommended_df, filter_conditions=exact_match, column_map_dict=cfg.column_map_dict[table_name])
@@ -115,7 +185,6 @@ def respond_query(ner_response, search_recommender, query_handler):
                     recommended_df = process_date_column(recommended_df)
                 recommended_df = recommended_df[cfg.table_views[table_name]]
                 flag_not_found = {cfg.column_map_dict[table_name][key]: value for key, value in flag_not_found.items() if key in cfg.column_map_dict[table_name]}
-                questions = {"recommendations": []}
                 other_options = {}
                 for flag_key in flag_not_found.keys():
                     options = list(recommended_df[flag_key].unique())
@@ -130,15 +199,11 @@ def respond_query(ner_response, search_recommender, query_handler):
                     #     other_options[ner_response["SALARY_AMOUNT"]]
                     else:
                         other_options[flag_not_found[flag_key]] = options
-                keys = other_options.keys()
-                for combo in itertools.product(*[other_options[key] for key in keys]):
-                    updated_query = query
-                    for key, value in zip(keys, combo):
-                        updated_query = updated_query.replace(str(key), str(value))
-                    questions['recommendations'].append(updated_query)
-                
-                final_df = pd.DataFrame(questions)
-                return final_df.to_json(orient='records')
+                for entity, options in linked.items():
+                    other_options[ner_response[entity]] = options
+                with stage("recommendation"):
+                    final_df = build_recommended_queries(query, other_options)
+                return final_df
 
             else:
                 return {"error": "Recommendation Not Working"}
@@ -147,7 +212,7 @@ def respond_query(ner_response, search_recommender, query_handler):
                 query_handler.close_connection()
                 if 'Date' in df.columns: 
                     df = process_date_column(df)
-                return df.to_json(orient="records")
+                return df
             else:
                 recommended_ids = search_recommender.recommend_faiss_index(query)
                 recommended_df = query_handler.get_recommendation_df(recommended_ids)
@@ -156,22 +221,16 @@ def respond_query(ner_response, search_recommender, query_handler):
                     recommended_df = process_date_column(recommended_df)
                 query_handler.close_connection()
                 exact_match = {cfg.column_map_dict[table_name][key]: value for key, value in exact_match.items() if key in cfg.column_map_dict[table_name]}
-                questions = {"recommendations": []}
                 other_options = {}
                 for flag_key in exact_match.keys():
                     options = list(recommended_df[flag_key].unique())
                     other_options[exact_match[flag_key]] = options
-                keys = other_options.keys()
-                for combo in itertools.product(*[other_options[key] for key in keys]):
-                    updated_query = query
-                    for key, value in zip(keys, combo):
-                        updated_query = updated_query.replace(str(key), str(value))
-                    questions['recommendations'].append(updated_query)
-                final_df = pd.DataFrame(questions)
-                return final_df.to_json(orient='records')
+                with stage("recommendation"):
+                    final_df = build_recommended_queries(query, other_options)
+                return final_df
     else:
         output = {"results": ["No entities found"]}
         final_df = pd.DataFrame(output)
-        return final_df.to_json(orient='records')
+        return final_df
 
 
@@ -0,0 +1,78 @@
+import os
+import pickle
+import threading
+import pytest
+import entity_prefetch
+from faiss_search_recommender import SearchRecommender
+from fake_llm_server import make_server
+from llm_client import LLMClient
+from synthetic_data import HashingEncoder, build_synthetic_index
+
+# prefork_server.py warms the caches in the master, whose batcher and executor threads do
+# not survive os.fork; the workers must still be able to use them.
+
+pytestmark = pytest.mark.skipif(not hasattr(os, "fork"), reason="needs os.fork")
+
+
+def in_forked_child(function, timeout=10.0):
+    """
+    Run `function` in a forked child and return its result, or raise if it failed or hung.
+    """
+    read_end, write_end = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_end)
+        outcome = {}
+
+        def run():
+            try:
+                outcome["payload"] = ("ok", function())
+            except BaseException as e:
+                outcome["payload"] = ("error", repr(e))
+
+        worker = threading.Thread(target=run, daemon=True)
+        worker.start()
+        worker.join(timeout)
+        payload = outcome.get("payload", ("hung", f"no result after {timeout}s"))
+        with os.fdopen(write_end, "wb") as file:
+            pickle.dump(payload, file)
+        os._exit(0)
+    os.close(write_end)
+    with os.fdopen(read_end, "rb") as file:
+        status, result = pickle.load(file)
+    os.waitpid(pid, 0)
+    assert status == "ok", result
+    return result
+
+
+def test_recommender_batcher_works_after_fork():
+    recommender = SearchRecommender("hashing", None, model=HashingEncoder(), index=build_synthetic_index(100),
+                                    batch_window=0.01)
+    # Starts the batcher thread in the parent.
+    assert recommender.recommend_faiss_index("data scientist")
+    assert in_forked_child(lambda: recommender.recommend_faiss_index("manager"))
+
+
+def test_llm_client_executor_works_after_fork():
+    server = make_server(port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        client = LLMClient(api_base=f"http://127.0.0.1:{server.server_address[1]}/v1", api_key="local",
+                           hedge_delay=0, deadline=5.0)
+        messages = [{"role": "user", "content": "salary in London"}]
+        # Starts executor threads in the parent.
+        assert client.complete(messages)
+        assert in_forked_child(lambda: bool(client.complete(messages)))
+    finally:
+        server.shutdown()
+
+
+def test_prefetch_executor_is_per_process():
+    parent_executor = entity_prefetch.prefetch_executor()
+    assert parent_executor.submit(lambda: 1).result() == 1
+
+    def child():
+        executor = entity_prefetch.prefetch_executor()
+        return executor is not parent_executor and executor.submit(lambda: 42).result(timeout=5) == 42
+
+    assert in_forked_child(child)
@@ -0,0 +1,132 @@
+import threading
+import time
+import pytest
+from fake_llm_server import make_server
+from llm_client import CircuitBreaker, CircuitOpenError, LLMClient, LLMError
+
+MESSAGES = [{"role": "user", "content": "salary of Manager in London"}]
+
+
+@pytest.fixture
+def server():
+    server = make_server(port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+
+
+def api_base(server):
+    return f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+
+def test_complete_against_fake_server(server):
+    client = LLMClient(api_base=api_base(server), api_key="local", hedge_delay=0)
+    completion = client.complete(MESSAGES)
+    assert completion["choices"][0]["message"]["content"]
+    assert client.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_deadline_bounds_retries():
+    calls = []
+
+    def slow_call(messages, params, timeout, parse):
+        calls.append(timeout)
+        time.sleep(timeout)
+        raise TimeoutError("no answer")
+
+    client = LLMClient(api_key="local", request_timeout=0.2, deadline=0.5, max_retries=10,
+                       backoff_base=0.01, backoff_max=0.01, hedge_delay=0)
+    client._call = slow_call
+    started = time.monotonic()
+    with pytest.raises(LLMError):
+        client.complete(MESSAGES)
+    assert time.monotonic() - started < 0.9
+    assert 1 < len(calls) < 10
+    # Later attempts only get what is left of the deadline.
+    assert calls[-1] <= 0.2
+
+
+def test_hedged_request_answers_slow_attempt():
+    calls = []
+    lock = threading.Lock()
+
+    def call(messages, params, timeout, parse):
+        with lock:
+            calls.append(time.monotonic())
+            first = len(calls) == 1
+        time.sleep(1.0 if first else 0.01)
+        return "slow" if first else "hedge"
+
+    client = LLMClient(api_key="local", request_timeout=2.0, deadline=3.0, hedge_delay=0.05)
+    client._call = call
+    started = time.monotonic()
+    assert client.complete(MESSAGES) == "hedge"
+    assert time.monotonic() - started < 0.5
+    assert len(calls) == 2
+
+
+def test_no_hedge_for_fast_attempt():
+    calls = []
+
+    def call(messages, params, timeout, parse):
+        calls.append(timeout)
+        return "fast"
+
+    client = LLMClient(api_key="local", hedge_delay=0.2)
+    client._call = call
+    assert client.complete(MESSAGES) == "fast"
+    assert len(calls) == 1
+
+
+def test_breaker_half_open_lets_one_trial_through():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.1)
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+    time.sleep(0.12)
+    assert breaker.allow()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    # Only the one trial while it is outstanding.
+    assert not breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+    time.sleep(0.12)
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow()
+
+
+def test_breaker_retries_trial_that_never_reports():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.1)
+    breaker.record_failure()
+    time.sleep(0.12)
+    assert breaker.allow()
+    assert not breaker.allow()
+    time.sleep(0.12)
+    assert breaker.allow()
+
+
+def test_open_breaker_rejects_without_calling():
+    calls = []
+    client = LLMClient(api_key="local", breaker=CircuitBreaker(failure_threshold=1, reset_timeout=60))
+    client._call = lambda *args: calls.append(args)
+    client.breaker.record_failure()
+    with pytest.raises(CircuitOpenError):
+        client.complete(MESSAGES)
+    assert not calls
+
+
+def test_abandoned_stream_reopens_half_open_breaker(server):
+    client = LLMClient(api_base=api_base(server), api_key="local",
+                       breaker=CircuitBreaker(failure_threshold=1, reset_timeout=0.1))
+    client.breaker.record_failure()
+    time.sleep(0.12)
+    stream = client.stream(MESSAGES)
+    assert next(stream)
+    assert client.breaker.state == CircuitBreaker.HALF_OPEN
+    stream.close()
+    assert client.breaker.state == CircuitBreaker.OPEN
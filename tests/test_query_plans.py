@@ -0,0 +1,74 @@
+import itertools
+import random
+import mongomock
+import pytest
+from dbquery_handler import DBQueryHandler
+from legacy_dbquery_handler import DBQueryHandler as LegacyDBQueryHandler
+from synthetic_data import (BENEFITS, CLIENT_NAMES, CLIENT_TYPES, CURRENCIES, JOB_TITLES, LOCATIONS, SKILLS,
+                            SyntheticDataGenerator)
+
+# The query plans must answer every entity combination like the if/elif chains they
+# replaced, apart from the two documented changes: BENEFITS_AMOUNT is reported as a parsed
+# number, and an exact bonus percentage combined with a range no longer raises TypeError.
+
+TEXT_VALUES = {
+    "CLIENT_NAME": CLIENT_NAMES[:3] + ["Initech"],
+    "CLIENT_TYPE": CLIENT_TYPES[:3] + ["Nonexistent Type"],
+    "LOCATION": list(LOCATIONS)[:3] + ["Atlantis"],
+    "LOCATION_GROUP": sorted(set(LOCATIONS.values()))[:3] + ["antarctica"],
+    "JOB_TITLE": JOB_TITLES[:3] + ["Astronaut"],
+    "CURRENCY": CURRENCIES[:3] + ["XYZ"],
+    "SKILLS": SKILLS[:3] + ["Juggling"],
+    "BENEFITS_NAME": BENEFITS[:3] + ["Free Unicorn"],
+}
+AMOUNT_VALUES = {
+    "SALARY_AMOUNT": ["120000", "50K", "1"],
+    "BONUS_PERCENT": ["12%", "15", "99"],
+    "AMOUNT_FROM": ["50K", "30", "10"],
+    "AMOUNT_TO": ["150K", "20", "5000"],
+}
+SUPERLATIVES = [{}, {"MAX_MONEY_ATTRIBUTES": "highest"}, {"MIN_MONEY_ATTRIBUTES": "lowest"}]
+
+HANDLERS = {
+    "clients": ("get_clients_table", ["CLIENT_NAME", "CLIENT_TYPE", "LOCATION", "LOCATION_GROUP", "CURRENCY"]),
+    "jobtitles": ("get_jobtitles_table", ["CLIENT_NAME", "LOCATION", "LOCATION_GROUP", "JOB_TITLE"]),
+    "jobentries": ("get_jobentries_table", ["CLIENT_NAME", "LOCATION", "LOCATION_GROUP", "JOB_TITLE", "CURRENCY",
+                                            "SALARY_AMOUNT", "AMOUNT_FROM", "AMOUNT_TO"]),
+    "candidates": ("get_candidate_payscale", ["CLIENT_NAME", "JOB_TITLE", "SKILLS", "LOCATION", "LOCATION_GROUP",
+                                              "CURRENCY", "AMOUNT_FROM", "AMOUNT_TO"]),
+    "salarybonus": ("get_bonus_table", ["CLIENT_NAME", "LOCATION", "LOCATION_GROUP", "JOB_TITLE", "CURRENCY",
+                                        "BONUS_PERCENT", "AMOUNT_FROM", "AMOUNT_TO"]),
+    "benefits": ("get_benefits_table", ["BENEFITS_NAME", "CLIENT_NAME", "LOCATION", "LOCATION_GROUP", "JOB_TITLE",
+                                        "CURRENCY"]),
+}
+
+
+@pytest.fixture(scope="module")
+def db():
+    db = mongomock.MongoClient()["query_plans"]
+    SyntheticDataGenerator(seed=0).seed_database(db, 1200)
+    return db
+
+
+def entity_sets(keys, count, seed=0):
+    rng = random.Random(seed)
+    for _ in range(count):
+        chosen = rng.sample(keys, rng.randint(1, min(3, len(keys))))
+        if "BONUS_PERCENT" in chosen and ("AMOUNT_FROM" in chosen or "AMOUNT_TO" in chosen):
+            continue
+        entities = {key: rng.choice(TEXT_VALUES.get(key) or AMOUNT_VALUES[key]) for key in chosen}
+        yield {**entities, **rng.choice(SUPERLATIVES), "query": "test query"}
+
+
+@pytest.mark.parametrize("table_name", list(HANDLERS))
+def test_query_plans_match_legacy_handlers(db, table_name):
+    method, keys = HANDLERS[table_name]
+    handler = DBQueryHandler(client=db.client, db=db)
+    legacy = LegacyDBQueryHandler(client=db.client, db=db)
+    for entities in itertools.islice(entity_sets(keys, 80), 60):
+        df, exact_match, flag_not_found = getattr(handler, method)(dict(entities), table_name)
+        expected_df, expected_exact, expected_not_found = getattr(legacy, method)(dict(entities), table_name)
+        assert exact_match == expected_exact, entities
+        assert flag_not_found == expected_not_found, entities
+        assert list(df.columns) == list(expected_df.columns), entities
+        assert df.reset_index(drop=True).equals(expected_df.reset_index(drop=True)), entities
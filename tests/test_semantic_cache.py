@@ -0,0 +1,39 @@
+import pytest
+from semantic_cache import SemanticEntityCache
+from synthetic_data import HashingEncoder
+
+MANAGER = {"JOB_TITLE": "Manager", "SALARY": "salary"}
+
+
+@pytest.mark.parametrize("query, cached_query, entities", [
+    ("What is the salary of a Manager?", "manager salary", MANAGER),
+    ("salary for managers", "salary for managers", {"JOB_TITLE": "managers", "SALARY": "salary"}),
+    ("Manager salary in London", "salary of manager in london", {**MANAGER, "LOCATION": "London"}),
+    ("show me the salary of manager", "manager salary", MANAGER),
+])
+def test_paraphrases_are_consistent(query, cached_query, entities):
+    assert SemanticEntityCache.consistent(query, cached_query, entities)
+
+
+@pytest.mark.parametrize("query, cached_query, entities", [
+    # Added content words, whatever their case.
+    ("senior manager salary", "manager salary", MANAGER),
+    ("manager salary in london", "manager salary", MANAGER),
+    ("manager salary at Google", "manager salary", MANAGER),
+    # A cached value missing from the new query.
+    ("director salary", "manager salary", MANAGER),
+    # Different numbers or superlatives.
+    ("manager salary in 2023", "manager salary", MANAGER),
+    ("highest manager salary", "manager salary", MANAGER),
+    ("highest manager salary", "lowest manager salary", {**MANAGER, "MIN_MONEY_ATTRIBUTES": "lowest"}),
+])
+def test_added_or_changed_content_is_inconsistent(query, cached_query, entities):
+    assert not SemanticEntityCache.consistent(query, cached_query, entities)
+
+
+def test_lookup_applies_consistency_check():
+    cache = SemanticEntityCache(HashingEncoder(dimension=64), threshold=0.5)
+    cache.add("manager salary", MANAGER, cache.encode("manager salary"))
+    hit = cache.lookup("Manager salary", cache.encode("Manager salary"))
+    assert hit == {**MANAGER, "query": "Manager salary"}
+    assert cache.lookup("senior manager salary", cache.encode("senior manager salary")) is None